@@ -0,0 +1,173 @@
+import io
+import os
+import sys
+import hashlib
+from common import get_package_embedding_accumulators
+from identifiercache import IdentifierCache
+from embeddingcache import PackageEmbeddingCache
+from checkpointstore import CheckpointStore, get_projections_key
+from tolerantparsing import ParseReport
+from vocabularyvectors import FASTTEXT_MODEL_PATH, load_fasttext_model, get_model_file_id
+from sourceprovider import list_directory, get_source_root, close_sources
+from packageanalyzer import ProjectionBreakdown, find_all_projections_recursively, print_results, KEEP_PROJECTION_VALUES
+from packageorganizer import calculate_configured_pairwise_projections, recommend_hierarchy, write_recommendation
+
+# Paths to the FastText models to run every project with
+BATCH_MODELS = [FASTTEXT_MODEL_PATH]
+
+# The scripts to run every project with: "analyze" (packageanalyzer.py) and/or "organize" (packageorganizer.py)
+BATCH_COMMANDS = ["analyze", "organize"]
+
+"""
+Determine the id of a task of a batch run
+
+:param command: the script the task runs ("analyze" or "organize")
+:param project_path: the path to the root package of the project
+:param model_id: the id of the model the task runs with
+:param projection_threshold: the projection threshold (only used to organize)
+:returns: the id of the task
+"""
+def get_task_id(command, project_path, model_id, projection_threshold):
+  task_id = command + "\0" + os.path.abspath(project_path) + "\0" + model_id
+  if command == "organize":
+    task_id += "\0" + repr(projection_threshold)
+  return task_id
+
+"""
+Determine the path of the file the output of a task is written to
+
+:param results_path: the directory with the outputs of the tasks
+:param task_id: the id of the task as returned by `get_task_id`
+:param project_path: the path to the root package of the project
+:param command: the script the task runs
+:returns: the path to the file
+"""
+def get_result_path(results_path, task_id, project_path, command):
+  task_hash = hashlib.sha256(task_id.encode("utf-8", "surrogatepass")).hexdigest()[:12]
+  return os.path.join(results_path, os.path.basename(os.path.normpath(project_path)).replace("!", "").replace("@", "-") + "-" + task_hash + "." + command + ".txt")
+
+"""
+Analyze the structure of a project as packageanalyzer.py does
+
+:param root_path: the path to the root package of the project
+:param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: the IdentifierCache in which parsed identifiers are looked up and stored
+:param embedding_cache: the PackageEmbeddingCache in which package embeddings are looked up and stored
+:param parse_report: the ParseReport in which files that could not be parsed are recorded
+:returns: the results, as packageanalyzer.py prints them
+"""
+def analyze_project(root_path, model, identifier_cache, embedding_cache, parse_report):
+  breakdown = ProjectionBreakdown(keep_values=KEEP_PROJECTION_VALUES)
+  find_all_projections_recursively(root_path, breakdown, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache)
+  output_file = io.StringIO()
+  print_results(breakdown, output_file)
+  return output_file.getvalue()
+
+"""
+Recommend a package hierarchy for a project as packageorganizer.py does
+
+:param root_path: the path to the root package of the project
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: the IdentifierCache in which parsed identifiers are looked up and stored
+:param embedding_cache: the PackageEmbeddingCache in which package embeddings are looked up and stored
+:param parse_report: the ParseReport in which files that could not be parsed are recorded
+:param checkpoint_store: the CheckpointStore in which the projections between the packages are looked up and stored
+:returns: the recommended hierarchy, as packageorganizer.py outputs it
+"""
+def organize_project(root_path, projection_threshold, model, identifier_cache, embedding_cache, parse_report, checkpoint_store):
+  package_paths = [root_path + "/" + package for package in sorted(list_directory(root_path)[0])]
+  package_accumulators = get_package_embedding_accumulators(package_paths + [root_path], model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache)
+  package_embeddings = {}
+  for package_path in package_paths:
+    package_embedding = package_accumulators[package_path].mean()
+    if package_embedding is not None:
+      package_embeddings[package_path] = package_embedding
+  root_package_embedding = package_accumulators[root_path].mean()
+
+  projections_key = get_projections_key(embedding_cache.model_id, projection_threshold, root_path, package_embeddings, root_package_embedding)
+  pairwise_projections = checkpoint_store.get_projections(projections_key)
+  if pairwise_projections is None:
+    pairwise_projections = calculate_configured_pairwise_projections(package_embeddings, root_package_embedding, root_path, projection_threshold)
+    checkpoint_store.put_projections(projections_key, pairwise_projections)
+  is_contained_in, projection_values = recommend_hierarchy(pairwise_projections, package_embeddings, root_package_embedding, package_accumulators, root_path, projection_threshold)
+  output_file = io.StringIO()
+  write_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, root_package_embedding is not None, projection_threshold, output_file)
+  return output_file.getvalue()
+
+"""
+Run the analyzer and/or organizer on a list of projects with a list of models, checkpointing every completed stage
+
+The identifiers of every parsed file, the embedding of every package, the projections between the packages of every
+organized project and the output of every task are stored in the checkpoint directory as soon as they are computed. When
+a run is interrupted (or a project fails), running it again skips the completed tasks and only recomputes what was not
+stored yet. Like the identifiers and package embeddings, the output of a task in which a file could not be parsed cleanly is
+not stored, because problems such as timeouts depend on the machine; such a task is run again by the next run. The output
+of every task is written to a file in the results subdirectory.
+
+:param project_paths: the paths to the root packages of the projects (directories, source archives or git revisions)
+:param checkpoint_path: the directory to store the checkpoints and results in (created if it does not exist)
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:returns: a dictionary of task id to the path of the file with the output of the task, for the tasks that completed
+"""
+def run_batch(project_paths, checkpoint_path, projection_threshold):
+  results_path = os.path.join(checkpoint_path, "results")
+  os.makedirs(results_path, exist_ok=True)
+  result_paths = {}
+  with IdentifierCache(os.path.join(checkpoint_path, "identifiers.sqlite")) as identifier_cache, CheckpointStore(os.path.join(checkpoint_path, "checkpoints.sqlite")) as checkpoint_store:
+    for model_path in BATCH_MODELS:
+      model_id = get_model_file_id(model_path)
+      tasks = [(command, project_path, get_task_id(command, project_path, model_id, projection_threshold)) for project_path in project_paths for command in BATCH_COMMANDS]
+      pending_tasks = []
+      for command, project_path, task_id in tasks:
+        output = checkpoint_store.get_result(task_id)
+        if output is None:
+          pending_tasks.append((command, project_path, task_id))
+          continue
+        result_paths[task_id] = get_result_path(results_path, task_id, project_path, command)
+        if not os.path.exists(result_paths[task_id]):
+          with open(result_paths[task_id], "w") as result_file:
+            result_file.write(output)
+      print(model_id + ":", len(tasks) - len(pending_tasks), "of", len(tasks), "tasks completed before")
+      if len(pending_tasks) == 0:
+        continue
+
+      # Package embeddings must not be evicted before the run completes, so the store is not limited in size
+      model = load_fasttext_model(model_path)
+      with PackageEmbeddingCache(os.path.join(checkpoint_path, "embeddings.sqlite"), model_id, max_size=sys.maxsize, max_files=sys.maxsize) as embedding_cache:
+        for command, project_path, task_id in pending_tasks:
+          print(command, project_path)
+          root_path = get_source_root(project_path)
+          parse_report = ParseReport()
+          try:
+            if command == "analyze":
+              output = analyze_project(root_path, model, identifier_cache, embedding_cache, parse_report)
+            else:
+              output = organize_project(root_path, projection_threshold, model, identifier_cache, embedding_cache, parse_report, checkpoint_store)
+          except (OSError, ValueError, StopIteration) as error:
+            # Leave the task pending, so that it is tried again when the run is started again
+            print("  failed:", type(error).__name__ + ": " + str(error))
+            continue
+          finally:
+            # Do not keep the archives and git processes of every project open until the end of the run
+            close_sources()
+          parse_report.print_summary()
+          result_paths[task_id] = get_result_path(results_path, task_id, project_path, command)
+          with open(result_paths[task_id], "w") as result_file:
+            result_file.write(output)
+          if len(parse_report.problems) == 0:
+            checkpoint_store.put_result(task_id, output)
+  return result_paths
+
+if __name__ == "__main__":
+  # Prompt user to enter the path to a file that lists the paths to the projects, one per line
+  projects_path = input("Enter the path to a file that lists the Java projects to run (one path per line): ")
+  checkpoint_path = input("Enter the path to the directory to store the checkpoints and results in: ")
+  projection_threshold = float(input("Enter projection threshold at which a package should be considered a subpackage: "))
+
+  with open(projects_path) as projects_file:
+    project_paths = [line.strip() for line in projects_file if line.strip() != ""]
+  result_paths = run_batch(project_paths, checkpoint_path, projection_threshold)
+  print("Completed tasks:", len(result_paths), "of", len(project_paths) * len(BATCH_COMMANDS) * len(BATCH_MODELS))
+  if len(result_paths) < len(project_paths) * len(BATCH_COMMANDS) * len(BATCH_MODELS):
+    sys.exit(1)
@@ -0,0 +1,110 @@
+import json
+import time
+import hashlib
+import sqlite3
+import numpy as np
+
+"""
+Determine the key under which the projections between the packages of a project are stored
+
+:param model_id: the id of the model that produced the embeddings
+:param projection_threshold: the projection value a projection between packages needs to reach to be kept
+:param root_path: the path to the root package
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:returns: a digest of the arguments, which changes whenever any package embedding changes
+"""
+def get_projections_key(model_id, projection_threshold, root_path, package_embeddings, root_package_embedding):
+  digest = hashlib.sha256((model_id + "\0" + repr(projection_threshold) + "\0" + root_path + "\0").encode("utf-8", "surrogatepass"))
+  for package_path, package_embedding in [(root_path, root_package_embedding)] + list(package_embeddings.items()):
+    digest.update(package_path.encode("utf-8", "surrogatepass") + b"\0")
+    if package_embedding is not None:
+      digest.update(str(package_embedding.dtype).encode("ascii") + b"\0" + package_embedding.tobytes())
+    digest.update(b"\0")
+  return digest.digest()
+
+"""
+Persistent store of the completed stages of batch runs
+
+Together with the IdentifierCache (the identifiers of every parsed file) and the PackageEmbeddingCache (the embedding of
+every embedded package), it holds everything a batch run computes: the projections between the packages of each organized
+project and the output of each completed task. A run that is interrupted and started again finds the completed stages in
+the stores and only computes what is missing. Like the caches, the store is an SQLite database in WAL mode that can be shared
+between processes.
+
+Example:
+  with CheckpointStore("checkpoints.sqlite") as checkpoint_store:
+    output = checkpoint_store.get_result(task)
+"""
+class CheckpointStore:
+  """
+  :param database_path: the path to the SQLite database file (created if it does not exist)
+  :param timeout: the number of seconds to wait for another process that is writing to the database
+  """
+  def __init__(self, database_path, timeout=60):
+    self.connection = sqlite3.connect(database_path, timeout=timeout)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("PRAGMA synchronous=NORMAL")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS projections (key BLOB PRIMARY KEY, paths TEXT NOT NULL, this_ids BLOB NOT NULL, that_ids BLOB NOT NULL, projection_values BLOB NOT NULL, dtype TEXT NOT NULL) WITHOUT ROWID")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS results (task TEXT PRIMARY KEY, output TEXT NOT NULL, completed REAL NOT NULL) WITHOUT ROWID")
+    self.connection.commit()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    self.connection.close()
+
+  """
+  Look up the projections between the packages of a project
+
+  :param key: the key of the projections as returned by `get_projections_key`
+  :returns: the projections as they were stored (in the same order) or None if they are not in the store
+  """
+  def get_projections(self, key):
+    row = self.connection.execute("SELECT paths, this_ids, that_ids, projection_values, dtype FROM projections WHERE key = ?", (key,)).fetchone()
+    if row is None:
+      return None
+    paths, this_ids, that_ids, projection_values, dtype = row
+    paths = json.loads(paths)
+    this_ids = np.frombuffer(this_ids, dtype=np.int64)
+    that_ids = np.frombuffer(that_ids, dtype=np.int64)
+    projection_values = np.frombuffer(projection_values, dtype=dtype)
+    return {((paths[this_id],), paths[that_id]): projection_value for this_id, that_id, projection_value in zip(this_ids.tolist(), that_ids.tolist(), projection_values)}
+
+  """
+  Store the projections between the packages of a project
+
+  :param key: the key of the projections as returned by `get_projections_key`
+  :param pairwise_projections: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`
+  """
+  def put_projections(self, key, pairwise_projections):
+    package_ids = {}
+    this_ids = [package_ids.setdefault(this_package, len(package_ids)) for (this_package,), _ in pairwise_projections]
+    that_ids = [package_ids.setdefault(that_package, len(package_ids)) for _, that_package in pairwise_projections]
+    projection_values = np.array(list(pairwise_projections.values()))
+    with self.connection:
+      self.connection.execute("INSERT OR REPLACE INTO projections VALUES (?, ?, ?, ?, ?, ?)", (key, json.dumps(list(package_ids)), np.array(this_ids, dtype=np.int64).tobytes(), np.array(that_ids, dtype=np.int64).tobytes(), projection_values.tobytes(), str(projection_values.dtype)))
+
+  """
+  Look up the output of a completed task
+
+  :param task: the id of the task
+  :returns: the output of the task or None if it did not complete
+  """
+  def get_result(self, task):
+    row = self.connection.execute("SELECT output FROM results WHERE task = ?", (task,)).fetchone()
+    return row[0] if row is not None else None
+
+  """
+  Record that a task completed
+
+  :param task: the id of the task
+  :param output: the output of the task
+  """
+  def put_result(self, task, output):
+    with self.connection:
+      self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (task, output, time.time()))
@@ -0,0 +1,150 @@
+import struct
+
+CLASS_FILE_MAGIC = 0xCAFEBABE
+
+# Access flags (JVMS §4.1, §4.5, §4.6)
+ACC_BRIDGE = 0x0040
+ACC_SYNTHETIC = 0x1000
+ACC_ANNOTATION = 0x2000
+ACC_ENUM = 0x4000
+
+# Tag of the constant pool entries that are looked at
+CONSTANT_UTF8 = 1
+
+# Number of bytes that follow the tag of each kind of constant pool entry (except CONSTANT_Utf8, which has a length)
+CONSTANT_SIZES = {
+  3: 4, # Integer
+  4: 4, # Float
+  5: 8, # Long
+  6: 8, # Double
+  7: 2, # Class
+  8: 2, # String
+  9: 4, # Fieldref
+  10: 4, # Methodref
+  11: 4, # InterfaceMethodref
+  12: 4, # NameAndType
+  15: 3, # MethodHandle
+  16: 2, # MethodType
+  17: 4, # Dynamic
+  18: 4, # InvokeDynamic
+  19: 2, # Module
+  20: 2, # Package
+}
+# Long and Double entries take up two indices of the constant pool
+CONSTANT_LONG = 5
+CONSTANT_DOUBLE = 6
+
+class InvalidClassFile(Exception):
+  pass
+
+"""
+Decode a string of the constant pool
+
+Class files store strings in modified UTF-8, which encodes the null character as two bytes and characters outside the
+Basic Multilingual Plane as surrogate pairs.
+
+:param data: the bytes of the string
+:returns: the string
+"""
+def decode_modified_utf8(data):
+  return data.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass")
+
+"""
+Read the locations of the strings in the constant pool of a class file
+
+Only the offsets of CONSTANT_Utf8 entries are remembered; the strings themselves are decoded when they are looked up.
+
+:param class_bytes: the contents of the class file
+:param offset: the offset of constant_pool_count
+:returns: a tuple `(strings, offset)` where strings maps the index of every CONSTANT_Utf8 entry to its `(start, end)` in
+          class_bytes and offset is the offset right after the constant pool
+"""
+def read_constant_pool(class_bytes, offset):
+  constant_pool_count, = struct.unpack_from(">H", class_bytes, offset)
+  offset += 2
+  strings = {}
+  index = 1
+  while index < constant_pool_count:
+    tag = class_bytes[offset]
+    if tag == CONSTANT_UTF8:
+      length, = struct.unpack_from(">H", class_bytes, offset + 1)
+      strings[index] = (offset + 3, offset + 3 + length)
+      offset += 3 + length
+    elif tag in CONSTANT_SIZES:
+      offset += 1 + CONSTANT_SIZES[tag]
+    else:
+      raise InvalidClassFile("unknown constant pool tag " + str(tag) + " at offset " + str(offset))
+    index += 2 if tag == CONSTANT_LONG or tag == CONSTANT_DOUBLE else 1
+  return strings, offset
+
+"""
+Read the fields or methods of a class file
+
+:param class_bytes: the contents of the class file
+:param offset: the offset of fields_count or methods_count
+:returns: a tuple `(members, offset)` where members is a list of `(access_flags, name_index, descriptor_index)` and offset
+          is the offset right after the members
+"""
+def read_members(class_bytes, offset):
+  members_count, = struct.unpack_from(">H", class_bytes, offset)
+  offset += 2
+  members = []
+  for _ in range(members_count):
+    access_flags, name_index, descriptor_index, attributes_count = struct.unpack_from(">HHHH", class_bytes, offset)
+    offset += 8
+    for _ in range(attributes_count):
+      attribute_length, = struct.unpack_from(">I", class_bytes, offset + 2)
+      offset += 6 + attribute_length
+    members.append((access_flags, name_index, descriptor_index))
+  return members, offset
+
+"""
+Extract the field and method identifiers declared by a compiled class from its class file
+
+Reading the names from the constant pool is far cheaper than parsing the source code of the class, so build outputs can
+be analyzed when the sources are huge or not available. The identifiers are those that `get_class_identifiers_from_source`
+finds in the source: members that the compiler generated (synthetic and bridge members), constructors and static
+initializers are left out. javalang does not expose the members of an enum as the body of the type, so an enum has no
+identifiers at all, as with the fallback extractor. Nested classes are compiled to class files of their own, so their
+members are not included either.
+
+Example:
+  extract_class_file_identifiers(read_binary("OrderItem.class"))
+
+  (['quantity', 'price'], ['getQuantity', 'getTotalPrice'])
+
+:param class_bytes: the contents of the class file
+:returns: a tuple `(field_identifiers, method_identifiers)` of the identifiers in raw format (e.g. fieldIdentifier, methodIdentifier)
+"""
+def extract_class_file_identifiers(class_bytes):
+  try:
+    magic, = struct.unpack_from(">I", class_bytes, 0)
+    if magic != CLASS_FILE_MAGIC:
+      raise InvalidClassFile("not a class file")
+    strings, offset = read_constant_pool(class_bytes, 8)
+
+    def get_string(index):
+      start, end = strings[index]
+      return decode_modified_utf8(class_bytes[start:end])
+
+    access_flags, _, _, interfaces_count = struct.unpack_from(">HHHH", class_bytes, offset)
+    if access_flags & ACC_ENUM != 0:
+      # Like the members of an enum in the source (see `get_class_identifiers_from_source`)
+      return [], []
+    fields, offset = read_members(class_bytes, offset + 8 + 2 * interfaces_count)
+    methods, offset = read_members(class_bytes, offset)
+
+    field_identifiers = [get_string(name_index) for flags, name_index, _ in fields if flags & ACC_SYNTHETIC == 0]
+    if access_flags & ACC_ANNOTATION != 0:
+      # The elements of an annotation type are not method declarations in the source either
+      return field_identifiers, []
+
+    method_identifiers = []
+    for flags, name_index, _ in methods:
+      name = get_string(name_index)
+      if flags & (ACC_SYNTHETIC | ACC_BRIDGE) != 0 or name.startswith("<"):
+        continue
+      method_identifiers.append(name)
+    return field_identifiers, method_identifiers
+  except (struct.error, IndexError, KeyError, UnicodeDecodeError) as error:
+    raise InvalidClassFile(type(error).__name__ + ": " + str(error))
@@ -1,7 +1,15 @@
 import re
-import javalang
+import functools
+import threading
 import numpy as np
 import os
+from collections import OrderedDict
+from identifiercache import content_hash
+from sourceprovider import list_directory, read_source, read_binary, get_blob_id
+from classfilereader import InvalidClassFile, extract_class_file_identifiers
+from tolerantparsing import PARSE_TIME_BUDGET, MAX_SOURCE_SIZE, ParseFailure, ParseProblem, ParseReport, ParseTimeout, time_budget, extract_raw_identifiers
+
+SPLIT_CASE_PATTERN = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])')
 
 """
 Splits camelCase, PascalCase, and snake_case into separate words
@@ -22,7 +30,20 @@ Example 2:
     ['Pascal', 'XY', 'Case']
 """
 def split_case(string):
-  return re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])', string)
+  return SPLIT_CASE_PATTERN.findall(string)
+
+# Maximum number of distinct identifiers of which the lowercase words are remembered
+SPLIT_CACHE_SIZE = 1 << 16
+
+"""
+Split an identifier into lowercase words, remembering the result for identifiers that occur again
+
+:param identifier: the identifier in raw format (e.g. fieldIdentifier)
+:returns: a tuple of the lowercase words of the identifier (e.g. ('field', 'identifier'))
+"""
+@functools.lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def split_identifier(identifier):
+  return tuple([word.lower() for word in SPLIT_CASE_PATTERN.findall(identifier)])
 
 """ 
 Flatten a list
@@ -95,56 +116,461 @@ Example:
     12
 """
 def calculate_projection_length(v1, v2):
-  return np.dot(v1, v2) / (np.linalg.norm(v2))
+  return calculate_projection_lengths([v1], [v2])[0, 0]
+
+# Number of projection values `calculate_projection_lengths` adds up at a time, so that its temporary arrays stay in the CPU cache
+PROJECTION_CHUNK_SIZE = 16384
+
+# Number of products up to which `calculate_projection_lengths` adds them up in a single call rather than one dimension per call
+# (which has a fixed cost per dimension, but is much faster per value)
+SMALL_PROJECTION_SIZE = 32768
+
+"""
+Calculate the norms of vectors in double precision, adding up the squares one dimension after the other (in the same way
+`calculate_projection_lengths` adds up products)
+
+:param vectors: an n×d matrix (or a list of n vectors of equal length)
+:returns: a vector of the n norms
+"""
+def calculate_norms(vectors):
+  vectors = np.asarray(vectors, dtype=np.float64)
+  if vectors.size <= SMALL_PROJECTION_SIZE:
+    return np.sqrt(np.add.accumulate(vectors * vectors, axis=1)[:, -1])
+  vectors = np.ascontiguousarray(vectors.T)
+  sums_of_squares = vectors[0] * vectors[0]
+  for k in range(1, len(vectors)):
+    sums_of_squares += vectors[k] * vectors[k]
+  return np.sqrt(sums_of_squares)
+
+"""
+Calculate the lengths of the projections of vectors onto other vectors
+
+This is the kernel behind every projection value (`calculate_projection_length`, the projection matrix of
+projectionmatrix.py and its tiles), so that a projection has exactly the same value however it is batched: alone, as a row
+or as a block of rows, in any process. Every value is calculated in double precision by the same sequence of operations,
+adding up the products one dimension after the other (starting with the product of the first dimension), and only then
+rounded to `dtype`. A matrix product cannot be used for this, because BLAS adds up the products in an order that depends
+on the shapes and the memory layout. For few values, the products are added up by a single `np.add.accumulate`, otherwise
+one dimension is added to a chunk of values at a time, which is the same sequence of operations.
+
+:param vectors: an m×d matrix (or a list of m vectors) of projected vectors
+:param onto_vectors: an n×d matrix (or a list of n vectors) of the vectors they are projected onto
+:param onto_norms: the norms of `onto_vectors` as returned by `calculate_norms` (calculated if None)
+:param dtype: the data type of the result (defaults to the type of the vectors, but at least single precision)
+:returns: an m×n matrix where the value at [i, j] is the length of the projection of vector i onto vector j
+"""
+def calculate_projection_lengths(vectors, onto_vectors, onto_norms=None, dtype=None):
+  if dtype is None:
+    dtype = np.result_type(np.asarray(vectors).dtype, np.asarray(onto_vectors).dtype, np.float32)
+  # Dimensions first, so that every dimension is a contiguous matrix of products
+  vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float64).T)
+  onto_vectors = np.ascontiguousarray(np.asarray(onto_vectors, dtype=np.float64).T)
+  if onto_norms is None:
+    onto_norms = calculate_norms(onto_vectors.T)
+  dimension, m = vectors.shape
+  n = onto_vectors.shape[1]
+  if m * n * dimension <= SMALL_PROJECTION_SIZE:
+    dot_products = np.add.accumulate(vectors[:, :, None] * onto_vectors[:, None, :], axis=0)[-1]
+    return (dot_products / onto_norms).astype(dtype)
+
+  projection_lengths = np.empty((m, n), dtype=dtype)
+  columns = max(1, PROJECTION_CHUNK_SIZE // m)
+  for column_start in range(0, n, columns):
+    column_end = min(column_start + columns, n)
+    dot_products = np.multiply(vectors[0, :, None], onto_vectors[0, None, column_start:column_end])
+    products = np.empty_like(dot_products)
+    for k in range(1, dimension):
+      np.multiply(vectors[k, :, None], onto_vectors[k, None, column_start:column_end], out=products)
+      dot_products += products
+    projection_lengths[:, column_start:column_end] = dot_products / onto_norms[column_start:column_end]
+  return projection_lengths
+
+# Sum embeddings pairwise (in a balanced tree) instead of one after the other. Both are deterministic for a given order of
+# the embeddings, which is canonical (sorted) throughout; pairwise summation is more accurate for packages with many classes
+PAIRWISE_SUMMATION = False
+
+"""
+Running sum and count of embeddings, from which their mean can be taken at any point
+
+Embeddings are added one at a time, so the embeddings being averaged never have to be held in memory all at once.
+Two accumulators can be merged, which allows partial results (e.g. from parallel workers or from an incremental update)
+to be combined without recomputing the embeddings they were built from.
+
+In pairwise mode, partial sums are kept on a stack and the two topmost ones are added up as soon as the upper one covers
+at least as many embeddings as the one below it. This needs memory for O(log n) partial sums, and the order in which
+embeddings are added up depends only on the order in which they (and merged accumulators) were added.
+
+Example:
+  Input:
+    accumulator = EmbeddingAccumulator()
+    accumulator.add(numpy.array([1,2]))
+    accumulator.add(numpy.array([3,4]))
+    accumulator.mean()
+  Output:
+    numpy.array([2,3])
+
+:param pairwise: whether to sum pairwise (defaults to PAIRWISE_SUMMATION)
+"""
+class EmbeddingAccumulator:
+  def __init__(self, pairwise=None):
+    self.total = None
+    self.count = 0
+    self.dtype = None
+    self.pairwise = PAIRWISE_SUMMATION if pairwise is None else pairwise
+    self.partial_sums = []
+
+  """
+  Add an embedding to the running sum
+
+  :param embedding: the embedding to add (None, e.g. for a class without any words in its name or identifiers, is skipped)
+  """
+  def add(self, embedding):
+    if embedding is None:
+      return
+    if self.dtype is None:
+      self.dtype = embedding.dtype
+    if self.pairwise:
+      self.push(1, np.array(embedding, dtype=np.float64))
+    elif self.total is None:
+      self.total = np.array(embedding, dtype=np.float64)
+    else:
+      self.total += embedding
+    self.count += 1
+
+  """
+  Merge the running sum of another accumulator into this one
+
+  :param other: the accumulator to merge into this one
+  :returns: this accumulator
+  """
+  def merge(self, other):
+    if other.count == 0:
+      return self
+    if self.dtype is None:
+      self.dtype = other.dtype
+    if self.pairwise:
+      self.push(other.count, other.get_total().copy())
+    elif self.total is None:
+      self.total = other.get_total().copy()
+    else:
+      self.total += other.get_total()
+    self.count += other.count
+    return self
+
+  """
+  Push a partial sum onto the stack of a pairwise accumulator, adding up partial sums that cover similar numbers of embeddings
+
+  :param count: the number of embeddings the partial sum covers
+  :param partial_sum: the partial sum
+  """
+  def push(self, count, partial_sum):
+    self.total = None
+    self.partial_sums.append((count, partial_sum))
+    while len(self.partial_sums) > 1 and self.partial_sums[-2][0] <= self.partial_sums[-1][0]:
+      upper_count, upper_sum = self.partial_sums.pop()
+      lower_count, lower_sum = self.partial_sums.pop()
+      self.partial_sums.append((lower_count + upper_count, lower_sum + upper_sum))
+
+  """
+  Get the sum of all embeddings added so far
+
+  :returns: the sum as a float64 array or None if no embeddings were added
+  """
+  def get_total(self):
+    if self.pairwise and self.total is None and len(self.partial_sums) > 0:
+      total = self.partial_sums[-1][1]
+      for _, partial_sum in reversed(self.partial_sums[:-1]):
+        total = partial_sum + total
+      self.total = total
+    return self.total
+
+  """
+  Calculate the mean of all embeddings added so far
+
+  :returns: the mean embedding or None if no embeddings were added
+  """
+  def mean(self):
+    if self.count == 0:
+      return None
+    return (self.get_total() / self.count).astype(self.dtype)
 
 """
 Find the embedding of a package given its path
 
 :param package_path: the path to the directory of the package of which the embedding needs to be determined
 :param model: the fasttext model to use for retrieving word embeddings
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
 :returns: the embedding of the package or None if no embedding exists (package does not contain .java files)
 """
-def get_package_embedding(package_path, model):
-  files = next(os.walk(package_path))[2]
-  files = list(filter(lambda file : file.endswith(".java"), files))
-  class_embeddings = []
-  for file in files:
-    class_path = package_path + "/" + file
-    class_embeddings.append(get_class_embedding(class_path, model))
-  return np.mean(class_embeddings, axis=0) if len(class_embeddings) > 0 else None
+def get_package_embedding(package_path, model, pipeline=None, identifier_cache=None, parse_report=None, embedding_cache=None):
+  return get_package_embedding_accumulator(package_path, model, pipeline, identifier_cache, parse_report, embedding_cache).mean()
+
+"""
+Find the running sum of the embeddings of all classes in a package given its path
+
+:param package_path: the path to the directory of the package
+:param model: the fasttext model to use for retrieving word embeddings
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored (the pipeline uses its own)
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded (the pipeline uses its own).
+                     Problems are only recorded when the classes are parsed, so not for packages found in the embedding cache
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:returns: an EmbeddingAccumulator containing the embedding of each class in the package
+"""
+def get_package_embedding_accumulator(package_path, model, pipeline=None, identifier_cache=None, parse_report=None, embedding_cache=None):
+  return get_package_embedding_accumulators([package_path], model, pipeline, identifier_cache, parse_report, embedding_cache)[package_path]
+
+# Number of computed package embeddings that are stored in the embedding cache together
+EMBEDDING_STORE_BATCH = 64
+
+"""
+Find the running sums of the embeddings of the classes in multiple packages
+
+Packages that are in the embedding cache are taken from it; the classes of the other packages are embedded (through the
+pipeline if there is one, so that reading, parsing and embedding overlap across all of them) and the results are stored
+every EMBEDDING_STORE_BATCH packages. Packages with a class that could not be parsed cleanly are not stored, because
+problems such as timeouts depend on the machine.
+
+:param package_paths: the paths to the directories of the packages
+:param model: the fasttext model to use for retrieving word embeddings
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored (the pipeline uses its own)
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded (the pipeline uses its own)
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:returns: a dictionary of package path to the EmbeddingAccumulator of its classes, in the order of `package_paths`
+"""
+def get_package_embedding_accumulators(package_paths, model, pipeline=None, identifier_cache=None, parse_report=None, embedding_cache=None):
+  package_accumulators = {}
+  missing_package_paths = list(package_paths)
+  if embedding_cache is not None:
+    class_paths = {package_path: get_class_paths(package_path) for package_path in package_paths}
+    package_keys = {package_path: embedding_cache.get_package_key(class_paths[package_path]) for package_path in package_paths}
+    cached_accumulators = embedding_cache.get_many(package_keys.values())
+    package_accumulators = {package_path: cached_accumulators[key] for package_path, key in package_keys.items() if key in cached_accumulators}
+    missing_package_paths = [package_path for package_path in package_paths if package_path not in package_accumulators]
+
+  if pipeline is not None:
+    computed_accumulators = pipeline.get_package_embedding_accumulators(missing_package_paths, model)
+    parse_report = pipeline.parse_report
+  else:
+    # The parse problems are needed to tell which packages can be stored
+    if embedding_cache is not None and parse_report is None:
+      parse_report = ParseReport()
+    computed_accumulators = embed_packages(missing_package_paths, model, identifier_cache, parse_report)
+
+  # Store the computed packages as they come, so that an interrupted run only has to compute the last few of them again
+  unstored_accumulators = {}
+  for package_path, class_accumulator in computed_accumulators:
+    package_accumulators[package_path] = class_accumulator
+    if embedding_cache is not None and not any(class_path in parse_report.problems for class_path in class_paths[package_path]):
+      unstored_accumulators[package_keys[package_path]] = class_accumulator
+      if len(unstored_accumulators) >= EMBEDDING_STORE_BATCH:
+        embedding_cache.put_many(unstored_accumulators)
+        unstored_accumulators = {}
+  if embedding_cache is not None:
+    embedding_cache.put_many(unstored_accumulators)
+  return {package_path: package_accumulators[package_path] for package_path in package_paths}
+
+"""
+Find the running sums of the embeddings of the classes in multiple packages, one class after the other
+
+:param package_paths: the paths to the directories of the packages
+:param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:returns: a generator of `(package_path, accumulator)` tuples in the order of `package_paths`
+"""
+def embed_packages(package_paths, model, identifier_cache=None, parse_report=None):
+  for package_path in package_paths:
+    class_accumulator = EmbeddingAccumulator()
+    for class_path in get_class_paths(package_path):
+      class_accumulator.add(get_class_embedding(class_path, model, identifier_cache, parse_report))
+    yield package_path, class_accumulator
+
+# The files that classes are read from: ".java" to parse the source files, or ".class" to read the identifiers from the
+# compiled class files instead (e.g. of a build output or a jar), which is much faster and works without sources
+CLASS_FILE_EXTENSION = ".java"
+
+"""
+Check whether a file is one that classes are read from (see CLASS_FILE_EXTENSION)
+
+Nested, local and anonymous classes are compiled to class files of their own (e.g. Order$Item.class), but belong to the
+class they are declared in, just like they are part of its source file.
+
+:param file_name: the name of the file
+:returns: whether the file holds a class
+"""
+def is_class_file(file_name):
+  return file_name.endswith(CLASS_FILE_EXTENSION) and not (CLASS_FILE_EXTENSION == ".class" and "$" in file_name)
+
+"""
+Find the paths to all classes directly inside a package
+
+:param package_path: the path to the directory of the package (on the file system, in a source archive or in a git revision, see sourceprovider.py)
+:returns: a list of paths to the .java files (or .class files, see CLASS_FILE_EXTENSION) in the package, in alphabetical order (so that the embeddings of its classes are always added up in the same order)
+"""
+def get_class_paths(package_path):
+  _, files = list_directory(package_path)
+  files = sorted(filter(is_class_file, files))
+  return [package_path + "/" + file for file in files]
 
 """
 Find the embedding of a class given its path
 
 :param class_path: the file path to the class of which the embedding needs to be determined
 :param model: the fasttext model to use for retrieving word embeddings
-:returns: the embedding of the class
-"""
-def get_class_embedding(class_path, model):
-  field_identifiers, method_identifiers = get_class_identifiers(class_path)
- 
-  split_file_name = list(map(lambda x : x.lower(), split_case(os.path.basename(class_path).removesuffix(".java"))))
-  context = set(flatten([field_identifiers, method_identifiers]))
-  context_embedding = np.mean([model.get_word_vector(word) for word in context], axis=0) if len(context) > 0 else None
-  class_name_embedding = np.mean([model.get_word_vector(word) for word in split_file_name], axis=0)
-  class_embedding = class_name_embedding if context_embedding is None else np.mean([class_name_embedding, context_embedding], axis=0)
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:returns: the embedding of the class or None if neither its name nor its identifiers contain any words
+"""
+def get_class_embedding(class_path, model, identifier_cache=None, parse_report=None):
+  field_identifiers, method_identifiers = get_class_identifiers(class_path, identifier_cache, parse_report)
+  return get_class_embedding_from_identifiers(class_path, field_identifiers, method_identifiers, model)
+
+"""
+Find the embedding of a class given its path and its already extracted identifiers
+
+:param class_path: the file path to the class of which the embedding needs to be determined
+:param field_identifiers: the field identifiers of the class as returned by `get_class_identifiers`
+:param method_identifiers: the method identifiers of the class as returned by `get_class_identifiers`
+:param model: the fasttext model to use for retrieving word embeddings
+:returns: the embedding of the class or None if neither its name nor its identifiers contain any words (e.g. a class named _1)
+"""
+def get_class_embedding_from_identifiers(class_path, field_identifiers, method_identifiers, model):
+  split_file_name = get_class_name_words(class_path)
+  context = sorted(get_identifier_words(field_identifiers, method_identifiers))
+  context_embedding = get_words_embedding(context, model)
+  class_name_embedding = get_words_embedding(split_file_name, model)
+  if class_name_embedding is None or context_embedding is None:
+    return context_embedding if class_name_embedding is None else class_name_embedding
+  class_embedding = np.mean([class_name_embedding, context_embedding], axis=0)
   
   return class_embedding
 
+"""
+Find the lowercase words that make up the name of a class given its path
+
+:param class_path: the file path to the class
+:returns: a list of the lowercase parts of the class name (e.g. /path/to/OrderItem.java or /path/to/OrderItem.class is turned into ['order', 'item'])
+"""
+def get_class_name_words(class_path):
+  return list(split_identifier(os.path.splitext(os.path.basename(class_path))[0]))
+
+"""
+Find the average embedding of a collection of words
+
+:param words: the words of which the embeddings need to be averaged
+:param model: the fasttext model to use for retrieving word embeddings
+:returns: the average embedding of the words or None if there are no words
+"""
+def get_words_embedding(words, model):
+  word_accumulator = EmbeddingAccumulator()
+  for word in words:
+    word_accumulator.add(model.get_word_vector(word))
+  return word_accumulator.mean()
+
 """
 Find the field identifiers and method identifiers of a class given the file path to the class
 
 :param class_path: the file path to the class of which the identifiers need to be determined
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
 :returns: a tuple `(field_identifiers, method_identifiers)` 
           where `field_identifiers` is a list of field identifiers `[field_identifier1, field_identifier2, ...]` 
           where each `field_identifier` is a list of its parts in lowercase (e.g. variableName is turned into ['variable', 'name']). 
           The same holds for method_identifiers, but the first part of each identifier is removed (e.g. getTotalCount is turned into ['total', 'count'])
 """
-def get_class_identifiers(class_path):
-  class_file = open(class_path)
-  src_text = "".join(class_file.readlines())
+def get_class_identifiers(class_path, identifier_cache=None, parse_report=None):
+  blob_id = get_blob_id(class_path)
+  remembered = blob_identifiers.get(blob_id) if blob_id is not None else None
+  if remembered is not None:
+    identifiers, problem = remembered
+    if parse_report is not None:
+      parse_report.record(class_path, problem)
+    return identifiers
+
+  src_text = read_class_source(class_path)
+  key = content_hash(src_text) if identifier_cache is not None else None
+  identifiers = identifier_cache.get(key) if identifier_cache is not None else None
+  problem = None
+  if identifiers is None:
+    identifiers, problem = parse_class_identifiers(src_text)
+    if parse_report is not None:
+      parse_report.record(class_path, problem)
+    # Problems such as timeouts depend on the machine, so only cleanly parsed classes are stored
+    if identifier_cache is not None and problem is None:
+      identifier_cache.put(key, identifiers)
+  if blob_id is not None:
+    blob_identifiers.put(blob_id, identifiers, problem)
+  return identifiers
+
+# Maximum number of files in git revisions whose identifiers are remembered by their blob id during a run
+MAX_BLOB_IDENTIFIERS = 100000
+
+"""
+The identifiers of files in git revisions, remembered during a run by the blob id of the file (see `sourceprovider.get_blob_id`)
+
+A blob id identifies the contents of a file, so a file that is the same in several revisions is read and parsed only once,
+also without an IdentifierCache. The problem of a file that could not be parsed cleanly is remembered with its identifiers,
+so that it is recorded for the file in every revision. When more than `max_size` files are remembered, the least recently
+used ones are forgotten. The identifiers are looked up by `get_class_identifiers` and by the EmbeddingPipeline, from any thread.
+
+:param max_size: the maximum number of files to remember
+"""
+class BlobIdentifiers:
+  def __init__(self, max_size=MAX_BLOB_IDENTIFIERS):
+    self.max_size = max_size
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  """
+  :param blob_id: the blob id of the file
+  :returns: a tuple `(identifiers, problem)` as returned by `parse_class_identifiers`, or None if the file is not remembered
+  """
+  def get(self, blob_id):
+    with self.lock:
+      entry = self.entries.get(blob_id)
+      if entry is not None:
+        self.entries.move_to_end(blob_id)
+      return entry
+
+  """
+  :param blob_id: the blob id of the file
+  :param identifiers: the identifiers of the file as returned by `get_class_identifiers`
+  :param problem: the ParseProblem of the file, or None if it was parsed cleanly
+  """
+  def put(self, blob_id, identifiers, problem):
+    with self.lock:
+      self.entries[blob_id] = (identifiers, problem)
+      self.entries.move_to_end(blob_id)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+
+blob_identifiers = BlobIdentifiers()
+
+"""
+Read the source code of a class given the file path to the class
+
+:param class_path: the file path to the class (on the file system, in a source archive or in a git revision)
+:returns: the source code of the class, or the contents of its class file as bytes for a .class file
+"""
+def read_class_source(class_path):
+  if class_path.endswith(".class"):
+    return read_binary(class_path)
+  return read_source(class_path)
+
+"""
+Find the field identifiers and method identifiers of a class given its source code
+
+:param src_text: the source code of the class
+:returns: a tuple `(field_identifiers, method_identifiers)` as described in `get_class_identifiers`
+"""
+def get_class_identifiers_from_source(src_text):
+  import javalang # imported on first use, because importing javalang noticeably slows down the start of every run
   src_tree = javalang.parse.parse(src_text)
-  class_file.close()
 
   # Collect all field identifiers and method identifiers in raw format (e.g. fieldIdentifier, methodIdentifier)
   field_identifiers = []
@@ -160,15 +586,64 @@ def get_class_identifiers(class_path):
       for variable in declaration.declarators:
         field_identifiers.append(variable.name)
 
-  # Post-process the identifiers (split camelCase, PascalCase and snake_case, and lowercase the words)
-  field_identifiers = list(map(lambda str : split_case(str), field_identifiers))
-  for i in range(len(field_identifiers)):
-    field_identifiers[i] = list(map(lambda str : str.lower(), field_identifiers[i]))
-  method_identifiers = list(map(lambda str : split_case(str), method_identifiers))
-  for i in range(len(method_identifiers)):
-    method_identifiers[i].remove(method_identifiers[i][0])
-  method_identifiers = [x for x in method_identifiers if len(x) != 0]
-  for i in range(len(method_identifiers)):
-    method_identifiers[i] = list(map(lambda str : str.lower(), method_identifiers[i]))
-  
-  return (field_identifiers, method_identifiers)
\ No newline at end of file
+  return split_identifiers(field_identifiers, method_identifiers)
+
+"""
+Find the field identifiers and method identifiers of a class given its source code without letting the class abort the run
+
+Files that javalang cannot parse (e.g. because of newer Java syntax), that take longer than PARSE_TIME_BUDGET seconds to
+parse, or that are larger than MAX_SOURCE_SIZE characters are handed to a tokenizer-based fallback extractor instead.
+The identifiers of a compiled class are read from its class file (see classfilereader.py) rather than parsed.
+
+:param src_text: the source code of the class, or the contents of its class file as bytes
+:returns: a tuple `(identifiers, problem)` where identifiers is a tuple `(field_identifiers, method_identifiers)` as described in
+          `get_class_identifiers` and problem is a ParseProblem, or None if javalang parsed the class
+"""
+def parse_class_identifiers(src_text):
+  if isinstance(src_text, bytes):
+    try:
+      return split_identifiers(*extract_class_file_identifiers(src_text)), None
+    except InvalidClassFile as error:
+      return ([], []), ParseProblem(ParseFailure.INVALID_CLASS_FILE, str(error), False)
+  if len(src_text) > MAX_SOURCE_SIZE:
+    failure, detail = ParseFailure.TOO_LARGE, str(len(src_text)) + " characters"
+  else:
+    try:
+      with time_budget(PARSE_TIME_BUDGET):
+        return get_class_identifiers_from_source(src_text), None
+    except ParseTimeout as error:
+      failure, detail = ParseFailure.TIMEOUT, str(error)
+    except Exception as error:
+      failure, detail = ParseFailure.SYNTAX_ERROR, type(error).__name__ + ": " + str(error)
+
+  try:
+    return split_identifiers(*extract_raw_identifiers(src_text)), ParseProblem(failure, detail, True)
+  except Exception:
+    return ([], []), ParseProblem(failure, detail, False)
+
+"""
+Split raw field identifiers and method identifiers into lowercase words
+
+:param field_identifiers: a list of field identifiers in raw format (e.g. fieldIdentifier)
+:param method_identifiers: a list of method identifiers in raw format (e.g. methodIdentifier)
+:returns: a tuple `(field_identifiers, method_identifiers)` as described in `get_class_identifiers`
+"""
+def split_identifiers(field_identifiers, method_identifiers):
+  # Split camelCase, PascalCase and snake_case and lowercase the words in one pass, dropping the first word (the verb) of method identifiers
+  field_words = [list(split_identifier(identifier)) for identifier in field_identifiers]
+  method_words = []
+  for identifier in method_identifiers:
+    words = split_identifier(identifier)
+    if len(words) > 1:
+      method_words.append(list(words[1:]))
+  return (field_words, method_words)
+
+"""
+Find the distinct words of the field identifiers and method identifiers of a class
+
+:param field_identifiers: the field identifiers of the class as returned by `get_class_identifiers`
+:param method_identifiers: the method identifiers of the class as returned by `get_class_identifiers`
+:returns: a set of the words
+"""
+def get_identifier_words(field_identifiers, method_identifiers):
+  return {word for identifiers in (field_identifiers, method_identifiers) for identifier in identifiers for word in identifier}
@@ -0,0 +1,372 @@
+import io
+import os
+import sys
+import time
+import socket
+import numpy as np
+from common import EmbeddingAccumulator, get_package_embedding_accumulators
+from identifiercache import IdentifierCache
+from embeddingcache import PackageEmbeddingCache
+from tolerantparsing import ParseReport
+from vocabularyvectors import FASTTEXT_MODEL_PATH, load_fasttext_model, get_model_file_id
+from sourceprovider import list_directory, get_source_root, close_sources
+from workqueue import WorkQueue
+from batchrun import get_task_id, get_result_path
+from packageanalyzer import ProjectionBreakdown, ProjectionCategory, PackageType, find_package_projections, find_all_projections_recursively, print_results, KEEP_PROJECTION_VALUES
+from packageorganizer import calculate_pairwise_projections, recommend_hierarchy, write_recommendation
+
+# The scripts to run every project with: "analyze" (packageanalyzer.py) and/or "organize" (packageorganizer.py)
+DISTRIBUTED_COMMANDS = ["analyze", "organize"]
+
+# Number of top-level packages (each with its subtree) per job; projects with more packages are split into multiple jobs
+PACKAGES_PER_JOB = 64
+
+# Number of packages of which the projections onto all other packages are calculated per job
+PROJECTIONS_PER_JOB = 256
+
+# Number of seconds between two polls of the work queue
+POLL_INTERVAL = 1.0
+
+# Number of seconds a worker waits for new jobs before it stops (None to keep waiting)
+WORKER_IDLE_TIMEOUT = None
+
+# Path to an SQLite database on the node of a worker in which the parsed identifiers of classes are shared between runs (None to always parse)
+IDENTIFIER_CACHE_PATH = None
+
+# Path to an SQLite database on the node of a worker in which package embeddings are shared between runs (None to always embed the classes)
+EMBEDDING_CACHE_PATH = None
+
+"""
+Serialize NumPy arrays into the result of a job
+
+:param arrays: the arrays by name
+:returns: the arrays as a NumPy .npz archive
+"""
+def encode_arrays(**arrays):
+  buffer = io.BytesIO()
+  np.savez(buffer, **arrays)
+  return buffer.getvalue()
+
+"""
+Deserialize the result of a job
+
+:param data: the result as returned by `encode_arrays`
+:returns: a dictionary of name to array
+"""
+def decode_arrays(data):
+  with np.load(io.BytesIO(data)) as arrays:
+    return {name: arrays[name] for name in arrays.files}
+
+"""
+A ProjectionBreakdown that only records the tagged projections in the order in which they are added, so that a worker
+can publish them and the coordinator can add them to its breakdown in the same order as a single-node run (merging the
+statistics of breakdowns would change the mean and standard deviation in the last bits)
+"""
+class ProjectionRecorder(ProjectionBreakdown):
+  def __init__(self):
+    super().__init__()
+    self.records = []
+
+  def add(self, projection, category, depth, package_type, this_package_path):
+    self.records.append((projection, category.name, depth, package_type.name, this_package_path))
+
+"""
+Run an "analyze" job: collect the projections of the root package (if the job includes it) and of the subtrees of some
+top-level packages, as packageanalyzer.py does
+
+:param payload: the payload of the job
+:param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:returns: the tagged projections, encoded with `encode_arrays`
+"""
+def run_analyze_job(payload, model, identifier_cache=None, parse_report=None, embedding_cache=None):
+  root_path = payload["root_path"]
+  recorder = ProjectionRecorder()
+  if payload["root"]:
+    find_package_projections(root_path, recorder, model, True, identifier_cache, parse_report, embedding_cache, 0)
+  for package in payload["packages"]:
+    find_all_projections_recursively(root_path + "/" + package, recorder, model, False, identifier_cache, parse_report, embedding_cache, 1)
+  values, categories, depths, package_types, package_paths = zip(*recorder.records) if len(recorder.records) > 0 else ([], [], [], [], [])
+  return encode_arrays(values=np.array(values), categories=np.array(categories, dtype=str), depths=np.array(depths, dtype=np.int64), package_types=np.array(package_types, dtype=str), package_paths=np.array(package_paths, dtype=str))
+
+"""
+Run an "embed" job: find the running sums of the class embeddings of some top-level packages (and of the root package if
+the job includes it), as packageorganizer.py does
+
+:param payload: the payload of the job
+:param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:returns: the running sums, encoded with `encode_arrays`
+"""
+def run_embed_job(payload, model, identifier_cache=None, parse_report=None, embedding_cache=None):
+  root_path = payload["root_path"]
+  package_paths = [root_path + "/" + package for package in payload["packages"]] + ([root_path] if payload["root"] else [])
+  package_accumulators = get_package_embedding_accumulators(package_paths, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache)
+  totals = [class_accumulator.get_total() if class_accumulator.count > 0 else None for class_accumulator in package_accumulators.values()]
+  dimensions = next((len(total) for total in totals if total is not None), 0)
+  return encode_arrays(
+    package_paths=np.array(package_paths, dtype=str),
+    counts=np.array([class_accumulator.count for class_accumulator in package_accumulators.values()], dtype=np.int64),
+    dtypes=np.array([str(class_accumulator.dtype) if class_accumulator.count > 0 else "" for class_accumulator in package_accumulators.values()], dtype=str),
+    totals=np.array([total if total is not None else np.zeros(dimensions) for total in totals], dtype=np.float64).reshape(len(totals), dimensions))
+
+"""
+Gather the package embeddings of a project from the results of its "embed" jobs
+
+:param queue: the WorkQueue
+:param task_id: the id of the "organize" task of the project
+:param root_path: the path to the root package of the project
+:returns: a tuple `(package_accumulators, package_embeddings, root_package_embedding)` as packageorganizer.py determines them
+"""
+def get_project_embeddings(queue, task_id, root_path):
+  package_accumulators = {}
+  for result in queue.get_results(task_id, "embed"):
+    arrays = decode_arrays(result)
+    for package_path, count, dtype, total in zip(arrays["package_paths"].tolist(), arrays["counts"].tolist(), arrays["dtypes"].tolist(), arrays["totals"]):
+      # Like a package from the embedding cache, the running sum is a single partial sum
+      class_accumulator = EmbeddingAccumulator(pairwise=False)
+      if count > 0:
+        class_accumulator.total = total.copy()
+        class_accumulator.count = count
+        class_accumulator.dtype = np.dtype(dtype)
+      package_accumulators[package_path] = class_accumulator
+
+  package_embeddings = {}
+  for package_path, class_accumulator in package_accumulators.items():
+    package_embedding = class_accumulator.mean()
+    if package_path != root_path and package_embedding is not None:
+      package_embeddings[package_path] = package_embedding
+  return package_accumulators, package_embeddings, package_accumulators[root_path].mean()
+
+"""
+Run a "project" job: calculate the projections of a range of packages of a project onto the other packages, as
+`calculate_pairwise_projections` does
+
+:param payload: the payload of the job
+:param project_embeddings: the package embeddings of the project as returned by `get_project_embeddings`
+:returns: the projections as indices into the packages with an embedding (-1 for the root package), encoded with `encode_arrays`
+"""
+def run_project_job(payload, project_embeddings):
+  root_path = payload["root_path"]
+  _, package_embeddings, root_package_embedding = project_embeddings
+  packages = list(package_embeddings)
+  pairwise_projections = calculate_pairwise_projections(package_embeddings, root_package_embedding, root_path, payload["projection_threshold"], packages[payload["start"]:payload["end"]])
+  package_ids = {package: i for i, package in enumerate(packages)}
+  package_ids[root_path] = -1
+  return encode_arrays(
+    this_ids=np.array([package_ids[this_package] for (this_package,), _ in pairwise_projections], dtype=np.int64),
+    that_ids=np.array([package_ids[that_package] for _, that_package in pairwise_projections], dtype=np.int64),
+    values=np.array(list(pairwise_projections.values())))
+
+"""
+Merge the results of the "analyze" jobs of a project
+
+:param queue: the WorkQueue
+:param task_id: the id of the "analyze" task of the project
+:returns: the results, as packageanalyzer.py prints them
+"""
+def merge_analysis(queue, task_id):
+  breakdown = ProjectionBreakdown(keep_values=KEEP_PROJECTION_VALUES)
+  for result in queue.get_results(task_id, "analyze"):
+    arrays = decode_arrays(result)
+    for projection, category, depth, package_type, this_package_path in zip(arrays["values"], arrays["categories"].tolist(), arrays["depths"].tolist(), arrays["package_types"].tolist(), arrays["package_paths"].tolist()):
+      breakdown.add(projection, ProjectionCategory[category], depth, PackageType[package_type], this_package_path)
+  output_file = io.StringIO()
+  print_results(breakdown, output_file)
+  return output_file.getvalue()
+
+"""
+Merge the results of the "embed" and "project" jobs of a project and recommend a package hierarchy
+
+:param queue: the WorkQueue
+:param task_id: the id of the "organize" task of the project
+:param root_path: the path to the root package of the project
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:returns: the recommended hierarchy, as packageorganizer.py outputs it
+"""
+def merge_recommendation(queue, task_id, root_path, projection_threshold):
+  package_accumulators, package_embeddings, root_package_embedding = get_project_embeddings(queue, task_id, root_path)
+  packages = list(package_embeddings)
+  pairwise_projections = {}
+  for result in queue.get_results(task_id, "project"):
+    arrays = decode_arrays(result)
+    for this_id, that_id, projection_value in zip(arrays["this_ids"].tolist(), arrays["that_ids"].tolist(), arrays["values"]):
+      pairwise_projections[((packages[this_id],), packages[that_id] if that_id >= 0 else root_path)] = projection_value
+  is_contained_in, projection_values = recommend_hierarchy(pairwise_projections, package_embeddings, root_package_embedding, package_accumulators, root_path, projection_threshold)
+  output_file = io.StringIO()
+  write_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, root_package_embedding is not None, projection_threshold, output_file)
+  return output_file.getvalue()
+
+"""
+Check on the jobs of a task, submit the jobs of its next stage when the jobs of a stage completed, and merge their
+results when all of them completed
+
+:param queue: the WorkQueue
+:param command: the script the task runs ("analyze" or "organize")
+:param root_path: the path to the root package of the project
+:param task_id: the id of the task
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:returns: a tuple `(output, error)`: the output of the task if it completed, the error of a job of the task if one failed
+"""
+def advance_task(queue, command, root_path, task_id, projection_threshold):
+  for kind in ["analyze"] if command == "analyze" else ["embed", "project"]:
+    states = queue.get_states(task_id, kind)
+    errors = [error for state, error in states if state == "failed"]
+    if len(errors) > 0:
+      return None, errors[0]
+    if kind == "project" and len(states) == 0:
+      # The projections are split by the number of packages with an embedding, which is only known after embedding them
+      _, package_embeddings, _ = get_project_embeddings(queue, task_id, root_path)
+      queue.submit(task_id, kind, [{"root_path": root_path, "start": start, "end": start + PROJECTIONS_PER_JOB, "projection_threshold": projection_threshold} for start in range(0, max(len(package_embeddings), 1), PROJECTIONS_PER_JOB)])
+      return None, None
+    if any(state != "done" for state, _ in states):
+      return None, None
+  if command == "analyze":
+    return merge_analysis(queue, task_id), None
+  return merge_recommendation(queue, task_id, root_path, projection_threshold), None
+
+"""
+Split projects into jobs on the work queue and merge the results that workers publish into the same output as a
+single-node run (of packageanalyzer.py and of packageorganizer.py with the default projection calculation)
+
+The top-level packages of a project (each with its subtree) are split into jobs of PACKAGES_PER_JOB packages. Organizing
+a project takes two stages: when its packages are embedded, the projections between them are split into jobs of
+PROJECTIONS_PER_JOB packages. The paths to the projects need to be the same on all nodes (e.g. absolute paths on shared
+storage). Jobs that were completed before, e.g. by an earlier coordinator that was interrupted, are not run again, and
+failed jobs are tried again.
+
+:param project_paths: the paths to the root packages of the projects (directories, source archives or git revisions)
+:param queue: the WorkQueue
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param results_path: the directory to write the output of every task to (created if it does not exist)
+:returns: a dictionary of task id to the path of the file with the output of the task, for the tasks that completed
+"""
+def run_coordinator(project_paths, queue, projection_threshold, results_path):
+  os.makedirs(results_path, exist_ok=True)
+  model_id = get_model_file_id(FASTTEXT_MODEL_PATH)
+  queue.retry_failed()
+  tasks = []
+  for project_path in project_paths:
+    root_path = get_source_root(project_path)
+    try:
+      packages = sorted(list_directory(root_path)[0])
+    except (OSError, ValueError, StopIteration) as error:
+      print(project_path, "failed:", type(error).__name__ + ": " + str(error))
+      continue
+    chunks = [packages[i:i + PACKAGES_PER_JOB] for i in range(0, max(len(packages), 1), PACKAGES_PER_JOB)]
+    for command in DISTRIBUTED_COMMANDS:
+      task_id = get_task_id(command, project_path, model_id, projection_threshold)
+      if command == "analyze":
+        # The projections of the root package come before those of its subtrees
+        queue.submit(task_id, "analyze", [{"root_path": root_path, "packages": chunk, "root": i == 0} for i, chunk in enumerate(chunks)])
+      else:
+        # The root package comes after the other packages
+        queue.submit(task_id, "embed", [{"root_path": root_path, "packages": chunk, "root": i == len(chunks) - 1} for i, chunk in enumerate(chunks)])
+      tasks.append((command, project_path, root_path, task_id))
+
+  result_paths = {}
+  while True:
+    running_tasks = []
+    for command, project_path, root_path, task_id in tasks:
+      output, error = advance_task(queue, command, root_path, task_id, projection_threshold)
+      if error is not None:
+        print(command, project_path, "failed:", error)
+      elif output is not None:
+        print(command, project_path, "completed")
+        result_paths[task_id] = get_result_path(results_path, task_id, project_path, command)
+        with open(result_paths[task_id], "w") as result_file:
+          result_file.write(output)
+      else:
+        running_tasks.append((command, project_path, root_path, task_id))
+    tasks = running_tasks
+    if len(tasks) == 0:
+      return result_paths
+    time.sleep(POLL_INTERVAL)
+
+"""
+Claim jobs from the work queue, run them and publish their results, until no job is left for WORKER_IDLE_TIMEOUT seconds
+
+:param queue: the WorkQueue
+:param worker: the id of the worker
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:param idle_timeout: the number of seconds to wait for new jobs before returning (None to keep waiting)
+:returns: the number of jobs that were completed
+"""
+def run_worker(queue, worker, identifier_cache=None, embedding_cache=None, idle_timeout=WORKER_IDLE_TIMEOUT):
+  model = None
+  # The package embeddings of the project of the last "project" job, which the next one most likely needs too
+  project_embeddings_task = None
+  project_embeddings = None
+  completed_jobs = 0
+  idle_since = time.time()
+  while True:
+    job = queue.claim(worker)
+    if job is None:
+      if idle_timeout is not None and time.time() - idle_since >= idle_timeout:
+        return completed_jobs
+      time.sleep(POLL_INTERVAL)
+      continue
+
+    job_id, task_id, kind, payload = job
+    parse_report = ParseReport()
+    try:
+      with queue.heartbeat(job_id, worker):
+        if kind == "project":
+          if project_embeddings_task != task_id:
+            project_embeddings = get_project_embeddings(queue, task_id, payload["root_path"])
+            project_embeddings_task = task_id
+          result = run_project_job(payload, project_embeddings)
+        else:
+          if model is None:
+            model = load_fasttext_model()
+          if kind == "analyze":
+            result = run_analyze_job(payload, model, identifier_cache, parse_report, embedding_cache)
+          else:
+            result = run_embed_job(payload, model, identifier_cache, parse_report, embedding_cache)
+    except Exception as error:
+      # Any error fails the job rather than the worker, which goes on with the next job
+      print(kind, payload["root_path"], "failed:", type(error).__name__ + ": " + str(error))
+      queue.fail(job_id, worker, type(error).__name__ + ": " + str(error))
+    else:
+      queue.complete(job_id, worker, result)
+      completed_jobs += 1
+    finally:
+      # Do not keep the archives and git processes of every project the worker had a job of open
+      close_sources()
+    parse_report.print_summary()
+    idle_since = time.time()
+
+if __name__ == "__main__":
+  role = input("Enter the role of this process (coordinator or worker): ").strip()
+  queue_path = input("Enter the path to the work queue database (on storage shared by all nodes): ")
+
+  if role == "coordinator":
+    # Prompt user to enter the path to a file that lists the paths to the projects, one per line
+    projects_path = input("Enter the path to a file that lists the Java projects to run (one path per line): ")
+    results_path = input("Enter the path to the directory to write the results to: ")
+    projection_threshold = float(input("Enter projection threshold at which a package should be considered a subpackage: "))
+    with open(projects_path) as projects_file:
+      project_paths = [line.strip() for line in projects_file if line.strip() != ""]
+    with WorkQueue(queue_path) as queue:
+      result_paths = run_coordinator(project_paths, queue, projection_threshold, results_path)
+    print("Completed tasks:", len(result_paths), "of", len(project_paths) * len(DISTRIBUTED_COMMANDS))
+    if len(result_paths) < len(project_paths) * len(DISTRIBUTED_COMMANDS):
+      sys.exit(1)
+  elif role == "worker":
+    identifier_cache = IdentifierCache(IDENTIFIER_CACHE_PATH) if IDENTIFIER_CACHE_PATH is not None else None
+    embedding_cache = PackageEmbeddingCache(EMBEDDING_CACHE_PATH, get_model_file_id(FASTTEXT_MODEL_PATH)) if EMBEDDING_CACHE_PATH is not None else None
+    with WorkQueue(queue_path) as queue:
+      completed_jobs = run_worker(queue, socket.gethostname() + ":" + str(os.getpid()), identifier_cache, embedding_cache)
+    if identifier_cache is not None:
+      identifier_cache.close()
+    if embedding_cache is not None:
+      embedding_cache.close()
+    print("Completed jobs:", completed_jobs)
+  else:
+    print("Unknown role:", role)
+    sys.exit(1)
@@ -0,0 +1,382 @@
+import io
+import os
+import sys
+import struct
+import tempfile
+import zipfile
+import numpy as np
+import common
+import identifiercache
+import packageorganizer
+from common import EmbeddingAccumulator, get_class_embedding, get_class_identifiers, get_class_paths, get_package_embedding, get_package_embedding_accumulators
+from vocabularyvectors import VocabularyVectors, get_project_vocabulary
+import sourceprovider
+from sourceprovider import list_directory, read_source, close_sources
+from projectionstatistics import ProjectionStatistics
+from embeddingcache import PackageEmbeddingCache
+from tolerantparsing import ParseReport
+from packageanalyzer import ProjectionBreakdown, ProjectionCategory, PackageType, find_all_projections_recursively, print_results
+from packageorganizer import calculate_configured_pairwise_projections, recommend_hierarchy, write_recommendation
+
+"""
+Checks of inputs at the edges of what the analyzer and the organizer handle
+
+Every check writes a small project to a temporary directory and runs the parts of the analyzer and the organizer that the
+input affects on it. The word embeddings are random vectors (seeded) for the words of the project, loaded as
+VocabularyVectors, so the checks run without the FastText model.
+
+Run with `py edgecasechecks.py`.
+"""
+
+PROJECTION_THRESHOLD = 0.8
+
+"""
+Write the source files of a project
+
+:param root_path: the path to the root package of the project
+:param sources: dictionary of path (relative to the root package) to the contents of the file
+"""
+def write_project(root_path, sources):
+  for relative_path, source in sources.items():
+    os.makedirs(os.path.dirname(os.path.join(root_path, relative_path)), exist_ok=True)
+    mode = "wb" if isinstance(source, bytes) else "w"
+    with open(os.path.join(root_path, relative_path), mode) as source_file:
+      source_file.write(source)
+
+"""
+Write a class file as javac writes it, with the members but without any code or other attributes
+
+:param class_name: the binary name of the class (e.g. com/example/Order)
+:param access_flags: the access flags of the class
+:param fields: a list of `(access_flags, name, descriptor)` tuples
+:param methods: a list of `(access_flags, name, descriptor)` tuples
+:returns: the contents of the class file
+"""
+def write_class_file(class_name, access_flags, fields, methods):
+  constant_pool = []
+  strings = {}
+  def add_string(string):
+    if string not in strings:
+      encoded = string.encode("utf-8")
+      constant_pool.append(struct.pack(">BH", 1, len(encoded)) + encoded)
+      strings[string] = len(constant_pool)
+    return strings[string]
+  def add_class(name):
+    name_index = add_string(name)
+    constant_pool.append(struct.pack(">BH", 7, name_index))
+    return len(constant_pool)
+  this_class = add_class(class_name)
+  super_class = add_class("java/lang/Enum" if access_flags & 0x4000 != 0 else "java/lang/Object")
+  members = [[struct.pack(">HHHH", flags, add_string(name), add_string(descriptor), 0) for flags, name, descriptor in member_list] for member_list in [fields, methods]]
+
+  class_file = struct.pack(">IHHH", 0xCAFEBABE, 0, 61, len(constant_pool) + 1) + b"".join(constant_pool)
+  class_file += struct.pack(">HHHH", access_flags, this_class, super_class, 0)
+  for member_list in members:
+    class_file += struct.pack(">H", len(member_list)) + b"".join(member_list)
+  return class_file + struct.pack(">H", 0)
+
+"""
+Create word embeddings for the words of a project
+
+:param root_path: the path to the root package of the project
+:param vectors_path: the path to write the vocabulary vectors to
+:returns: VocabularyVectors with a random vector for every word of the project
+"""
+def create_project_model(root_path, vectors_path):
+  vocabulary = get_project_vocabulary(root_path)
+  vectors = np.random.default_rng(0).standard_normal((len(vocabulary), 16)).astype(np.float32)
+  with open(vectors_path, "wb") as vectors_file:
+    np.savez(vectors_file, words=np.array(vocabulary, dtype=str), vectors=vectors, model=np.array("edgecasechecks"))
+  return VocabularyVectors(vectors_path)
+
+"""
+Analyze a project as packageanalyzer.py does
+
+:param root_path: the path to the root package of the project
+:param model: the model to use for retrieving word embeddings
+:returns: the ProjectionBreakdown with the projections of the project
+"""
+def analyze(root_path, model):
+  breakdown = ProjectionBreakdown(keep_values=True)
+  find_all_projections_recursively(root_path, breakdown, model)
+  return breakdown
+
+"""
+Organize a project as packageorganizer.py does
+
+:param root_path: the path to the root package of the project
+:param model: the model to use for retrieving word embeddings
+:returns: the recommended hierarchy in the configured output format
+"""
+def organize(root_path, model):
+  package_paths = [root_path + "/" + package for package in sorted(list_directory(root_path)[0])]
+  package_accumulators = get_package_embedding_accumulators(package_paths + [root_path], model)
+  package_embeddings = {package_path: package_accumulators[package_path].mean() for package_path in package_paths if package_accumulators[package_path].count > 0}
+  root_package_embedding = package_accumulators[root_path].mean()
+  pairwise_projections = calculate_configured_pairwise_projections(package_embeddings, root_package_embedding, root_path, PROJECTION_THRESHOLD)
+  is_contained_in, projection_values = recommend_hierarchy(pairwise_projections, package_embeddings, root_package_embedding, package_accumulators, root_path, PROJECTION_THRESHOLD)
+  output_file = io.StringIO()
+  write_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, root_package_embedding is not None, PROJECTION_THRESHOLD, output_file)
+  return output_file.getvalue()
+
+"""
+Classes whose names have no letters (e.g. _1 or $) have no class name words: they are embedded by their identifiers alone,
+or left out of the embedding of their package if they have no identifiers either
+
+:param directory: a temporary directory to write the project to
+:returns: a list of failures
+"""
+def check_classes_without_words(directory):
+  root_path = os.path.join(directory, "nowords")
+  write_project(root_path, {
+    "orders/Order.java": "public class Order { private int quantity; public int getQuantity() { return quantity; } }",
+    "orders/_1.java": "public class _1 { private int amount; }",
+    "orders/$.java": "class $ { }",
+    "orders/items/OrderItem.java": "public class OrderItem { private int price; }",
+    "empty/_2.java": "class _2 { }",
+    "invoices/Invoice.java": "public class Invoice { private int total; }",
+  })
+  model = create_project_model(root_path, os.path.join(directory, "nowords.npz"))
+  failures = []
+
+  if get_class_embedding(root_path + "/orders/$.java", model) is not None:
+    failures.append("a class without any words has an embedding")
+  if get_class_embedding(root_path + "/orders/_1.java", model) is None:
+    failures.append("a class without words in its name but with identifiers has no embedding")
+  expected_accumulator = EmbeddingAccumulator()
+  for class_path in [root_path + "/orders/Order.java", root_path + "/orders/_1.java"]:
+    expected_accumulator.add(get_class_embedding(class_path, model))
+  if not np.array_equal(get_package_embedding(root_path + "/orders", model), expected_accumulator.mean()):
+    failures.append("a class without any words is not left out of the embedding of its package")
+  if get_package_embedding(root_path + "/empty", model) is not None:
+    failures.append("a package of classes without any words has an embedding")
+
+  try:
+    analyze(root_path, model)
+    organize(root_path, model)
+  except Exception as error:
+    failures.append("classes without any words abort the run: " + type(error).__name__ + ": " + str(error))
+  return failures
+
+"""
+An unsupported OUTPUT_FORMAT is rejected instead of silently writing another format
+
+:param directory: a temporary directory to write the project to
+:returns: a list of failures
+"""
+def check_unknown_output_format(directory):
+  root_path = os.path.join(directory, "outputformat")
+  write_project(root_path, {
+    "orders/Order.java": "public class Order { private int quantity; }",
+    "invoices/Invoice.java": "public class Invoice { private int total; }",
+  })
+  model = create_project_model(root_path, os.path.join(directory, "outputformat.npz"))
+  failures = []
+
+  output_format = packageorganizer.OUTPUT_FORMAT
+  try:
+    for checked_format in packageorganizer.OUTPUT_FORMATS + ("xml",):
+      packageorganizer.OUTPUT_FORMAT = checked_format
+      try:
+        organize(root_path, model)
+        if checked_format not in packageorganizer.OUTPUT_FORMATS:
+          failures.append("the unknown output format " + repr(checked_format) + " is accepted")
+      except ValueError:
+        if checked_format in packageorganizer.OUTPUT_FORMATS:
+          failures.append("the output format " + repr(checked_format) + " is rejected")
+  finally:
+    packageorganizer.OUTPUT_FORMAT = output_format
+  return failures
+
+"""
+NaN and infinite projection values (e.g. onto an embedding whose norm is zero) are counted separately instead of aborting
+the statistics
+
+:param directory: unused
+:returns: a list of failures
+"""
+def check_non_finite_projections(directory):
+  failures = []
+  statistics = ProjectionStatistics(keep_values=True)
+  other_statistics = ProjectionStatistics()
+  try:
+    for value in [0.5, float("nan"), np.float32(np.inf), 0.7]:
+      statistics.append(value)
+    other_statistics.append(-np.inf)
+    statistics.merge(other_statistics)
+  except (ValueError, OverflowError) as error:
+    return ["a non-finite projection value aborts the statistics: " + type(error).__name__ + ": " + str(error)]
+  if len(statistics) != 2 or statistics.non_finite_count != 3:
+    failures.append("expected 2 finite and 3 non-finite values, got " + str(len(statistics)) + " and " + str(statistics.non_finite_count))
+  if statistics.values != [0.5, 0.7] or statistics.minimum != 0.5 or statistics.maximum != 0.7 or sum(count for _, _, count in statistics.get_histogram()) != 2:
+    failures.append("a non-finite projection value is part of the statistics")
+
+  breakdown = ProjectionBreakdown(keep_values=True)
+  breakdown.add(float("nan"), ProjectionCategory.CLASS_PACKAGE_ON_PARENT, 1, PackageType.CLASSES_BUT_NO_CLASS_PACKAGES, "root/nan")
+  breakdown.add(0.5, ProjectionCategory.CLASS_PACKAGE_PAIRWISE, 1, PackageType.CLASSES_BUT_NO_CLASS_PACKAGES, "root/finite")
+  try:
+    print_results(breakdown, io.StringIO())
+  except (TypeError, ValueError, ZeroDivisionError) as error:
+    failures.append("a category with only non-finite projection values aborts the results: " + type(error).__name__ + ": " + str(error))
+  return failures
+
+"""
+Packages with a class that could not be parsed cleanly are not stored in the embedding cache, while the embeddings of the
+other packages are
+
+:param directory: a temporary directory to write the project and the cache to
+:returns: a list of failures
+"""
+def check_parse_problems_not_cached(directory):
+  root_path = os.path.join(directory, "parseproblems")
+  write_project(root_path, {
+    "orders/Order.java": "public class Order { private int quantity; }",
+    "broken/Broken.java": "public class Broken { private int total; public void settle( { }",
+    "broken/Invoice.java": "public class Invoice { private int total; }",
+  })
+  model = create_project_model(root_path, os.path.join(directory, "parseproblems.npz"))
+  failures = []
+
+  package_paths = [root_path + "/orders", root_path + "/broken"]
+  with PackageEmbeddingCache(os.path.join(directory, "parseproblems.sqlite"), "edgecasechecks") as embedding_cache:
+    for parse_report in [ParseReport(), None]:
+      get_package_embedding_accumulators(package_paths, model, parse_report=parse_report, embedding_cache=embedding_cache)
+    if len(embedding_cache) != 1:
+      failures.append("expected only the cleanly parsed package to be stored, but " + str(len(embedding_cache)) + " packages are")
+    if embedding_cache.get(embedding_cache.get_package_key(get_class_paths(root_path + "/orders"))) is None:
+      failures.append("the cleanly parsed package is not stored")
+    if embedding_cache.get(embedding_cache.get_package_key(get_class_paths(root_path + "/broken"))) is not None:
+      failures.append("a package with a class that could not be parsed is stored")
+  return failures
+
+"""
+A compiled class has the identifiers of its source, also if it is an enum (whose members javalang does not expose, so
+that it has no identifiers at all)
+
+:param directory: a temporary directory to write the sources and class files to
+:returns: a list of failures
+"""
+def check_class_files_match_sources(directory):
+  root_path = os.path.join(directory, "classfiles")
+  write_project(root_path, {
+    "orders/OrderStatus.java": "public enum OrderStatus { OPEN, CLOSED; private final String statusLabel = \"\"; public String getStatusLabel() { return statusLabel; } }",
+    "orders/OrderStatus.class": write_class_file("orders/OrderStatus", 0x4031, [
+      (0x4019, "OPEN", "Lorders/OrderStatus;"),
+      (0x4019, "CLOSED", "Lorders/OrderStatus;"),
+      (0x0012, "statusLabel", "Ljava/lang/String;"),
+      (0x101A, "$VALUES", "[Lorders/OrderStatus;"),
+    ], [
+      (0x0009, "values", "()[Lorders/OrderStatus;"),
+      (0x0009, "valueOf", "(Ljava/lang/String;)Lorders/OrderStatus;"),
+      (0x0002, "<init>", "(Ljava/lang/String;I)V"),
+      (0x0001, "getStatusLabel", "()Ljava/lang/String;"),
+      (0x100A, "$values", "()[Lorders/OrderStatus;"),
+      (0x0008, "<clinit>", "()V"),
+    ]),
+    "orders/Order.java": "public class Order { private int quantity; public Order() { } public int getQuantity() { return quantity; } }",
+    "orders/Order.class": write_class_file("orders/Order", 0x0021, [
+      (0x0002, "quantity", "I"),
+    ], [
+      (0x0001, "<init>", "()V"),
+      (0x0001, "getQuantity", "()I"),
+    ]),
+  })
+  model = create_project_model(root_path, os.path.join(directory, "classfiles.npz"))
+  failures = []
+
+  for class_name in ["OrderStatus", "Order"]:
+    class_path = root_path + "/orders/" + class_name
+    source_identifiers = get_class_identifiers(class_path + ".java")
+    class_file_identifiers = get_class_identifiers(class_path + ".class")
+    if class_file_identifiers != source_identifiers:
+      failures.append("the identifiers of the compiled " + class_name + " " + str(class_file_identifiers) + " differ from the ones of its source " + str(source_identifiers))
+    elif not np.array_equal(get_class_embedding(class_path + ".class", model), get_class_embedding(class_path + ".java", model)):
+      failures.append("the embedding of the compiled " + class_name + " differs from the one of its source")
+  return failures
+
+"""
+The key of a cached package changes with the parser versions and with the parsing and summation settings set at runtime,
+also for files whose content hashes are remembered, and the remembered content hashes are limited in number
+
+:param directory: a temporary directory to write the project and the cache to
+:returns: a list of failures
+"""
+def check_cache_keys_follow_versions(directory):
+  root_path = os.path.join(directory, "cachekeys")
+  write_project(root_path, {
+    "orders/Order.java": "public class Order { private int quantity; }",
+    "orders/Invoice.java": "public class Invoice { private int total; }",
+    "orders/Customer.java": "public class Customer { private String name; }",
+  })
+  class_paths = get_class_paths(root_path + "/orders")
+  failures = []
+
+  with PackageEmbeddingCache(os.path.join(directory, "cachekeys.sqlite"), "edgecasechecks", max_files=2) as embedding_cache:
+    key = embedding_cache.get_package_key(class_paths)
+    for module, setting, value in [(identifiercache, "PARSER_VERSION", -1), (identifiercache, "CLASS_FILE_READER_VERSION", -1), (common, "PAIRWISE_SUMMATION", not common.PAIRWISE_SUMMATION), (common, "PARSE_TIME_BUDGET", -1), (common, "MAX_SOURCE_SIZE", -1)]:
+      original_value = getattr(module, setting)
+      setattr(module, setting, value)
+      try:
+        if embedding_cache.get_package_key(class_paths) == key:
+          failures.append("the package key does not change with " + module.__name__ + "." + setting)
+      finally:
+        setattr(module, setting, original_value)
+    if embedding_cache.get_package_key(class_paths) != key:
+      failures.append("the package key changes with the number of remembered file hashes")
+    if embedding_cache.get_statistics()["files"] != 2:
+      failures.append("expected 2 remembered file hashes, but " + str(embedding_cache.get_statistics()["files"]) + " are remembered")
+  return failures
+
+"""
+Reading from a source archive keeps no handles open after the sources are closed, and a directory on the file system
+whose name looks like a git revision (`repo@rev!`) is read from the file system
+
+:param directory: a temporary directory to write the project and the archive to
+:returns: a list of failures
+"""
+def check_sources_on_file_system_and_closed(directory):
+  root_path = os.path.join(directory, "sources@v1!")
+  write_project(root_path, {
+    "orders/Order.java": "public class Order { private int quantity; }",
+  })
+  archive_path = os.path.join(directory, "sources.zip")
+  with zipfile.ZipFile(archive_path, "w") as archive:
+    archive.write(os.path.join(root_path, "orders", "Order.java"), "orders/Order.java")
+  failures = []
+
+  if list_directory(root_path + "/orders") != ([], ["Order.java"]):
+    failures.append("the directory " + root_path + " is not read from the file system")
+  if read_source(archive_path + "!/orders/Order.java") != read_source(root_path + "/orders/Order.java"):
+    failures.append("the class in the archive differs from the one it was written from")
+  close_sources()
+  if len(sourceprovider.archives) > 0:
+    failures.append("the archive is still open after the sources are closed")
+  if read_source(archive_path + "!/orders/Order.java") != read_source(root_path + "/orders/Order.java"):
+    failures.append("the class in the archive cannot be read after the sources are closed")
+  close_sources()
+  return failures
+
+CHECKS = {
+  "classes without words": check_classes_without_words,
+  "unknown output format": check_unknown_output_format,
+  "non-finite projections": check_non_finite_projections,
+  "parse problems not cached": check_parse_problems_not_cached,
+  "class files match sources": check_class_files_match_sources,
+  "cache keys follow versions": check_cache_keys_follow_versions,
+  "sources on file system and closed": check_sources_on_file_system_and_closed,
+}
+
+if __name__ == "__main__":
+  failures = []
+  with tempfile.TemporaryDirectory() as directory:
+    for check_name, check in CHECKS.items():
+      check_failures = check(directory)
+      print(check_name + ":", "ok" if len(check_failures) == 0 else "FAILED")
+      failures += [check_name + ": " + failure for failure in check_failures]
+
+  print("---")
+  if len(failures) > 0:
+    for failure in failures:
+      print("FAILED:", failure)
+    sys.exit(1)
+  print("All checks passed")
@@ -0,0 +1,248 @@
+import os
+import time
+import hashlib
+import sqlite3
+import numpy as np
+import common
+import identifiercache
+from common import EmbeddingAccumulator, read_class_source
+from identifiercache import content_hash, MAX_LOOKUP_BATCH
+from sourceprovider import get_source_status
+
+# Default maximum number of bytes of embedding data kept in the cache
+MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+# Default maximum number of file content hashes remembered by the cache
+MAX_FILE_HASHES = 1000000
+
+"""
+Persistent store of package embeddings keyed by the contents of the package and the model
+
+The key of a package is derived from the names and content hashes of its .java files (sorted, so the order in which they
+are listed does not matter), the id of the model, the versions of the parsers and the settings that change how classes
+are parsed and embeddings are added up (PAIRWISE_SUMMATION, PARSE_TIME_BUDGET and MAX_SOURCE_SIZE, read when the key is
+determined), but not from the path of the package. A package that occurs verbatim in another project, branch or run is
+therefore found under the same key and its classes do not have to be parsed or embedded again. The content hash of a file
+is remembered together with its size and modification time (the CRC-32 for an entry of a source archive), so unchanged
+files are not even read to determine the key. The content hash of a file in a git revision is remembered by its blob id,
+so a file that is the same in several revisions is only read once.
+
+The running sum of the class embeddings is stored rather than the mean, so cached packages can be merged like any other
+EmbeddingAccumulator. When the stored embeddings exceed `max_size` bytes, the least recently used packages are evicted;
+when more than `max_files` content hashes are remembered, the least recently used ones are forgotten.
+Like the IdentifierCache, the store is an SQLite database in WAL mode that can be shared between processes.
+
+Example:
+  with PackageEmbeddingCache("embeddings.sqlite", "wiki-news-300d-1M-subword.bin") as embedding_cache:
+    class_accumulator = get_package_embedding_accumulator(package_path, model, embedding_cache=embedding_cache)
+"""
+class PackageEmbeddingCache:
+  """
+  :param database_path: the path to the SQLite database file (created if it does not exist)
+  :param model_id: the id of the model that produces the embeddings (e.g. the name of its file)
+  :param max_size: the maximum number of bytes of embedding data to keep
+  :param max_files: the maximum number of file content hashes to remember
+  :param timeout: the number of seconds to wait for another process that is writing to the database
+  """
+  def __init__(self, database_path, model_id, max_size=MAX_CACHE_SIZE, max_files=MAX_FILE_HASHES, timeout=60):
+    self.model_id = model_id
+    self.max_size = max_size
+    self.max_files = max_files
+    self.connection = sqlite3.connect(database_path, timeout=timeout)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("PRAGMA synchronous=NORMAL")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS packages (key BLOB PRIMARY KEY, total BLOB NOT NULL, count INTEGER NOT NULL, dtype TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID")
+    self.connection.execute("CREATE INDEX IF NOT EXISTS packages_last_used ON packages (last_used)")
+    # The remembered file hashes are only a shortcut, so a table from before they were evicted is simply dropped
+    if "last_used" not in [column[1] for column in self.connection.execute("PRAGMA table_info(file_hashes)")]:
+      self.connection.execute("DROP TABLE IF EXISTS file_hashes")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime INTEGER NOT NULL, hash BLOB NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID")
+    self.connection.execute("CREATE INDEX IF NOT EXISTS file_hashes_last_used ON file_hashes (last_used)")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS statistics (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID")
+    self.connection.commit()
+    self.hits = 0
+    self.misses = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    with self.connection:
+      self.connection.executemany("INSERT INTO statistics VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", [("hits", self.hits), ("misses", self.misses)])
+    self.connection.close()
+
+  """
+  Determine the content hashes of class files, reading a file only if it changed since its hash was last determined
+
+  :param class_paths: the paths to the .java files
+  :returns: a list of the content hashes of the files (see `identifiercache.content_hash`)
+  """
+  def get_file_hashes(self, class_paths):
+    now = time.time()
+    file_hashes = []
+    used_keys = []
+    new_rows = []
+    for class_path in class_paths:
+      key, size, version = get_source_status(class_path)
+      row = self.connection.execute("SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime = ?", (key, size, version)).fetchone()
+      if row is None:
+        row = (content_hash(read_class_source(class_path)),)
+        new_rows.append((key, size, version, row[0], now))
+      else:
+        used_keys.append((now, key))
+      file_hashes.append(row[0])
+    if len(class_paths) > 0:
+      with self.connection:
+        self.connection.executemany("UPDATE file_hashes SET last_used = ? WHERE path = ?", used_keys)
+        self.connection.executemany("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)", new_rows)
+        if len(new_rows) > 0:
+          self.evict_file_hashes()
+    return file_hashes
+
+  """
+  Determine the key of a package given the classes it contains
+
+  :param class_paths: the paths to the .java files of the package
+  :returns: a digest of the model id, the parser versions, the parsing and summation settings and the names and content
+            hashes of the files
+  """
+  def get_package_key(self, class_paths):
+    # Read through the modules, so that settings changed at runtime are part of the key
+    settings = (identifiercache.PARSER_VERSION, identifiercache.CLASS_FILE_READER_VERSION, common.PAIRWISE_SUMMATION, common.PARSE_TIME_BUDGET, common.MAX_SOURCE_SIZE)
+    digest = hashlib.sha256(self.model_id.encode("utf-8") + b"\0" + repr(settings).encode("ascii") + b"\0")
+    for name, file_hash in sorted(zip([os.path.basename(class_path) for class_path in class_paths], self.get_file_hashes(class_paths))):
+      digest.update(name.encode("utf-8", "surrogatepass") + b"\0" + file_hash)
+    return digest.digest()
+
+  """
+  Look up the running sum of the class embeddings of a single package
+
+  :param key: the key of the package as returned by `get_package_key`
+  :returns: an EmbeddingAccumulator or None if the package is not in the store
+  """
+  def get(self, key):
+    return self.get_many([key]).get(key)
+
+  """
+  Look up the running sums of the class embeddings of multiple packages at once, marking them as recently used
+
+  :param keys: the keys of the packages
+  :returns: a dictionary of key to EmbeddingAccumulator for the packages that are in the store
+  """
+  def get_many(self, keys):
+    keys = list(set(keys))
+    found = {}
+    for i in range(0, len(keys), MAX_LOOKUP_BATCH):
+      batch = keys[i:i + MAX_LOOKUP_BATCH]
+      rows = self.connection.execute("SELECT key, total, count, dtype FROM packages WHERE key IN (" + ",".join("?" * len(batch)) + ")", batch)
+      for key, total, count, dtype in rows:
+        # The stored sum is a single partial sum, regardless of how it was added up
+        accumulator = EmbeddingAccumulator(pairwise=False)
+        if count > 0:
+          accumulator.total = np.frombuffer(total, dtype=np.float64).copy()
+          accumulator.count = count
+          accumulator.dtype = np.dtype(dtype)
+        found[key] = accumulator
+    if len(found) > 0:
+      now = time.time()
+      with self.connection:
+        self.connection.executemany("UPDATE packages SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+    self.hits += len(found)
+    self.misses += len(keys) - len(found)
+    return found
+
+  """
+  Store the running sum of the class embeddings of a single package
+
+  :param key: the key of the package as returned by `get_package_key`
+  :param accumulator: the EmbeddingAccumulator of the package
+  """
+  def put(self, key, accumulator):
+    self.put_many({key: accumulator})
+
+  """
+  Store the running sums of the class embeddings of multiple packages in a single transaction, then evict the least
+  recently used packages until the store fits in `max_size`
+
+  :param items: a dictionary of key to EmbeddingAccumulator
+  """
+  def put_many(self, items):
+    if len(items) == 0:
+      return
+    now = time.time()
+    rows = []
+    for key, accumulator in items.items():
+      total = accumulator.get_total().tobytes() if accumulator.count > 0 else b""
+      dtype = accumulator.dtype.str if accumulator.count > 0 else ""
+      rows.append((key, total, accumulator.count, dtype, len(total), now))
+    with self.connection:
+      self.connection.executemany("INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?)", rows)
+      self.evict()
+
+  """
+  Evict the least recently used packages until the store fits in `max_size`
+  """
+  def evict(self):
+    excess = self.get_size() - self.max_size
+    if excess <= 0:
+      return
+    evicted_keys = []
+    for key, size in self.connection.execute("SELECT key, size FROM packages ORDER BY last_used"):
+      if excess <= 0:
+        break
+      evicted_keys.append((key,))
+      excess -= size
+    self.connection.executemany("DELETE FROM packages WHERE key = ?", evicted_keys)
+
+  """
+  Forget the least recently used file hashes until at most `max_files` are remembered
+  """
+  def evict_file_hashes(self):
+    excess = self.connection.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0] - self.max_files
+    if excess > 0:
+      self.connection.execute("DELETE FROM file_hashes WHERE path IN (SELECT path FROM file_hashes ORDER BY last_used LIMIT ?)", (excess,))
+
+  """
+  :returns: the number of bytes of embedding data in the store
+  """
+  def get_size(self):
+    return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM packages").fetchone()[0]
+
+  """
+  Count the number of packages in the store
+
+  :returns: the number of stored packages
+  """
+  def __len__(self):
+    return self.connection.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+
+  """
+  Get the statistics of the store
+
+  :returns: a dictionary with the number of packages, the size of their embedding data, the number of remembered file hashes
+            and the number of lookups that were hits and misses (over all runs that closed the store)
+  """
+  def get_statistics(self):
+    statistics = dict(self.connection.execute("SELECT name, value FROM statistics"))
+    return {
+      "packages": len(self),
+      "size": self.get_size(),
+      "files": self.connection.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0],
+      "hits": statistics.get("hits", 0) + self.hits,
+      "misses": statistics.get("misses", 0) + self.misses,
+    }
+
+if __name__ == "__main__":
+  database_path = input("Enter the path to the package embedding cache: ")
+  with PackageEmbeddingCache(database_path, "") as embedding_cache:
+    statistics = embedding_cache.get_statistics()
+    lookups = statistics["hits"] + statistics["misses"]
+    hit_rate = 100 * statistics["hits"] / lookups if lookups > 0 else 0
+    print("Number of cached packages:       ", statistics["packages"])
+    print("Size of the embeddings (bytes):  ", statistics["size"], "of at most", embedding_cache.max_size)
+    print("Number of remembered file hashes:", statistics["files"])
+    print("Hits / misses:                   ", statistics["hits"], "/", statistics["misses"], "(%.1f%% hits)" % hit_rate)
+    print("Size on disk (bytes):            ", os.path.getsize(database_path))
@@ -0,0 +1,275 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from common import EmbeddingAccumulator, blob_identifiers, get_class_paths, get_class_name_words, get_class_embedding_from_identifiers, parse_class_identifiers, read_class_source, get_identifier_words
+from identifiercache import content_hash
+from sourceprovider import get_blob_id
+from tolerantparsing import ParseReport
+
+"""
+Marks the end of the stream of files put on the read queue
+"""
+END_OF_FILES = None
+
+"""
+Pipelined computation of class embeddings that overlaps reading, parsing and embedding
+
+Files are prefetched by reader threads into a bounded queue, parsed by a pool of processes and embedded in batches in which
+every distinct word is looked up in the model only once. The read queue and the number of files being parsed at the same
+time are bounded, so that memory stays bounded regardless of how many files are processed. If an IdentifierCache is given,
+the files that were read are looked up in it in bulk and only the ones that are not in it are parsed. Files in git
+revisions whose blob was parsed before during the run are not parsed again either (see `common.BlobIdentifiers`).
+
+Example:
+  with EmbeddingPipeline() as pipeline:
+    package_embedding = get_package_embedding(package_path, model, pipeline)
+"""
+class EmbeddingPipeline:
+  """
+  :param reader_threads: the number of threads that read files at the same time
+  :param prefetch: the maximum number of files that are read but not yet being parsed
+  :param parse_workers: the number of processes that parse files (defaults to the number of CPUs)
+  :param max_in_flight: the maximum number of files that are being parsed at the same time
+  :param batch_size: the number of classes of which the identifiers or word embeddings are looked up together
+  :param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+  :param parse_report: the ParseReport in which files that could not be parsed are recorded (defaults to a new one)
+  """
+  def __init__(self, reader_threads=4, prefetch=64, parse_workers=None, max_in_flight=64, batch_size=32, identifier_cache=None, parse_report=None):
+    self.reader_threads = reader_threads
+    self.prefetch = prefetch
+    self.parse_workers = parse_workers
+    self.max_in_flight = max_in_flight
+    self.batch_size = batch_size
+    self.identifier_cache = identifier_cache
+    self.parse_report = parse_report if parse_report is not None else ParseReport()
+    self.parse_pool = None
+    self.parsed_identifiers = {}
+
+  def __enter__(self):
+    import multiprocessing # imported on first use, like ProcessPoolExecutor, which pulls it in
+    from concurrent.futures import ProcessPoolExecutor
+    # The parse workers are started while the reader threads are running, and a process forked from a process with running
+    # threads can deadlock on a lock one of them held. So they are started by a fork server, or spawned where there is none
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context(start_method))
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.parse_pool.shutdown()
+    self.parse_pool = None
+
+  """
+  Find the running sums of the class embeddings of multiple packages, streaming the classes of all packages through the pipeline
+
+  :param package_paths: the paths to the directories of the packages
+  :param model: the fasttext model to use for retrieving word embeddings
+  :returns: a generator of `(package_path, accumulator)` tuples in the order of `package_paths`
+  """
+  def get_package_embedding_accumulators(self, package_paths, model):
+    class_paths_per_package = [(package_path, get_class_paths(package_path)) for package_path in package_paths]
+    class_embeddings = self.get_class_embeddings([class_path for _, class_paths in class_paths_per_package for class_path in class_paths], model)
+    for package_path, class_paths in class_paths_per_package:
+      class_accumulator = EmbeddingAccumulator()
+      for _ in class_paths:
+        _, class_embedding = next(class_embeddings)
+        class_accumulator.add(class_embedding)
+      yield package_path, class_accumulator
+
+  """
+  Find the embeddings of classes given their paths
+
+  :param class_paths: the file paths to the classes
+  :param model: the fasttext model to use for retrieving word embeddings
+  :returns: a generator of `(class_path, class_embedding)` tuples in the order of `class_paths`
+  """
+  def get_class_embeddings(self, class_paths, model):
+    if self.parse_pool is None:
+      raise RuntimeError("EmbeddingPipeline must be used as a context manager")
+
+    read_queue = queue.Queue(maxsize=self.prefetch)
+    stopped = threading.Event()
+    reader = threading.Thread(target=self.read_files, args=(class_paths, read_queue, stopped), daemon=True)
+    reader.start()
+
+    in_flight = deque()
+    batch = []
+    try:
+      end_of_files = False
+      while not end_of_files:
+        read_files, end_of_files = self.take(read_queue)
+        in_flight.extend(self.parse(read_files))
+
+        # Backpressure: wait for the oldest file to be parsed before reading on
+        while len(in_flight) >= self.max_in_flight:
+          batch.append(self.collect(in_flight.popleft()))
+          if len(batch) >= self.batch_size:
+            yield from self.embed_batch(batch, model)
+            batch = []
+
+      while len(in_flight) > 0:
+        batch.append(self.collect(in_flight.popleft()))
+        if len(batch) >= self.batch_size:
+          yield from self.embed_batch(batch, model)
+          batch = []
+      yield from self.embed_batch(batch, model)
+    finally:
+      # Unblock the reader thread in case the consumer stopped early or an error occurred
+      stopped.set()
+      while reader.is_alive():
+        try:
+          read_queue.get(timeout=0.1)
+        except queue.Empty:
+          pass
+      for _, _, _, future in in_flight:
+        future.cancel()
+
+  """
+  Take the files that were read from the read queue, waiting for at least one and taking at most batch_size
+
+  :param read_queue: the queue that `read_files` puts files on
+  :returns: a tuple `(read_files, end_of_files)` where read_files is a list of `(class_path, src_text)` tuples
+  """
+  def take(self, read_queue):
+    read_files = []
+    item = read_queue.get()
+    while item is not END_OF_FILES:
+      class_path, src_text = item
+      if isinstance(src_text, Exception):
+        raise src_text
+      read_files.append(item)
+      if len(read_files) >= self.batch_size:
+        return read_files, False
+      try:
+        item = read_queue.get_nowait()
+      except queue.Empty:
+        return read_files, False
+    return read_files, True
+
+  """
+  Start parsing files, reusing the identifiers remembered by blob id and the ones in the identifier cache where possible
+
+  :param read_files: a list of `(class_path, src_text)` tuples
+  :returns: a list of `(class_path, key, blob_id, future)` tuples where key is the content hash of a file that was not in
+            the identifier cache (otherwise None) and blob_id is the blob id of a file in a git revision whose identifiers
+            are not remembered yet (otherwise None)
+  """
+  def parse(self, read_files):
+    parsing = []
+    unparsed_files = []
+    for class_path, src_text in read_files:
+      blob_id = get_blob_id(class_path)
+      remembered = blob_identifiers.get(blob_id) if blob_id is not None else None
+      if remembered is not None:
+        future = Future()
+        future.set_result(remembered)
+        parsing.append((class_path, None, None, future))
+      else:
+        parsing.append(None)
+        unparsed_files.append((len(parsing) - 1, class_path, src_text, blob_id))
+
+    keys = [content_hash(src_text) for _, _, src_text, _ in unparsed_files] if self.identifier_cache is not None else [None] * len(unparsed_files)
+    cached_identifiers = self.identifier_cache.get_many(keys) if self.identifier_cache is not None else {}
+    for (position, class_path, src_text, blob_id), key in zip(unparsed_files, keys):
+      if key in cached_identifiers:
+        future = Future()
+        future.set_result((cached_identifiers[key], None))
+        parsing[position] = (class_path, None, blob_id, future)
+      else:
+        parsing[position] = (class_path, key, blob_id, self.parse_pool.submit(parse_class_identifiers, src_text))
+    return parsing
+
+  """
+  Read files in order into the read queue, followed by END_OF_FILES
+
+  :param class_paths: the file paths to read
+  :param read_queue: the bounded queue to put `(class_path, src_text)` tuples on
+  :param stopped: an event that is set when the consumer no longer needs any files
+  """
+  def read_files(self, class_paths, read_queue, stopped):
+    with ThreadPoolExecutor(max_workers=self.reader_threads) as read_pool:
+      pending = deque()
+      for class_path in class_paths:
+        if stopped.is_set():
+          return
+        pending.append((class_path, read_pool.submit(read_class_source, class_path)))
+        if len(pending) >= self.reader_threads:
+          if not self.put(read_queue, self.result(pending.popleft()), stopped):
+            return
+      while len(pending) > 0:
+        if not self.put(read_queue, self.result(pending.popleft()), stopped):
+          return
+    self.put(read_queue, END_OF_FILES, stopped)
+
+  """
+  Wait for a read to complete
+
+  :param pending_read: a `(class_path, future)` tuple
+  :returns: a `(class_path, src_text)` tuple where src_text is the exception if reading failed
+  """
+  def result(self, pending_read):
+    class_path, future = pending_read
+    try:
+      return class_path, future.result()
+    except Exception as exception:
+      return class_path, exception
+
+  """
+  Put an item on the read queue, blocking while the queue is full unless the consumer stopped
+
+  :returns: whether the item was put on the queue
+  """
+  def put(self, read_queue, item, stopped):
+    while not stopped.is_set():
+      try:
+        read_queue.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  """
+  Wait for a file to be parsed
+
+  :param parsing: a `(class_path, key, blob_id, future)` tuple
+  :returns: a `(class_path, field_identifiers, method_identifiers)` tuple
+  """
+  def collect(self, parsing):
+    class_path, key, blob_id, future = parsing
+    (field_identifiers, method_identifiers), problem = future.result()
+    self.parse_report.record(class_path, problem)
+    if blob_id is not None:
+      blob_identifiers.put(blob_id, (field_identifiers, method_identifiers), problem)
+    # Problems such as timeouts depend on the machine, so only cleanly parsed classes are stored
+    if key is not None and problem is None:
+      self.parsed_identifiers[key] = (field_identifiers, method_identifiers)
+    return class_path, field_identifiers, method_identifiers
+
+  """
+  Embed a batch of parsed classes, looking up each distinct word in the batch only once
+
+  :param batch: a list of `(class_path, field_identifiers, method_identifiers)` tuples
+  :param model: the fasttext model to use for retrieving word embeddings
+  :returns: a list of `(class_path, class_embedding)` tuples
+  """
+  def embed_batch(self, batch, model):
+    if self.identifier_cache is not None:
+      self.identifier_cache.put_many(self.parsed_identifiers)
+      self.parsed_identifiers = {}
+
+    words = set()
+    for class_path, field_identifiers, method_identifiers in batch:
+      words.update(get_class_name_words(class_path))
+      words.update(get_identifier_words(field_identifiers, method_identifiers))
+    word_vectors = WordVectorBatch({word: model.get_word_vector(word) for word in words})
+    return [(class_path, get_class_embedding_from_identifiers(class_path, field_identifiers, method_identifiers, word_vectors)) for class_path, field_identifiers, method_identifiers in batch]
+
+"""
+Word embeddings that were looked up for a batch, usable in place of the fasttext model
+"""
+class WordVectorBatch:
+  def __init__(self, word_vectors):
+    self.word_vectors = word_vectors
+
+  def get_word_vector(self, word):
+    return self.word_vectors[word]
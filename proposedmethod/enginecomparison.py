@@ -0,0 +1,99 @@
+import sys
+import time
+import numpy as np
+from packageorganizer import discover_hierarchy, discover_hierarchy_arborescence
+from organizerbenchmark import ROOT, PROJECTION_THRESHOLD, SIZES, QUICK_SIZES, MAX_SCALING_EXPONENT, CASES, canonicalize, get_scaling_exponent
+
+"""
+Comparison of the greedy discovery engine (`discover_hierarchy`) and the arborescence engine (`discover_hierarchy_arborescence`)
+
+Both engines are run on the generated cases of organizerbenchmark.py. For every case, the report lists the runtime of
+each engine and how much the recommended hierarchies agree:
+  same parent: the share of packages that are (as part of their group) assigned to the same parent by both engines
+  same group:  the share of packages that are in the same group (or alone) in both hierarchies
+
+The arborescence engine has to recommend the hierarchies that are known by construction (chain, rings) as well, and its
+runtime has to scale about linearly in the number of projections (MAX_SCALING_EXPONENT).
+
+Run with `py enginecomparison.py` (add `--quick` to only compare the smallest sizes).
+"""
+
+"""
+Determine the group and the parent of every package in a hierarchy
+
+:param is_contained_in: the hierarchy as returned by `discover_hierarchy`
+:returns: dictionary of package to a tuple `(group, parent)` where group is the frozenset of the packages in its group
+"""
+def get_package_placements(is_contained_in):
+  placements = {}
+  for children, parent in canonicalize(is_contained_in).items():
+    for child in children:
+      placements[child] = (children, parent)
+  return placements
+
+"""
+Measure how much two hierarchies agree
+
+:param is_contained_in: the first hierarchy
+:param other_is_contained_in: the second hierarchy
+:returns: a tuple `(same_parent, same_group)` of the shares of the packages that have the same parent and the same group in both
+"""
+def get_agreement(is_contained_in, other_is_contained_in):
+  placements = get_package_placements(is_contained_in)
+  other_placements = get_package_placements(other_is_contained_in)
+  if len(placements) == 0:
+    return 1.0, 1.0
+  same_parent = sum(1 for package, (_, parent) in placements.items() if other_placements[package][1] == parent)
+  same_group = sum(1 for package, (group, _) in placements.items() if other_placements[package][0] == group)
+  return same_parent / len(placements), same_group / len(placements)
+
+"""
+Time a discovery engine
+
+:param engine: `discover_hierarchy` or `discover_hierarchy_arborescence`
+:param pairwise_projections: the projections
+:param packages: the package names
+:returns: a tuple `(is_contained_in, seconds)`
+"""
+def run_engine(engine, pairwise_projections, packages):
+  start = time.perf_counter()
+  is_contained_in = engine(pairwise_projections, packages, ROOT, True, PROJECTION_THRESHOLD)
+  return is_contained_in, time.perf_counter() - start
+
+if __name__ == "__main__":
+  sizes = QUICK_SIZES if "--quick" in sys.argv else SIZES
+  failures = []
+  agreements = []
+
+  for case_name, build_case in CASES.items():
+    print("Case:", case_name)
+    print("  packages  projections  greedy (s)  arborescence (s)  groups  same parent  same group")
+    numbers_of_projections = []
+    runtimes = []
+    for n in sizes:
+      pairwise_projections, packages, expected_hierarchy = build_case(n, np.random.default_rng(n))
+      greedy_is_contained_in, greedy_runtime = run_engine(discover_hierarchy, pairwise_projections, packages)
+      arborescence_is_contained_in, arborescence_runtime = run_engine(discover_hierarchy_arborescence, pairwise_projections, packages)
+
+      same_parent, same_group = get_agreement(greedy_is_contained_in, arborescence_is_contained_in)
+      agreements.append((same_parent, same_group))
+      number_of_groups = "%d/%d" % tuple(len([children for children in is_contained_in if len(children) > 1]) for is_contained_in in (greedy_is_contained_in, arborescence_is_contained_in))
+      print("  %8d  %11d  %10.3f  %16.3f  %6s  %10.1f%%  %9.1f%%" % (n, len(pairwise_projections), greedy_runtime, arborescence_runtime, number_of_groups, 100 * same_parent, 100 * same_group))
+      numbers_of_projections.append(len(pairwise_projections))
+      runtimes.append(arborescence_runtime)
+
+      if expected_hierarchy is not None and canonicalize(arborescence_is_contained_in) != expected_hierarchy:
+        failures.append(case_name + " with " + str(n) + " packages: the hierarchy recommended by the arborescence engine differs from the constructed one")
+
+    exponent = get_scaling_exponent(numbers_of_projections, runtimes)
+    print("  scaling exponent of the arborescence engine (runtime ~ projections^b): b = %.2f" % exponent)
+    if exponent >= MAX_SCALING_EXPONENT:
+      failures.append(case_name + ": the runtime of the arborescence engine scales with exponent " + ("%.2f" % exponent) + " in the number of projections")
+
+  print("---")
+  print("Mean agreement: %.1f%% same parent, %.1f%% same group" % tuple(100 * np.mean(agreements, axis=0)))
+  if len(failures) > 0:
+    for failure in failures:
+      print("FAILED:", failure)
+    sys.exit(1)
+  print("All checks passed")
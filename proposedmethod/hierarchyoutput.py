@@ -0,0 +1,106 @@
+import json
+import numpy as np
+
+"""
+Column names of the adjacency format, in order
+"""
+ADJACENCY_COLUMNS = ["index", "parent", "group", "lax", "projection", "path"]
+
+"""
+Go through the recommended hierarchy node by node, parents before their children
+
+The nodes are the same as those of the tree built by `packageorganizer.build_tree`: the root package, one node per
+package and one group node (shown as "•" in the tree) per group of packages that formed a loop. Instead of annotating
+lax subpackages in their name, every node carries its own flags.
+
+:param is_contained_in: the hierarchy as returned by `discover_hierarchy`
+:param projection_values: the projection values as collected by `discover_hierarchy`
+:param pairwise_projections: the projections as returned by `calculate_pairwise_projections`
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:returns: a generator of dictionaries with the keys
+          `index`: the position of the node in the output (the root package has index 0)
+          `parent`: the index of the parent node (None for the root package)
+          `group`: whether the node is a group of packages rather than a package
+          `lax`: whether the node is a subpackage of the root package with a projection value below the threshold
+          `projection`: the projection value of the node onto its parent (None for the root package and for the members of a group)
+          `path`: the path to the package (None for a group)
+"""
+def get_hierarchy_nodes(is_contained_in, projection_values, pairwise_projections, root_path, has_root_embedding, projection_threshold):
+  # Children of each package, where None stands for the root package, in the order in which they occur in `is_contained_in`
+  children_map = {}
+  for children, parent in is_contained_in.items():
+    if children == (root_path,):
+      continue
+    parent = None if parent == root_path else parent
+    children_map.setdefault(parent, []).append(children)
+
+  next_index = 1
+  yield {"index": 0, "parent": None, "group": False, "lax": False, "projection": None, "path": root_path}
+
+  stack = [(0, None)]
+  while len(stack) > 0:
+    parent_index, parent = stack.pop()
+    pending = []
+    for children in children_map.get(parent, []):
+      if parent is None and has_root_embedding:
+        projection_value = float(np.mean([pairwise_projections[((child,), root_path)] for child in children]))
+        is_lax = projection_value < projection_threshold
+      else:
+        projection_value = float(projection_values[children]) if children in projection_values else None
+        is_lax = False
+
+      if len(children) > 1:
+        group_index = next_index
+        next_index += 1
+        yield {"index": group_index, "parent": parent_index, "group": True, "lax": is_lax, "projection": projection_value, "path": None}
+        for child in children:
+          yield {"index": next_index, "parent": group_index, "group": False, "lax": False, "projection": None, "path": child}
+          pending.append((next_index, child))
+          next_index += 1
+      else:
+        yield {"index": next_index, "parent": parent_index, "group": False, "lax": is_lax, "projection": projection_value, "path": children[0]}
+        pending.append((next_index, children[0]))
+        next_index += 1
+
+    # Visit the children in the order in which they were written
+    stack.extend(reversed(pending))
+
+"""
+Write the hierarchy as JSON, one node per line as soon as it is produced
+
+:param nodes: the nodes as produced by `get_hierarchy_nodes`
+:param output_file: the file to write to
+:param root_path: the path to the root package
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+"""
+def write_hierarchy_json(nodes, output_file, root_path, projection_threshold):
+  output_file.write("{\"root\": " + json.dumps(root_path) + ", \"threshold\": " + json.dumps(projection_threshold) + ", \"nodes\": [")
+  separator = "\n  "
+  for node in nodes:
+    output_file.write(separator + json.dumps(node))
+    separator = ",\n  "
+  output_file.write("\n]}\n")
+
+"""
+Write the hierarchy as a tab-separated adjacency array with a header line, one node per line as soon as it is produced
+
+Flags are written as 0 or 1, and missing parents, projection values and paths are left empty.
+
+:param nodes: the nodes as produced by `get_hierarchy_nodes`
+:param output_file: the file to write to
+"""
+def write_hierarchy_adjacency(nodes, output_file):
+  output_file.write("\t".join(ADJACENCY_COLUMNS) + "\n")
+  for node in nodes:
+    row = []
+    for column in ADJACENCY_COLUMNS:
+      value = node[column]
+      if value is None:
+        row.append("")
+      elif isinstance(value, bool):
+        row.append("1" if value else "0")
+      else:
+        row.append(str(value))
+    output_file.write("\t".join(row) + "\n")
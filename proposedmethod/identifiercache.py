@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+# Bump whenever the output of `get_class_identifiers_from_source` changes, so that stale entries are not reused
+PARSER_VERSION = 1
+
+# Bump whenever the output of `classfilereader.extract_class_file_identifiers` changes
+CLASS_FILE_READER_VERSION = 2
+
+# SQLite limits the number of host parameters in a single statement
+MAX_LOOKUP_BATCH = 500
+
+"""
+Determine the key under which the identifiers of a class are stored given its source code
+
+:param src_text: the source code of the class, or the contents of its class file as bytes
+:returns: a digest of the source code (and the parser version) or of the class file (and the class file reader version)
+"""
+def content_hash(src_text):
+  if isinstance(src_text, bytes):
+    return hashlib.sha256(("class " + str(CLASS_FILE_READER_VERSION) + "\0").encode("ascii") + src_text).digest()
+  return hashlib.sha256((str(PARSER_VERSION) + "\0" + src_text).encode("utf-8", "surrogatepass")).digest()
+
+"""
+Persistent store of the identifiers of classes keyed by the hash of their source code
+
+Classes that occur in multiple projects (e.g. vendored or generated classes) or in overlapping subtrees only need to be
+parsed once. The store is an SQLite database in WAL mode, so it can be shared between analyzer processes running
+concurrently on the same machine: readers never block and writers wait for each other.
+
+Example:
+  with IdentifierCache("identifiers.sqlite") as identifier_cache:
+    field_identifiers, method_identifiers = get_class_identifiers(class_path, identifier_cache)
+"""
+class IdentifierCache:
+  """
+  :param database_path: the path to the SQLite database file (created if it does not exist)
+  :param timeout: the number of seconds to wait for another process that is writing to the database
+  """
+  def __init__(self, database_path, timeout=60):
+    self.connection = sqlite3.connect(database_path, timeout=timeout)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("PRAGMA synchronous=NORMAL")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS identifiers (hash BLOB PRIMARY KEY, field_identifiers TEXT NOT NULL, method_identifiers TEXT NOT NULL) WITHOUT ROWID")
+    self.connection.commit()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    self.connection.close()
+
+  """
+  Look up the identifiers of a single class
+
+  :param key: the content hash of the class
+  :returns: a tuple `(field_identifiers, method_identifiers)` or None if the class is not in the store
+  """
+  def get(self, key):
+    return self.get_many([key]).get(key)
+
+  """
+  Look up the identifiers of multiple classes at once
+
+  :param keys: the content hashes of the classes
+  :returns: a dictionary of content hash to `(field_identifiers, method_identifiers)` for the classes that are in the store
+  """
+  def get_many(self, keys):
+    keys = list(set(keys))
+    found = {}
+    for i in range(0, len(keys), MAX_LOOKUP_BATCH):
+      batch = keys[i:i + MAX_LOOKUP_BATCH]
+      rows = self.connection.execute("SELECT hash, field_identifiers, method_identifiers FROM identifiers WHERE hash IN (" + ",".join("?" * len(batch)) + ")", batch)
+      for key, field_identifiers, method_identifiers in rows:
+        found[key] = (json.loads(field_identifiers), json.loads(method_identifiers))
+    return found
+
+  """
+  Store the identifiers of a single class
+
+  :param key: the content hash of the class
+  :param identifiers: a tuple `(field_identifiers, method_identifiers)`
+  """
+  def put(self, key, identifiers):
+    self.put_many({key: identifiers})
+
+  """
+  Store the identifiers of multiple classes in a single transaction
+
+  :param items: a dictionary of content hash to `(field_identifiers, method_identifiers)`
+  """
+  def put_many(self, items):
+    if len(items) == 0:
+      return
+    rows = [(key, json.dumps(field_identifiers, separators=(",", ":")), json.dumps(method_identifiers, separators=(",", ":"))) for key, (field_identifiers, method_identifiers) in items.items()]
+    with self.connection:
+      # Another process may have stored the same class in the meantime, in which case the stored value is identical
+      self.connection.executemany("INSERT OR IGNORE INTO identifiers VALUES (?, ?, ?)", rows)
+
+  """
+  Count the number of classes in the store
+
+  :returns: the number of stored classes
+  """
+  def __len__(self):
+    return self.connection.execute("SELECT COUNT(*) FROM identifiers").fetchone()[0]
+
+if __name__ == "__main__":
+  database_path = input("Enter the path to the identifier cache: ")
+  with IdentifierCache(database_path) as identifier_cache:
+    print("Number of cached classes:", len(identifier_cache))
+    print("Size on disk (bytes):    ", os.path.getsize(database_path))
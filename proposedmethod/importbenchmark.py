@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import subprocess
+
+"""
+Import-time benchmark of the entry points
+
+Every module is imported in a fresh interpreter, a few times, and the fastest import has to stay within
+IMPORT_TIME_BUDGET seconds. Heavy dependencies are loaded on first use, so importing a module must not load any of
+LAZY_MODULES.
+
+Run with `py importbenchmark.py`.
+"""
+
+MODULES = ["common", "packageanalyzer", "packageorganizer", "embeddingpipeline", "hierarchyoutput", "vocabularyvectors", "embeddingcache", "spanningarborescence", "sourceprovider", "classfilereader", "projectwatcher", "checkpointstore", "batchrun", "workqueue", "distributedrun"]
+
+LAZY_MODULES = ["fasttext", "javalang", "anytree", "multiprocessing", "zipfile"]
+
+# Maximum number of seconds importing a module may take (most of which is spent importing numpy)
+IMPORT_TIME_BUDGET = 0.5
+
+REPEATS = 5
+
+MEASURE_IMPORT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps([time.perf_counter() - start, [module for module in {lazy_modules} if module in sys.modules]]))
+"""
+
+"""
+Import a module in a fresh interpreter
+
+:param module: the name of the module to import
+:returns: a tuple `(seconds, loaded_lazy_modules)` where loaded_lazy_modules are the modules of LAZY_MODULES that were loaded by the import
+"""
+def measure_import(module):
+  code = MEASURE_IMPORT.format(module=module, lazy_modules=repr(LAZY_MODULES))
+  output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+  seconds, loaded_lazy_modules = json.loads(output.strip().splitlines()[-1])
+  return seconds, loaded_lazy_modules
+
+if __name__ == "__main__":
+  failures = []
+  print("module              seconds")
+  for module in MODULES:
+    measurements = [measure_import(module) for _ in range(REPEATS)]
+    seconds = min(seconds for seconds, _ in measurements)
+    loaded_lazy_modules = measurements[0][1]
+    print("%-18s  %7.3f" % (module, seconds))
+    if seconds > IMPORT_TIME_BUDGET:
+      failures.append("importing " + module + " took " + ("%.3f" % seconds) + " seconds")
+    if len(loaded_lazy_modules) > 0:
+      failures.append("importing " + module + " loaded " + ", ".join(loaded_lazy_modules))
+
+  print("---")
+  if len(failures) > 0:
+    for failure in failures:
+      print("FAILED:", failure)
+    sys.exit(1)
+  print("All checks passed")
@@ -0,0 +1,222 @@
+import sys
+import time
+import hashlib
+import numpy as np
+from packageorganizer import discover_hierarchy
+
+"""
+Stress benchmark of the discovery phase of the package organizer
+
+The projections are generated directly (no source files or word embeddings are involved), so only `discover_hierarchy`
+is timed. Each case is adversarial for a different part of the discovery loop:
+  chain:  one long chain of subpackages, assigned from the top down so that every loop test walks the entire chain
+  rings:  many small loops that are each merged into a group, after which the group is placed under the root package
+  random: random projections of which a few per package reach the threshold, so that many (nested) loops form
+
+For each case the recommended hierarchy is checked against the hierarchy that is known by construction (chain, rings) or
+against a recorded fingerprint (random), and the runtime has to scale about linearly in the number of projections (which
+is quadratic in the number of packages, since every package projects onto every other one).
+Discovery is also run on only the projections that reach the threshold (as the organizer calculates them), recalculating
+the others on demand, which has to recommend the same hierarchy.
+
+Run with `py organizerbenchmark.py` (add `--quick` to only check the smallest sizes).
+"""
+
+ROOT = "ROOT"
+
+PROJECTION_THRESHOLD = 0.6
+
+SIZES = [25, 50, 100, 200]
+
+QUICK_SIZES = [25, 50]
+
+# Maximum allowed exponent b in runtime ~ (number of projections)^b: linear plus a margin for timing noise (the number of
+# projections grows quadratically with the number of packages, so 2 would allow a runtime quartic in the packages)
+MAX_SCALING_EXPONENT = 1.25
+
+"""
+Fingerprints of the hierarchies recommended for the random case, by number of packages
+"""
+RANDOM_FINGERPRINTS = {
+  25: "503d2051c18880c2",
+  50: "8dd58c842604cbff",
+  100: "089ebbd4bbea3ff6",
+  200: "fa21cd38672a311c",
+}
+
+"""
+Generate the names of the packages
+
+:param n: the number of packages
+:returns: a list of package names
+"""
+def get_packages(n):
+  return ["p" + str(i).zfill(4) for i in range(n)]
+
+"""
+Generate projections of all packages onto each other and onto the root package
+
+:param packages: the package names
+:param values: an n×n matrix where `values[i][j]` is the projection of package i onto package j (the diagonal is ignored)
+:param root_values: a list where `root_values[i]` is the projection of package i onto the root package
+:returns: dictionary of group-package pairs `((pkg1,), pkg2)` to projection values, in the order `calculate_pairwise_projections` produces them
+"""
+def get_pairwise_projections(packages, values, root_values):
+  pairwise_projections = {}
+  for i in range(len(packages)):
+    pairwise_projections[((packages[i],), ROOT)] = float(root_values[i])
+    for j in range(len(packages)):
+      if i != j:
+        pairwise_projections[((packages[i],), packages[j])] = float(values[i][j])
+  return pairwise_projections
+
+"""
+Keep only the projections that `calculate_pairwise_projections` keeps for the projection threshold
+
+:param pairwise_projections: the projections as returned by `get_pairwise_projections`
+:returns: a tuple `(pruned_projections, get_package_projections)` where get_package_projections returns all projections of a
+          package, as `calculate_package_projections` does
+"""
+def prune_pairwise_projections(pairwise_projections):
+  package_projections = {}
+  for (child,), parent in pairwise_projections:
+    package_projections.setdefault(child, {})[parent] = pairwise_projections[((child,), parent)]
+  pruned_projections = {pair: value for pair, value in pairwise_projections.items() if pair[1] == ROOT or value >= PROJECTION_THRESHOLD}
+  return pruned_projections, lambda package: package_projections[package]
+
+"""
+A chain p0 ⊃ p1 ⊃ ... where higher links have higher projection values, so they are assigned first
+
+:param n: the number of packages
+:param rng: the numpy random generator
+:returns: a tuple `(pairwise_projections, packages, expected_hierarchy)` where expected_hierarchy is None if unknown
+"""
+def build_chain_case(n, rng):
+  packages = get_packages(n)
+  values = rng.uniform(0, 0.5, (n, n))
+  root_values = rng.uniform(0, 0.5, n)
+  root_values[0] = 0.95
+  expected_hierarchy = {(frozenset([packages[0]])): ROOT}
+  for i in range(1, n):
+    values[i][i - 1] = 0.9 - 0.2 * i / n
+    expected_hierarchy[frozenset([packages[i]])] = packages[i - 1]
+  return get_pairwise_projections(packages, values, root_values), packages, expected_hierarchy
+
+"""
+Rings p0 → p1 → p2 → p0, p3 → p4 → p5 → p3, ... of which every member also projects onto the root package above the threshold
+
+:param n: the number of packages
+:param rng: the numpy random generator
+:param ring_size: the number of packages per ring
+:returns: a tuple `(pairwise_projections, packages, expected_hierarchy)`
+"""
+def build_rings_case(n, rng, ring_size=3):
+  packages = get_packages(n)
+  values = rng.uniform(0, 0.5, (n, n))
+  root_values = rng.uniform(0.65, 0.8, n)
+  expected_hierarchy = {}
+  for start in range(0, n - n % ring_size, ring_size):
+    ring = list(range(start, start + ring_size))
+    for k in range(ring_size):
+      values[ring[k]][ring[(k + 1) % ring_size]] = rng.uniform(0.85, 0.95)
+    expected_hierarchy[frozenset(packages[i] for i in ring)] = ROOT
+  for i in range(n - n % ring_size, n):
+    expected_hierarchy[frozenset([packages[i]])] = ROOT
+  return get_pairwise_projections(packages, values, root_values), packages, expected_hierarchy
+
+"""
+Random projections of which on average `above_threshold_per_package` per package reach PROJECTION_THRESHOLD, which form
+many loops (and loops of groups)
+
+:param n: the number of packages
+:param rng: the numpy random generator
+:param above_threshold_per_package: the expected number of packages onto which a package projects above the threshold
+:returns: a tuple `(pairwise_projections, packages, None)`
+"""
+def build_random_case(n, rng, above_threshold_per_package=3):
+  packages = get_packages(n)
+  values = np.where(rng.random((n, n)) < above_threshold_per_package / n, rng.uniform(PROJECTION_THRESHOLD, 1, (n, n)), rng.uniform(0, PROJECTION_THRESHOLD, (n, n)))
+  root_values = np.where(rng.random(n) < 0.05, rng.uniform(PROJECTION_THRESHOLD, 1, n), rng.uniform(0, PROJECTION_THRESHOLD, n))
+  return get_pairwise_projections(packages, values, root_values), packages, None
+
+CASES = {
+  "chain": build_chain_case,
+  "rings": build_rings_case,
+  "random": build_random_case,
+}
+
+"""
+Convert the result of `discover_hierarchy` into a form that does not depend on the order of the packages in a group
+
+:param is_contained_in: the hierarchy as returned by `discover_hierarchy`
+:returns: dictionary of frozenset of packages to parent, without the root package
+"""
+def canonicalize(is_contained_in):
+  return {frozenset(children): parent for children, parent in is_contained_in.items() if children != (ROOT,)}
+
+"""
+Determine a fingerprint of a hierarchy
+
+:param hierarchy: a hierarchy as returned by `canonicalize`
+:returns: a hexadecimal digest that is equal for equal hierarchies
+"""
+def fingerprint(hierarchy):
+  lines = sorted(",".join(sorted(children)) + ">" + str(parent) for children, parent in hierarchy.items())
+  return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()[:16]
+
+"""
+Estimate the exponent b in runtime ~ size^b with a least-squares fit in log-log space
+
+:param sizes: the input sizes
+:param runtimes: the runtimes for each input size
+:returns: the estimated exponent
+"""
+def get_scaling_exponent(sizes, runtimes):
+  return np.polyfit(np.log(sizes), np.log(runtimes), 1)[0]
+
+if __name__ == "__main__":
+  sizes = QUICK_SIZES if "--quick" in sys.argv else SIZES
+  failures = []
+
+  for case_name, build_case in CASES.items():
+    print("Case:", case_name)
+    print("  packages  projections    kept  groups  seconds   pruned  fingerprint")
+    numbers_of_projections = []
+    runtimes = []
+    for n in sizes:
+      pairwise_projections, packages, expected_hierarchy = build_case(n, np.random.default_rng(n))
+
+      start = time.perf_counter()
+      is_contained_in = discover_hierarchy(pairwise_projections, packages, ROOT, True, PROJECTION_THRESHOLD)
+      runtime = time.perf_counter() - start
+
+      pruned_projections, get_package_projections = prune_pairwise_projections(pairwise_projections)
+      start = time.perf_counter()
+      pruned_is_contained_in = discover_hierarchy(pruned_projections, packages, ROOT, True, PROJECTION_THRESHOLD, None, get_package_projections)
+      pruned_runtime = time.perf_counter() - start
+
+      hierarchy = canonicalize(is_contained_in)
+      hierarchy_fingerprint = fingerprint(hierarchy)
+      number_of_groups = len([children for children in hierarchy if len(children) > 1])
+      print("  %8d  %11d  %6d  %6d  %7.3f  %7.3f  %s" % (n, len(pairwise_projections), len(pruned_projections), number_of_groups, runtime, pruned_runtime, hierarchy_fingerprint))
+      numbers_of_projections.append(len(pairwise_projections))
+      runtimes.append(runtime)
+
+      if expected_hierarchy is not None and hierarchy != expected_hierarchy:
+        failures.append(case_name + " with " + str(n) + " packages: the recommended hierarchy differs from the constructed one")
+      if case_name == "random" and RANDOM_FINGERPRINTS.get(n) is not None and hierarchy_fingerprint != RANDOM_FINGERPRINTS[n]:
+        failures.append(case_name + " with " + str(n) + " packages: fingerprint " + hierarchy_fingerprint + " differs from the recorded " + RANDOM_FINGERPRINTS[n])
+      if list(pruned_is_contained_in.items()) != list(is_contained_in.items()):
+        failures.append(case_name + " with " + str(n) + " packages: the hierarchy recommended from the projections that reach the threshold differs")
+
+    exponent = get_scaling_exponent(numbers_of_projections, runtimes)
+    print("  scaling exponent (runtime ~ projections^b): b = %.2f" % exponent)
+    if exponent >= MAX_SCALING_EXPONENT:
+      failures.append(case_name + ": runtime scales with exponent " + ("%.2f" % exponent) + " in the number of projections")
+
+  print("---")
+  if len(failures) > 0:
+    for failure in failures:
+      print("FAILED:", failure)
+    sys.exit(1)
+  print("All checks passed")
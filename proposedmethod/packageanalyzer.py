@@ -1,8 +1,37 @@
-import sys
-import os
-import numpy as np
+import contextlib
 from enum import Enum
-from common import get_package_embedding, calculate_projection_length
+from common import EmbeddingAccumulator, get_package_embedding, calculate_projection_length, is_class_file
+from embeddingpipeline import EmbeddingPipeline
+from identifiercache import IdentifierCache
+from tolerantparsing import ParseReport
+from projectionstatistics import ProjectionStatistics
+from vocabularyvectors import load_model, get_model_id
+from embeddingcache import PackageEmbeddingCache
+from sourceprovider import list_directory, get_source_root
+
+# Overlap reading, parsing and embedding of the classes of each package (useful on network-mounted source trees)
+PIPELINED = False
+
+# Path to an SQLite database in which the parsed identifiers of classes are shared between runs (None to always parse)
+IDENTIFIER_CACHE_PATH = None
+
+# Path to an SQLite database in which package embeddings are shared between runs, projects and branches (None to always embed the classes)
+EMBEDDING_CACHE_PATH = None
+
+# Path to a tab-separated file to which the files that could not be parsed are written (None to only print a summary)
+PARSE_REPORT_PATH = None
+
+# Path to the vocabulary vectors prepared for the project with vocabularyvectors.py (None to load the FastText model)
+VOCABULARY_VECTORS_PATH = None
+
+# Whether to keep every projection value, to print them and calculate the statistics exactly (otherwise the median and percentiles are estimated)
+KEEP_PROJECTION_VALUES = True
+
+# Percentiles of the projection values to print besides the median
+PROJECTION_PERCENTILES = [5, 25, 75, 95]
+
+# Path to a tab-separated file to which every projection value is written with its category, depth and package type (None to not write them)
+PROJECTION_RECORDS_PATH = None
 
 class PackageType(Enum):
   CLASSES_AND_CLASS_PACKAGES = 0
@@ -10,6 +39,115 @@ class PackageType(Enum):
   CLASSES_BUT_NO_CLASS_PACKAGES = 2
   NO_CLASSES_AND_NO_CLASS_PACKAGES = 3
 
+class ProjectionCategory(Enum):
+  CLASS_PACKAGE_ON_PARENT = 0
+  CLASS_PACKAGE_PAIRWISE = 1
+  SUBDIV_PACKAGE_ON_PARENT = 2
+
+"""
+Column names of the projection records file, in order
+"""
+PROJECTION_RECORD_COLUMNS = ["projection", "category", "depth", "package_type", "package"]
+
+"""
+Projection statistics broken down by category and by the depth of the package under consideration, collected in the same
+traversal as the statistics of all projections
+
+The traversal adds projections through `tagged`, which returns a view that tags every appended projection. Each tagged
+projection updates the statistics of all projections, of its category and of its category at its depth, and is optionally
+written to a records file right away. Breakdowns of parallel subtrees can be merged.
+
+:param keep_values: whether the statistics of all projections also keep every value
+:param records_file: an optional file to which every projection is written as a tab-separated record (see PROJECTION_RECORD_COLUMNS)
+"""
+class ProjectionBreakdown:
+  def __init__(self, keep_values=False, records_file=None):
+    self.total = ProjectionStatistics(keep_values=keep_values)
+    self.by_category = {}
+    self.by_category_and_depth = {}
+    self.records_file = records_file
+    if records_file is not None:
+      records_file.write("\t".join(PROJECTION_RECORD_COLUMNS) + "\n")
+
+  """
+  Add a tagged projection
+
+  :param projection: the projection value
+  :param category: the ProjectionCategory of the projection
+  :param depth: the depth of the package under consideration (the root package has depth 0)
+  :param package_type: the PackageType of the package under consideration
+  :param this_package_path: the path to the package under consideration
+  """
+  def add(self, projection, category, depth, package_type, this_package_path):
+    self.total.append(projection)
+    self.by_category.setdefault(category, ProjectionStatistics()).append(projection)
+    self.by_category_and_depth.setdefault((category, depth), ProjectionStatistics()).append(projection)
+    if self.records_file is not None:
+      self.records_file.write("\t".join([str(projection), category.name, str(depth), package_type.name, this_package_path]) + "\n")
+
+  """
+  :returns: a view with an `append` method that adds projections with the given tags (see `add`)
+  """
+  def tagged(self, category, depth, package_type, this_package_path):
+    return TaggedProjections(self, category, depth, package_type, this_package_path)
+
+  """
+  Merge the statistics of another breakdown into this one (its records are not copied)
+
+  :param other: the breakdown to merge into this one
+  :returns: this breakdown
+  """
+  def merge(self, other):
+    self.total.merge(other.total)
+    for category, statistics in other.by_category.items():
+      self.by_category.setdefault(category, ProjectionStatistics()).merge(statistics)
+    for key, statistics in other.by_category_and_depth.items():
+      self.by_category_and_depth.setdefault(key, ProjectionStatistics()).merge(statistics)
+    return self
+
+  """
+  Print a table with the statistics per category and per category and depth
+  """
+  def print_table(self, output_file=None):
+    print("Category                  Depth  Count   Minimum   Maximum   Average    Median  Std. dev.", file=output_file)
+    for category in ProjectionCategory:
+      if category not in self.by_category:
+        continue
+      rows = [("all", self.by_category[category])]
+      rows += [(str(depth), self.by_category_and_depth[(category, depth)]) for depth in sorted(depth for key_category, depth in self.by_category_and_depth if key_category == category)]
+      for depth, statistics in rows:
+        if len(statistics) == 0:
+          # Only non-finite projection values
+          print("%-24s  %5s  %5d" % (category.name, depth, 0), file=output_file)
+          continue
+        print("%-24s  %5s  %5d  %8.4f  %8.4f  %8.4f  %8.4f  %9.4f" % (category.name, depth, len(statistics), statistics.minimum, statistics.maximum, statistics.mean(), statistics.median(), statistics.std()), file=output_file)
+
+"""
+A view of a ProjectionBreakdown that tags every appended projection (see `ProjectionBreakdown.tagged`)
+"""
+class TaggedProjections:
+  def __init__(self, breakdown, category, depth, package_type, this_package_path):
+    self.breakdown = breakdown
+    self.tags = (category, depth, package_type, this_package_path)
+
+  def append(self, projection):
+    self.breakdown.add(projection, *self.tags)
+
+"""
+Tag the projections added for a package if they are collected in a ProjectionBreakdown
+
+:param projections: the list, ProjectionStatistics or ProjectionBreakdown to add projections to
+:param category: the ProjectionCategory of the projections
+:param depth: the depth of the package under consideration
+:param package_type: the PackageType of the package under consideration
+:param this_package_path: the path to the package under consideration
+:returns: the object to add the projections of this category to
+"""
+def tag_projections(projections, category, depth, package_type, this_package_path):
+  if isinstance(projections, ProjectionBreakdown):
+    return projections.tagged(category, depth, package_type, this_package_path)
+  return projections
+
 """
 Check whether a package contains classes
 
@@ -17,8 +155,8 @@ Check whether a package contains classes
 :returns: whether the package contains classes given its path
 """
 def contains_classes(this_package_path):
-  files = next(os.walk(this_package_path))[2]
-  files = list(filter(lambda file : file.endswith(".java"), files))
+  files = list_directory(this_package_path)[1]
+  files = list(filter(is_class_file, files))
   return len(files) > 0
 
 """
@@ -28,7 +166,7 @@ Check whether a package contains subpackages containing classes
 :returns: whether the package contains a subpackage that contains classes
 """
 def contains_class_packages(this_package_path):
-  subpackages = next(os.walk(this_package_path))[1]
+  subpackages = list_directory(this_package_path)[0]
   for subpackage in subpackages:
     subpackage_path = this_package_path + "/" + subpackage
     if contains_classes(subpackage_path):
@@ -44,7 +182,7 @@ Get all subpackages organized into a list of ones that contain classes and a lis
 def get_subpackages(this_package_path):
   class_package_paths = []
   subdiv_package_paths = []
-  subpackages = next(os.walk(this_package_path))[1]
+  subpackages = sorted(list_directory(this_package_path)[0])
   for subpackage in subpackages:
     subpackage_path = this_package_path + "/" + subpackage
     if contains_classes(subpackage_path):
@@ -74,24 +212,37 @@ Adds the projections of all class package embeeddings onto the embedding of thei
 
 :param class_package_paths: the list of paths to packages containing classes
 :param this_package_embedding: the embedding of the package under consideration (the one that is the parent of all class_package_paths)
-:param projections: the list to add projections to
+:param projections: the list or ProjectionStatistics to add projections to
 :param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded (it uses its own
+                 identifier cache and parse report)
 """
-def add_class_package_on_parent_package_projections(class_package_paths, this_package_embedding, projections, model):
+def add_class_package_on_parent_package_projections(class_package_paths, this_package_embedding, projections, model, identifier_cache=None, parse_report=None, embedding_cache=None, pipeline=None):
   # Projection of all ClassPackages onto ThisPackage
   for class_package_path in class_package_paths:
-    projections.append(calculate_projection_length(get_package_embedding(class_package_path, model), this_package_embedding))
+    class_package_embedding = get_package_embedding(class_package_path, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache, pipeline=pipeline)
+    # A package whose classes have no words in their names or identifiers has no embedding to project
+    if class_package_embedding is not None and this_package_embedding is not None:
+      projections.append(calculate_projection_length(class_package_embedding, this_package_embedding))
 
 """
 Adds the projections of all class package embeddings onto each other to the list of projections
 
 :param class_package_paths: the list of paths to packages containing classes
 :param this_package_embedding: the embedding of the package under consideration (the one that is the parent of all class_package_paths and all subdiv_package_paths)
-:param projections: the list to add projections to
+:param projections: the list or ProjectionStatistics to add projections to
 :param is_root_package: whether the package under consideration is the directory provided by the user
 :param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded (it uses its own
+                 identifier cache and parse report)
 """
-def add_class_package_pairwise_projections(class_package_paths, projections, is_root_package, model):
+def add_class_package_pairwise_projections(class_package_paths, projections, is_root_package, model, identifier_cache=None, parse_report=None, embedding_cache=None, pipeline=None):
   # Projection of all ClassPackages in ThisPackage onto each other, but not if ThisPackage is the root package
   if is_root_package:
     return
@@ -99,7 +250,10 @@ def add_class_package_pairwise_projections(class_package_paths, projections, is_
   for class_package_path_a in class_package_paths:
     for class_package_path_b in class_package_paths:
       if class_package_path_a != class_package_path_b:
-        projections.append(calculate_projection_length(get_package_embedding(class_package_path_a, model), get_package_embedding(class_package_path_b, model)))
+        class_package_embedding_a = get_package_embedding(class_package_path_a, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache, pipeline=pipeline)
+        class_package_embedding_b = get_package_embedding(class_package_path_b, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache, pipeline=pipeline)
+        if class_package_embedding_a is not None and class_package_embedding_b is not None:
+          projections.append(calculate_projection_length(class_package_embedding_a, class_package_embedding_b))
 
 """
 Adds the projections of all subdiv package embeddings onto their parent package embedding (this_package_embedding). A subdiv package's embedding exists if and only if
@@ -108,67 +262,128 @@ the subdiv package contains class packages. Then the embedding is the average of
 
 :param subdiv_package_paths: the list of paths to packages not containing classes
 :param this_package_embedding: the embedding of the package under consideration (the one that is the parent of all class_package_paths and all subdiv_package_paths)
-:param projections: the list to add projections to
+:param projections: the list or ProjectionStatistics to add projections to
 :param model: the fasttext model to use for retrieving word embeddings
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded (it uses its own
+                 identifier cache and parse report)
 """
-def add_subdiv_package_on_parent_package_projections(subdiv_package_paths, this_package_embedding, projections, model):
+def add_subdiv_package_on_parent_package_projections(subdiv_package_paths, this_package_embedding, projections, model, identifier_cache=None, parse_report=None, embedding_cache=None, pipeline=None):
   # Projection of all SubdivPackages p in ThisPackage onto ThisPackage provided that p contains class packages.
   for subdiv_package_path in subdiv_package_paths:
     if contains_class_packages(subdiv_package_path):
       class_package_in_subdiv_paths, _ = get_subpackages(subdiv_package_path)
-      class_package_in_subdiv_embeddings = [get_package_embedding(class_package_in_subdiv_path, model) for class_package_in_subdiv_path in class_package_in_subdiv_paths]
-      subdiv_package_embedding = np.mean(class_package_in_subdiv_embeddings, axis=0)
-      projections.append(calculate_projection_length(subdiv_package_embedding, this_package_embedding))
+      class_package_in_subdiv_accumulator = EmbeddingAccumulator()
+      for class_package_in_subdiv_path in class_package_in_subdiv_paths:
+        class_package_in_subdiv_accumulator.add(get_package_embedding(class_package_in_subdiv_path, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache, pipeline=pipeline))
+      subdiv_package_embedding = class_package_in_subdiv_accumulator.mean()
+      if subdiv_package_embedding is not None and this_package_embedding is not None:
+        projections.append(calculate_projection_length(subdiv_package_embedding, this_package_embedding))
 
 """
-Add projections to the list of projections recursively given a root package
+Add the projections of the subpackages of a package to the list of projections (but not those of packages further down)
 
-:param this_package_path: the path to the root package
-:param projections: the list to add projections to
+:param this_package_path: the path to the package under consideration
+:param projections: the list, ProjectionStatistics or ProjectionBreakdown to add projections to
 :param model: the fasttext model to use for retrieving word embeddings
 :param is_root_package: whether the package under consideration is the directory provided by the user
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:param depth: the depth of the package under consideration below the root package
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded (it uses its own
+                 identifier cache and parse report)
 """
-def find_all_projections_recursively(this_package_path, projections, model, is_root_package = True):
-  this_package_embedding = get_package_embedding(this_package_path, model)
+def find_package_projections(this_package_path, projections, model, is_root_package = True, identifier_cache=None, parse_report=None, embedding_cache=None, depth=0, pipeline=None):
+  this_package_embedding = get_package_embedding(this_package_path, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache, pipeline=pipeline)
   class_package_paths, subdiv_package_paths = get_subpackages(this_package_path)
 
-  match get_package_type(this_package_path):
+  package_type = get_package_type(this_package_path)
+  match package_type:
     case PackageType.CLASSES_AND_CLASS_PACKAGES:
-      add_class_package_on_parent_package_projections(class_package_paths, this_package_embedding, projections, model)
-      add_subdiv_package_on_parent_package_projections(subdiv_package_paths, this_package_embedding, projections, model)
+      add_class_package_on_parent_package_projections(class_package_paths, this_package_embedding, tag_projections(projections, ProjectionCategory.CLASS_PACKAGE_ON_PARENT, depth, package_type, this_package_path), model, identifier_cache, parse_report, embedding_cache, pipeline)
+      add_subdiv_package_on_parent_package_projections(subdiv_package_paths, this_package_embedding, tag_projections(projections, ProjectionCategory.SUBDIV_PACKAGE_ON_PARENT, depth, package_type, this_package_path), model, identifier_cache, parse_report, embedding_cache, pipeline)
     case PackageType.NO_CLASSES_BUT_CLASS_PACKAGES:
-      add_class_package_pairwise_projections(class_package_paths, projections, is_root_package, model)
+      add_class_package_pairwise_projections(class_package_paths, tag_projections(projections, ProjectionCategory.CLASS_PACKAGE_PAIRWISE, depth, package_type, this_package_path), is_root_package, model, identifier_cache, parse_report, embedding_cache, pipeline)
     case PackageType.CLASSES_BUT_NO_CLASS_PACKAGES:
-      add_subdiv_package_on_parent_package_projections(subdiv_package_paths, this_package_embedding, projections, model)
+      add_subdiv_package_on_parent_package_projections(subdiv_package_paths, this_package_embedding, tag_projections(projections, ProjectionCategory.SUBDIV_PACKAGE_ON_PARENT, depth, package_type, this_package_path), model, identifier_cache, parse_report, embedding_cache, pipeline)
+
+"""
+Add projections to the list of projections recursively given a root package
 
-  subpackages = next(os.walk(this_package_path))[1]
+:param this_package_path: the path to the root package
+:param projections: the list, ProjectionStatistics or ProjectionBreakdown to add projections to
+:param model: the fasttext model to use for retrieving word embeddings
+:param is_root_package: whether the package under consideration is the directory provided by the user
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:param embedding_cache: an optional PackageEmbeddingCache in which package embeddings are looked up and stored
+:param depth: the depth of the package under consideration below the root package
+:param pipeline: an optional EmbeddingPipeline through which the classes are read, parsed and embedded (it uses its own
+                 identifier cache and parse report)
+"""
+def find_all_projections_recursively(this_package_path, projections, model, is_root_package = True, identifier_cache=None, parse_report=None, embedding_cache=None, depth=0, pipeline=None):
+  find_package_projections(this_package_path, projections, model, is_root_package, identifier_cache, parse_report, embedding_cache, depth, pipeline)
+  subpackages = sorted(list_directory(this_package_path)[0])
   for subpackage in subpackages:
     subpackage_path = this_package_path + "/" + subpackage
-    find_all_projections_recursively(subpackage_path, projections, model, False)
+    find_all_projections_recursively(subpackage_path, projections, model, False, identifier_cache, parse_report, embedding_cache, depth + 1, pipeline)
+
+"""
+Print the statistics of the projections collected for a package
+
+:param breakdown: the ProjectionBreakdown the projections were collected in
+:param output_file: the file to print to (None for standard output)
+"""
+def print_results(breakdown, output_file=None):
+  projections = breakdown.total
+  print("Results", file=output_file)
+  print("---", file=output_file)
+  if KEEP_PROJECTION_VALUES:
+    print("All projection values:", projections.values, file=output_file)
+  if (len(projections) > 0):
+    print("Number of projection values:", len(projections), file=output_file)
+    print("Minimum:                    ", projections.minimum, file=output_file)
+    print("Maximum:                    ", projections.maximum, file=output_file)
+    print("Average:                    ", projections.mean(), file=output_file)
+    print("Median:                     ", projections.median(), file=output_file)
+    print("Standard deviation:         ", projections.std(), file=output_file)
+    for percentile in PROJECTION_PERCENTILES:
+      print(("%d. percentile:" % percentile).ljust(28), projections.quantile(percentile / 100), file=output_file)
+    print("Histogram:", file=output_file)
+    for lower_bound, upper_bound, count in projections.get_histogram():
+      print("  [%5.2f, %5.2f) %d" % (lower_bound, upper_bound, count), file=output_file)
+  if projections.non_finite_count > 0:
+    print("Non-finite projection values (not included in the statistics):", projections.non_finite_count, file=output_file)
+  if len(projections) > 0 or projections.non_finite_count > 0:
+    print("By category and depth of the package under consideration:", file=output_file)
+    breakdown.print_table(output_file)
 
 if __name__ == "__main__":
-  # Prompt user to enter path without final slash
-  path = input("Enter the path to the Java package of which you want the structure to be analyzed: ")
+  # Prompt user to enter path without final slash (or the path to a jar or zip source archive)
+  path = get_source_root(input("Enter the path to the Java package of which you want the structure to be analyzed: "))
 
-  # FastText
-  import fasttext
-  original_directory = os.getcwd()
-  os.chdir(os.path.dirname(os.path.abspath(sys.argv[0]))) # Change the working directory to that of the file (so that the relative file path to the model file works consistently)
-  model = fasttext.load_model('./models/wiki-news-300d-1M-subword.bin')
-  # model = fasttext.load_model('./models/crawl-300d-2M-subword.bin')
-  os.chdir(original_directory) # Restore the original working directory so that paths are traversed normally in the rest of the program
+  # Word embeddings: the prepared vocabulary vectors of the project if there are any (see vocabularyvectors.py), otherwise FastText
+  model = load_model(VOCABULARY_VECTORS_PATH)
 
   # For each package, derive its embedding from the classes it contains and calculate the projections of the embeddings of its subpackages onto its own embedding
-  projections = []
-  find_all_projections_recursively(path, projections, model)
+  records_file = open(PROJECTION_RECORDS_PATH, "w") if PROJECTION_RECORDS_PATH is not None else None
+  breakdown = ProjectionBreakdown(keep_values=KEEP_PROJECTION_VALUES, records_file=records_file)
+  identifier_cache = IdentifierCache(IDENTIFIER_CACHE_PATH) if IDENTIFIER_CACHE_PATH is not None else None
+  parse_report = ParseReport()
+  embedding_cache = PackageEmbeddingCache(EMBEDDING_CACHE_PATH, get_model_id(model)) if EMBEDDING_CACHE_PATH is not None else None
+  with EmbeddingPipeline(identifier_cache=identifier_cache, parse_report=parse_report) if PIPELINED else contextlib.nullcontext() as pipeline:
+    find_all_projections_recursively(path, breakdown, model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache, pipeline=pipeline)
+  if identifier_cache is not None:
+    identifier_cache.close()
+  if embedding_cache is not None:
+    embedding_cache.close()
+  if records_file is not None:
+    records_file.close()
+  parse_report.print_summary()
+  if PARSE_REPORT_PATH is not None:
+    parse_report.write(PARSE_REPORT_PATH)
 
-  print("Results")
-  print("---")
-  print("All projection values:", projections)
-  if (len(projections) > 0):
-    print("Number of projection values:", len(projections))
-    print("Minimum:                    ", min(projections))
-    print("Maximum:                    ", max(projections))
-    print("Average:                    ", np.mean(projections))
-    print("Median:                     ", np.median(projections))
-    print("Standard deviation:         ", np.std(projections))
\ No newline at end of file
+  print_results(breakdown)
@@ -1,261 +1,975 @@
 import sys
 import os
+import time
+import tempfile
+import contextlib
 import numpy as np
-from anytree import Node, RenderTree
-from common import get_package_embedding, calculate_projection_length
+from collections.abc import Mapping
+from common import EmbeddingAccumulator, get_package_embedding_accumulators, calculate_projection_length, calculate_projection_lengths, calculate_norms
+from embeddingpipeline import EmbeddingPipeline
+from identifiercache import IdentifierCache
+from tolerantparsing import ParseReport
+from projectionmatrix import calculate_projection_matrix, calculate_sparse_projections
+from hierarchyoutput import get_hierarchy_nodes, write_hierarchy_json, write_hierarchy_adjacency
+from vocabularyvectors import load_model, get_model_id
+from embeddingcache import PackageEmbeddingCache
+from spanningarborescence import find_maximum_branching
+from sourceprovider import list_directory, get_source_root
+from projectwatcher import ProjectWatcher, WATCH_INTERVAL
 
 DEBUG = False
 
-def print_debug(*args, num_newlines=2, sep=" ", end="\n"):
-  if DEBUG:
-    print("\n" * num_newlines, end="")
-    print(*args, sep=sep, end=end)
+# Overlap reading, parsing and embedding of the classes of all packages (useful on network-mounted source trees)
+PIPELINED = False
 
-if __name__ == "__main__":
-  # Prompt user to enter path without final slash
-  path = input("Enter the path to the Java package that needs to be organized: ")
-  projection_threshold = float(input("Enter projection threshold at which a package should be considered a subpackage: "))
+# Path to an SQLite database in which the parsed identifiers of classes are shared between runs (None to always parse)
+IDENTIFIER_CACHE_PATH = None
 
-  packages = next(os.walk(path))[1]
+# Path to an SQLite database in which package embeddings are shared between runs, projects and branches (None to always embed the classes)
+EMBEDDING_CACHE_PATH = None
 
-  # FastText
-  import fasttext
-  original_directory = os.getcwd()
-  os.chdir(os.path.dirname(os.path.abspath(sys.argv[0]))) # Change the working directory to that of the file (so that the relative file path to the model file works consistently)
-  # model = fasttext.load_model('./models/crawl-300d-2M-subword.bin')
-  model = fasttext.load_model('./models/wiki-news-300d-1M-subword.bin')
-  os.chdir(original_directory) # Restore the original working directory so that paths are traversed normally in the rest of the program
-  
-  # For each package, derive its embedding from the classes it contains
-  package_embeddings = {}
-  for i in range(len(packages)):
-    package = packages[i]
-    package_path = path + "/" + package
-    package_embedding = get_package_embedding(package_path, model)
-    if package_embedding is not None:
-      package_embeddings[package_path] = package_embedding
+# Path to a tab-separated file to which the files that could not be parsed are written (None to only print a summary)
+PARSE_REPORT_PATH = None
 
-  # Find embedding for root package
-  root_package_embedding = get_package_embedding(path, model)
-  
-  ##########################
-  # Architecture discovery #
-  ##########################
-  """
-  Dictionary of group-package pairs `((pkg1, ...), pkg2)` to the length of the projection of `(pkg1, ...)` onto `pkg2`
-  """
-  pairwise_projections = {}
+# Path to the vocabulary vectors prepared for the project with vocabularyvectors.py (None to load the FastText model)
+VOCABULARY_VECTORS_PATH = None
 
-  """
-  Used to keep track of the package hierarchy during the algorithm.
-  
-  Example:
-    is_contained_in[(pkg1, ...)] == pkg2
+# Number of processes that calculate the pairwise projections from an embedding matrix in shared memory (1 to calculate them one by one in this process).
+# The projections are bit-identical for any number of processes (and with PROJECTION_MEMORY_BUDGET), because all of them are
+# calculated by the same kernel (see `common.calculate_projection_lengths`)
+PROJECTION_WORKERS = 1
 
-    (pkg1, ...) is a subpackage of pkg2
-  """
-  is_contained_in = {} 
+# Maximum number of bytes used at a time for calculating the pairwise projections (None to calculate all of them in memory).
+# If set, the projections are calculated in tiles directly from the package embeddings and only the ones that reach the
+# projection threshold are kept, in memory-mapped temporary files (the other projections of the packages in a loop are
+# recalculated one package at a time). The budget covers the tiles, not the package embeddings, which are in memory anyway
+PROJECTION_MEMORY_BUDGET = None
 
-  """
-  If multiple projections exist for the same subpackage, store the less-valued ones for later
-
-  Example:
-    Projection 1: 'bread' projected onto 'sandwich': 0.95
-    Projection 2: 'bread' projected onto 'lunch': 0.9
-
-    Initially 'bread' might be set such that it is a subpackage of 'sandwich'. In that case, projection 2
-     is obviously put aside, because 'bread' is already put inside a parent package, even if projection 2
-     is the next highest valued projection. However, if it so happens that 'bread' is part of a loop
-     structure, then all the packages that are part of this structure should be considered as one group. 
-     However, this group has no parent package at the time of discovery. Let's say that 'bread' and 
-     'sandwich' form a loop structure. In that case, we would like to reinstate projection 2.
-  """
-  backup_projections = {}
-  
-  """
-  Used to keep track of which packages are grouped together
-  
-  Example:
-    group_map[(pkg1,)] == (pkg1,pkg2,pkg3)
+# How to discover the hierarchy: "greedy" (assign the packages in descending order of their projection values, merging
+# loops into groups) or "arborescence" (the assignment with the highest total projection value, contracting loops into groups)
+DISCOVERY_ENGINE = "greedy"
 
-    pkg1 was grouped together with pkg2 and pkg3 because they formed a loop hierarchy.
+# Organize the children of every package and the members of every group of the recommended hierarchy among themselves as
+# well, from the top down, so that the hierarchy can be more than one level deep. This reuses the projections between the
+# packages, and the embeddings of the groups are derived from the running sums of their members
+ORGANIZE_RECURSIVELY = False
 
-  Example 2:
-    group_map[(pkg1,)] == (pkg1,)
+# How to output the recommended hierarchy: "tree" (rendered with anytree), "json" or "adjacency" (tab-separated, one node per line)
+OUTPUT_FORMAT = "tree"
 
-    pkg1 was not grouped together with other packages and simply forms its own group on its own
-  """
-  group_map = {}
+# The supported values of OUTPUT_FORMAT
+OUTPUT_FORMATS = ("tree", "json", "adjacency")
+
+# Path to the file to which the recommended hierarchy is written (None to print it)
+OUTPUT_PATH = None
+
+# Keep watching the source tree after the first recommendation and recommend the hierarchy again whenever it changes.
+# The class embeddings, package sums and projections are kept in memory and only updated for the classes and packages
+# that changed (see projectwatcher.py). Only for source trees on the file system; stop with Ctrl+C
+WATCH = False
+
+def print_debug(*args, num_newlines=2, sep=" ", end="\n"):
+  if DEBUG:
+    print("\n" * num_newlines, end="")
+    print(*args, sep=sep, end=end)
 
-  for this_package, this_package_embedding in package_embeddings.items():
-    # For each package, initialize the variables
+##########################
+# Architecture discovery #
+##########################
+# Number of packages of which `calculate_packages_projections` calculates the projections together
+PROJECTION_ROWS_PER_BLOCK = 256
+
+"""
+Calculate the projections of the embedding of a single package onto the embeddings of all other packages and onto the embedding of the root package
+
+:param package: the path to the package
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param root_path: the path to the root package
+:returns: dictionary of package path to the length of the projection of `package` onto that package (the root package first)
+"""
+def calculate_package_projections(package, package_embeddings, root_package_embedding, root_path):
+  return next(calculate_packages_projections([package], package_embeddings, root_package_embedding, root_path))[1]
+
+"""
+Calculate the projections of the embeddings of packages onto the embeddings of all other packages and onto the embedding of the root package
+
+The projections are calculated for PROJECTION_ROWS_PER_BLOCK packages at a time. Their values do not depend on that (see
+`common.calculate_projection_lengths`), so they are exactly the values `calculate_package_projections` gives.
+
+:param packages: the paths to the packages to calculate the projections of
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param root_path: the path to the root package
+:returns: a generator of `(package, package_projections)` tuples in the order of `packages`, where package_projections is as
+          returned by `calculate_package_projections`
+"""
+def calculate_packages_projections(packages, package_embeddings, root_package_embedding, root_path):
+  if len(packages) == 0:
+    return
+  that_packages = list(package_embeddings)
+  that_package_embeddings = list(package_embeddings.values())
+
+  # If the root package has an embedding, add the projection of the package onto the root package
+  if root_package_embedding is not None:
+    that_packages.insert(0, root_path)
+    that_package_embeddings.insert(0, root_package_embedding)
+  that_package_norms = calculate_norms(that_package_embeddings)
+
+  for block_start in range(0, len(packages), PROJECTION_ROWS_PER_BLOCK):
+    block = packages[block_start:block_start + PROJECTION_ROWS_PER_BLOCK]
+    projection_values = calculate_projection_lengths([package_embeddings[package] for package in block], that_package_embeddings, that_package_norms)
+    for package, package_projection_values in zip(block, projection_values):
+      yield package, {that_package: projection_value for that_package, projection_value in zip(that_packages, package_projection_values) if that_package != package}
+
+"""
+Calculate the projections of the embeddings of all packages onto each other and onto the embedding of the root package
+
+Projections between packages that are below the projection threshold can never make a package a subpackage of another
+one, so they can be left out; `discover_hierarchy` then recalculates the ones it needs with `calculate_package_projections`.
+The projections onto the root package are always kept, because they are needed to mark lax subpackages.
+
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param root_path: the path to the root package
+:param projection_threshold: the projection value a projection between packages needs to reach to be kept (None to keep all of them)
+:param this_packages: the packages to calculate the projections of, in the order of `package_embeddings` (None for all of them)
+:returns: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`
+"""
+def calculate_pairwise_projections(package_embeddings, root_package_embedding, root_path, projection_threshold=None, this_packages=None):
+  pairwise_projections = {}
+  for this_package, package_projections in calculate_packages_projections(list(package_embeddings if this_packages is None else this_packages), package_embeddings, root_package_embedding, root_path):
     this_package_as_tuple = (this_package,)
-    is_contained_in[this_package_as_tuple] = None
-    backup_projections[this_package_as_tuple] = []
-    group_map[this_package_as_tuple] = this_package_as_tuple
+    for that_package, projection_value in package_projections.items():
+      if projection_threshold is None or that_package == root_path or projection_value >= projection_threshold:
+        pairwise_projections[(this_package_as_tuple, that_package)] = projection_value
+  return pairwise_projections
+
+"""
+Calculate the same projections as `calculate_pairwise_projections`, but as one matrix product split over multiple processes
+
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param root_path: the path to the root package
+:param workers: the number of worker processes
+:param projection_threshold: the projection value a projection between packages needs to reach to be kept (None to keep all of them)
+:returns: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`
+"""
+def calculate_pairwise_projections_in_parallel(package_embeddings, root_package_embedding, root_path, workers, projection_threshold=None):
+  packages = list(package_embeddings)
+  projection_matrix = calculate_projection_matrix(list(package_embeddings.values()), workers)
+  kept = ~np.eye(len(packages), dtype=bool) # a package is never projected onto itself
+  if projection_threshold is not None:
+    kept &= projection_matrix >= projection_threshold
 
-    # If the root package has an embedding, add projections of subpackages onto root package
-    if root_package_embedding is not None: 
-      pairwise_projections[(this_package_as_tuple, path)] = calculate_projection_length(this_package_embedding, root_package_embedding)
+  pairwise_projections = {}
+  for i in range(len(packages)):
+    this_package_as_tuple = (packages[i],)
+    if root_package_embedding is not None:
+      pairwise_projections[(this_package_as_tuple, root_path)] = calculate_projection_length(package_embeddings[packages[i]], root_package_embedding)
+    for j in np.flatnonzero(kept[i]):
+      pairwise_projections[(this_package_as_tuple, packages[j])] = projection_matrix[i, j]
+  return pairwise_projections
+
+"""
+The projections of `calculate_pairwise_projections` as a read-only dictionary that is backed by arrays: the projections of
+the packages onto the root package, and the kept projections between the packages in compressed sparse row format
+
+The projections are never turned into a dictionary of tuples. `intern_projections` takes the arrays as they are (see
+`get_id_arrays`), and a single projection is looked up in the row of its package.
+
+:param packages: the paths to the packages in the order of the rows
+:param root_path: the path to the root package
+:param root_values: the projections of the packages onto the root package (None if the root package has no embedding)
+:param sparse_projections: the SparseProjections between the packages, indexed like `packages`
+"""
+class SparsePairwiseProjections(Mapping):
+  def __init__(self, packages, root_path, root_values, sparse_projections):
+    self.packages = packages
+    self.package_indices = {package: i for i, package in enumerate(packages)}
+    self.root_path = root_path
+    self.root_values = root_values
+    self.sparse_projections = sparse_projections
+
+  def __len__(self):
+    return len(self.sparse_projections) + (len(self.packages) if self.root_values is not None else 0)
+
+  def __iter__(self):
+    for i, package in enumerate(self.packages):
+      this_package_as_tuple = (package,)
+      if self.root_values is not None:
+        yield this_package_as_tuple, self.root_path
+      for j in self.sparse_projections.row(i)[0]:
+        yield this_package_as_tuple, self.packages[j]
+
+  def __getitem__(self, pair):
+    this_group, that_package = pair
+    i = self.package_indices.get(this_group[0]) if len(this_group) == 1 else None
+    if i is not None:
+      if that_package == self.root_path:
+        if self.root_values is not None:
+          return self.root_values[i]
+      elif that_package in self.package_indices:
+        j = self.package_indices[that_package]
+        indices, values = self.sparse_projections.row(i)
+        position = np.searchsorted(indices, j)
+        if position < len(indices) and indices[position] == j:
+          return values[position]
+    raise KeyError(pair)
 
-    ## Calculate pairwise projections 
-    for that_package, that_package_embedding in package_embeddings.items():
-      if this_package == that_package:
-        continue
-      pair = (this_package_as_tuple, that_package)
-      pairwise_projections[pair] = calculate_projection_length(this_package_embedding, that_package_embedding)
+  """
+  Get the projections as arrays of package ids, as `intern_projections` returns them
 
-  # If the root package has an embedding, we need to initialize the variables corresponding to the root package as well
+  :param ids: dictionary of path to id
+  :returns: a tuple `(child_ids, parent_ids, values)` in the order of the projections
+  """
+  def get_id_arrays(self, ids):
+    package_ids = np.array([ids[package] for package in self.packages], dtype=np.int32)
+    row_counts = np.diff(self.sparse_projections.indptr)
+    kept_parent_ids = package_ids[self.sparse_projections.indices]
+    if self.root_values is None:
+      return np.repeat(package_ids, row_counts), kept_parent_ids, np.array(self.sparse_projections.values)
+
+    # The projection onto the root package comes first in the row of each package
+    root_positions = self.sparse_projections.indptr[:-1] + np.arange(len(self.packages))
+    kept = np.ones(len(self), dtype=bool)
+    kept[root_positions] = False
+    parent_ids = np.empty(len(self), dtype=np.int32)
+    parent_ids[root_positions] = ids[self.root_path]
+    parent_ids[kept] = kept_parent_ids
+    values = np.empty(len(self), dtype=np.result_type(self.root_values, self.sparse_projections.values))
+    values[root_positions] = self.root_values
+    values[kept] = self.sparse_projections.values
+    return np.repeat(package_ids, row_counts + 1), parent_ids, values
+
+"""
+Calculate the projections of `calculate_pairwise_projections` that reach the projection threshold without ever holding all of them in memory
+
+The projections are calculated tile by tile directly from the package embeddings, stacking only the embeddings of the
+current tile. The memory budget covers the tiles, not the package embeddings themselves. The kept projections are stored
+in memory-mapped temporary files. The projections onto the root package are all kept, because they are needed to mark lax
+subpackages.
+
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param root_path: the path to the root package
+:param projection_threshold: the projection value a projection needs to reach to be kept
+:param memory_budget: the maximum number of bytes used at a time for calculating projections (besides the package embeddings)
+:returns: a SparsePairwiseProjections of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`
+"""
+def calculate_pairwise_projections_out_of_core(package_embeddings, root_package_embedding, root_path, projection_threshold, memory_budget):
+  packages = list(package_embeddings)
+  if len(packages) == 0:
+    return {}
+
+  sparse_projections = calculate_sparse_projections([package_embeddings[package] for package in packages], projection_threshold, memory_budget=memory_budget, directory=tempfile.gettempdir())
+  root_values = None
   if root_package_embedding is not None:
-    group_map[(path,)] = (path,)
-    is_contained_in[(path,)] = None
+    root_values = np.array([calculate_projection_length(package_embeddings[package], root_package_embedding) for package in packages])
+  return SparsePairwiseProjections(packages, root_path, root_values, sparse_projections)
+
+"""
+Calculate the projections that reach the projection threshold (and the projections onto the root package) in the way
+configured by PROJECTION_MEMORY_BUDGET and PROJECTION_WORKERS
+
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param root_path: the path to the root package
+:param projection_threshold: the projection value a projection between packages needs to reach to be kept
+:returns: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2` (a
+          SparsePairwiseProjections if PROJECTION_MEMORY_BUDGET is set)
+"""
+def calculate_configured_pairwise_projections(package_embeddings, root_package_embedding, root_path, projection_threshold):
+  if PROJECTION_MEMORY_BUDGET is not None:
+    return calculate_pairwise_projections_out_of_core(package_embeddings, root_package_embedding, root_path, projection_threshold, PROJECTION_MEMORY_BUDGET)
+  if PROJECTION_WORKERS > 1:
+    return calculate_pairwise_projections_in_parallel(package_embeddings, root_package_embedding, root_path, PROJECTION_WORKERS, projection_threshold)
+  return calculate_pairwise_projections(package_embeddings, root_package_embedding, root_path, projection_threshold)
+
+"""
+Intern the packages of the projections to dense integer ids
+
+Ids are assigned in the alphabetical order of the paths, so sorting ids sorts the paths they stand for. The arrays of a
+SparsePairwiseProjections are mapped to ids as a whole.
+
+:param pairwise_projections: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`
+:param packages: the paths to the packages that have an embedding
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding (i.e. whether `pairwise_projections` contains projections onto `root_path`)
+:returns: a tuple `(paths, child_ids, parent_ids, values)` where `paths[i]` is the path of id i and the k-th projection is
+          the projection of package `child_ids[k]` onto package `parent_ids[k]` with value `values[k]`, in the order of `pairwise_projections`
+"""
+def intern_projections(pairwise_projections, packages, root_path, has_root_embedding):
+  paths = sorted(set(packages) | ({root_path} if has_root_embedding else set()))
+  ids = {path: i for i, path in enumerate(paths)}
+  if isinstance(pairwise_projections, SparsePairwiseProjections):
+    return (paths,) + pairwise_projections.get_id_arrays(ids)
+  child_ids = np.fromiter((ids[child[0]] for child, _ in pairwise_projections), dtype=np.int32, count=len(pairwise_projections))
+  parent_ids = np.fromiter((ids[parent] for _, parent in pairwise_projections), dtype=np.int32, count=len(pairwise_projections))
+  values = np.array(list(pairwise_projections.values())) if len(pairwise_projections) > 0 else np.zeros(0)
+  return paths, child_ids, parent_ids, values
+
+"""
+A group of packages during discovery: a single package, or the packages that formed a loop
+
+:param members: the ids of the packages in the group in ascending order
+"""
+class DiscoveryGroup:
+  __slots__ = ("members", "parent", "value", "alive", "candidates", "backups")
+
+  def __init__(self, members):
+    self.members = members
+    # Id of the package the group is a subpackage of (-1 if none) and the projection value with which it was assigned
+    self.parent = -1
+    self.value = None
+    # Whether the group still exists, i.e. has not been merged into a larger group
+    self.alive = True
+    # Candidates of which the group is the child that were added to the queue after a loop merge
+    self.candidates = []
+    # Candidates that were put aside because the group already had a parent (reinstated if the group becomes part of a loop)
+    self.backups = []
+
+"""
+Candidate projections of groups onto packages, stored column-wise in arrays that grow as candidates are added
+
+:param child_ids: the ids of the child groups of the initial candidates
+:param parent_ids: the ids of the parent packages of the initial candidates
+:param values: the projection values of the initial candidates
+"""
+class CandidateArrays:
+  __slots__ = ("child", "parent", "value", "done", "count")
+
+  def __init__(self, child_ids, parent_ids, values):
+    self.count = len(values)
+    capacity = max(16, 2 * self.count)
+    self.child = np.zeros(capacity, dtype=np.int32)
+    self.parent = np.zeros(capacity, dtype=np.int32)
+    self.value = np.zeros(capacity, dtype=values.dtype)
+    # Whether the candidate has left the queue (because it was taken out or because its child was merged into a group)
+    self.done = np.zeros(capacity, dtype=bool)
+    self.child[:self.count] = child_ids
+    self.parent[:self.count] = parent_ids
+    self.value[:self.count] = values
 
-  pairwise_projections = dict(sorted(pairwise_projections.items(), key=lambda item: item[1], reverse=True))
-  
-  # Recommend a hierarchy using the PackageEmbedding-on-PackageEmbedding projections
-  queue = pairwise_projections.copy()
-  while (len(queue) > 0):
-    projection = next(iter(queue))
-    projection_child, projection_parent = projection
-    value = queue.pop(projection)
-
-    if (value >= projection_threshold):
-      if is_contained_in[projection_child] is None:
-        is_contained_in[projection_child] = projection_parent
-        
-        # Test for loop
-        parent = (projection_parent,)
-        seen = [parent]
-
-        print_debug("Projection_child is", projection_child, "and projection_parent is", projection_parent)
-        
-        while is_contained_in[group_map[parent]] is not None:
-          parent = (is_contained_in[group_map[parent]],)
-          if (parent[0] in projection_child):
-            print_debug("Detected a loop. More specifically", parent[0], "was found in", projection_child)
-            print_debug("Seen is", seen)
-            print_debug("group_map is", group_map)
-
-            # There is a loop in the current package hierarchy
-            # Each package in the loop structure should not be contained in another package on its own
-            involved = set(map(lambda x : group_map[x], seen))
-
-            print_debug("The involved packages before adding projection_child are:", involved)
-
-            involved.add(projection_child)
-
-            print_debug("The involved packages are:", involved)
-            print_debug("is_contained_in before removing the old packages was:", is_contained_in)
-              
-            for g in involved:
-              is_contained_in.pop(g)
-
-            print_debug("is_contained_in after removing the old packages is:", is_contained_in)
-
-            # Instead all of the packages in the loop structure should form a group and the entire group is contained in some other package
-            group_tuple = tuple({item for tup in involved for item in tup}) # flatten
-            is_contained_in[group_tuple] = None
-            
-            print_debug("is_contained_in after adding the group tuple is:", is_contained_in)
-
-            # Update the queue to reflect the creation of the group
-            _queue = queue.copy()
-            _replaced_keys = set()
-            _parent_to_projections_map = {}
-            for _projection_with_value in _queue.items():
-              _projection, _ = _projection_with_value
-              _projection_child, _projection_parent = _projection
-              if _projection_child in involved:
-                _replaced_keys.add(_projection_child)
-              
-                # For each `(child, parent): value` item where `child` was part of the loop hierarchy, remove that item and add it to `_parent_to_projections_map` for it to be averaged later
-                queue.pop(_projection)
-
-                print_debug("found an item in the queue:", _projection_with_value)
-
-                if _projection_parent not in group_tuple: # a group cannot be a subpackage of one of its members
-                  print_debug("the parent is not in group_tuple, so we add it to _parent_to_projections_map")
-                  _parent_to_projections_map.setdefault(_projection_parent, []).append(_projection_with_value)
-                  print_debug("_parent_to_projections_map now looks like:", _parent_to_projections_map)
-            
-            # Also, take into account the backup projections that involve one of the affected packages / package groups
-            print_debug("backup projections before adding back elements was", backup_projections)
-
-            for pkg in involved:
-              for backup_projection_with_value in backup_projections[pkg]:
-                backup_projection, _ = backup_projection_with_value
-                backup_projection_parent = backup_projection[1]
-
-                print_debug("found an item in backup list:", backup_projection_with_value)
-                
-                if backup_projection_parent not in group_tuple: # a group cannot be a subpackage of one of its members
-                  print_debug("the parent is not in group_tuple, so we add it to _parent_to_projections_map")
-                  _parent_to_projections_map.setdefault(backup_projection_parent, []).append(backup_projection_with_value)
-                  print_debug("_parent_to_projections_map now looks like:", _parent_to_projections_map)
-                  
-            # Calculate all average projection values and add back to queue as (group_tuple, parent): average_projection_value
-            for parent, list_of_projections in _parent_to_projections_map.items():
-              average_projection_value = np.average(list(map(lambda x : x[1], list_of_projections)))
-              queue[(group_tuple, parent)] = average_projection_value
-
-            # And each individual package `pkg` should now be mapped to the group they comprise, because we need to look at is_contained_in(group_tuple) instead of is_contained_in(pkg)
-            for pkg in group_tuple:
-              group_map[(pkg,)] = group_tuple
-
-            # For all restored projections that are now both in backup_projections and queue, remove them from backup_projections
-            for _projection_child in _replaced_keys:
-              backup_projections.pop(_projection_child)
-            # Also, facilitate backup projections for the new group
-            backup_projections[group_tuple] = []
-            
-            print_debug("backup projections after adding back elements was", backup_projections)
-            print_debug("and now queue is", queue)
-            
-            # if new items were added, the dict needs to be resorted, because the new items have been added to the end 
-            queue = dict(sorted(queue.items(), key=lambda item: item[1], reverse=True))
-            
-            print_debug("and after sorting, queue is", queue)
-
-            break
+  """
+  Add a candidate
+
+  :returns: the index of the candidate
+  """
+  def append(self, child, parent, value):
+    if self.count == len(self.value):
+      for name in ("child", "parent", "value", "done"):
+        column = getattr(self, name)
+        setattr(self, name, np.concatenate([column, np.zeros_like(column)]))
+    index = self.count
+    self.child[index] = child
+    self.parent[index] = parent
+    self.value[index] = value
+    self.count += 1
+    return index
+
+"""
+Recommend a package hierarchy from projections between packages identified by integer ids
+
+This is the algorithm of `discover_hierarchy`, on integer ids instead of paths. Candidates are taken out of the queue in
+descending order of their value, where candidates with equal values keep the order in which they were added. Each group
+is assigned to the parent of its best candidate; the candidates that come later are put aside as backups. If an assignment
+closes a loop, the groups in the loop are merged into a new group, whose candidates are the averages (per parent) of the
+candidates and backups of its members.
+
+Only the candidates that reach the threshold are put in the queue, because the others can never be taken out of it. They
+are still needed to average the candidates of a merged group, so the projections of its members that were not given at all
+(because they were left out when the projections were calculated) are recalculated with `get_projections`.
+
+:param child_ids: the ids of the projected packages, as returned by `intern_projections`
+:param parent_ids: the ids of the packages projected onto
+:param values: the projection values
+:param package_ids: the ids of the packages that have an embedding, in the order in which they appear in the result
+:param root_id: the id of the root package if it has an embedding, None otherwise
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param get_projections: a function that returns all projections of a package id as a tuple `(parent_ids, values)`, in the
+                        order in which they would be given if none were left out (None if none were left out)
+:returns: a tuple `(groups, group_order, assignment_order)` where groups is a list of DiscoveryGroup indexed by group id (the group of
+          a single package has the id of the package), group_order lists the ids of all groups in the order in which they were
+          created and assignment_order lists the ids of the groups in the order in which they were assigned to their parent
+"""
+def discover_hierarchy_ids(child_ids, parent_ids, values, package_ids, root_id, projection_threshold, get_projections=None):
+  import heapq
+
+  group_order = list(package_ids) + ([root_id] if root_id is not None else [])
+  groups = [None] * (max(group_order) + 1 if len(group_order) > 0 else 0)
+  for group_id in group_order:
+    groups[group_id] = DiscoveryGroup((group_id,))
+  # The id of the group each package is part of
+  group_of_package = list(range(len(groups)))
+  package_rank = {package_id: rank for rank, package_id in enumerate(package_ids)}
+  assignment_order = []
+
+  candidates = CandidateArrays(child_ids, parent_ids, values)
+  # The initial candidates that reach the threshold in queue order, and the initial candidates of each package (in the order they were given)
+  above_threshold = np.flatnonzero(values >= projection_threshold)
+  initial_order = above_threshold[np.argsort(-values[above_threshold], kind="stable")]
+  initial_count = len(initial_order)
+  initial_by_child = np.argsort(child_ids, kind="stable")
+  initial_by_child_start = np.searchsorted(child_ids[initial_by_child], np.arange(len(groups) + 1))
+  # Candidates added after loop merges, as (-value, index) so that ties are broken by the order in which they were added
+  added_queue = []
+  position = 0
+
+  while True:
+    while position < initial_count and candidates.done[initial_order[position]]:
+      position += 1
+    while len(added_queue) > 0 and candidates.done[added_queue[0][1]]:
+      heapq.heappop(added_queue)
+    if position < initial_count and (len(added_queue) == 0 or (-float(candidates.value[initial_order[position]]), initial_order[position]) < added_queue[0]):
+      candidate = initial_order[position]
+      position += 1
+    elif len(added_queue) > 0:
+      candidate = heapq.heappop(added_queue)[1]
+    else:
+      break
+    candidates.done[candidate] = True
+    value = candidates.value[candidate]
+
+    child = int(candidates.child[candidate])
+    parent = int(candidates.parent[candidate])
+    child_group = groups[child]
+    if child_group.parent != -1:
+      child_group.backups.append(candidate)
+      continue
+
+    child_group.parent = parent
+    child_group.value = value
+    assignment_order.append(child)
+
+    # Test for loop: follow the parents upwards until a package without a parent or a member of the child group is reached
+    seen = [parent]
+    ancestor = parent
+    while groups[group_of_package[ancestor]].parent != -1:
+      ancestor = groups[group_of_package[ancestor]].parent
+      if group_of_package[ancestor] != child:
+        seen.append(ancestor)
+        continue
+
+      # There is a loop: all groups in it are merged into a new group that has no parent yet
+      involved = {group_of_package[package] for package in seen}
+      involved.add(child)
+      members = tuple(sorted(member for group_id in involved for member in groups[group_id].members))
+      member_set = set(members)
+      group_id = len(groups)
+      group = DiscoveryGroup(members)
+      groups.append(group)
+      group_of_package.append(group_id)
+      group_order.append(group_id)
+      for involved_id in involved:
+        groups[involved_id].alive = False
+      print_debug("Detected a loop, merging the groups", [groups[involved_id].members for involved_id in involved])
+
+      # The candidates of the merged groups that were not taken out of the queue, in queue order, followed by their backups, are averaged per parent.
+      # Remaining candidates are sorted by (-value, order in which they were given or added, parent, value)
+      remaining = []
+      for involved_id in involved:
+        if involved_id < len(initial_by_child_start) - 1:
+          initial_candidates = initial_by_child[initial_by_child_start[involved_id]:initial_by_child_start[involved_id + 1]]
+          if get_projections is None:
+            remaining.extend((-float(candidates.value[index]), (0, index), int(candidates.parent[index]), candidates.value[index]) for index in initial_candidates[~candidates.done[initial_candidates]].tolist())
           else:
-            seen.append(parent)
+            # The given candidates are part of all projections of the package, so they take the place of those projections
+            given = dict(zip(candidates.parent[initial_candidates].tolist(), initial_candidates.tolist()))
+            for row_position, (projection_parent, projection_value) in enumerate(zip(*get_projections(involved_id))):
+              index = given.get(projection_parent)
+              if index is not None:
+                if candidates.done[index]:
+                  continue
+                projection_value = candidates.value[index]
+              remaining.append((-float(projection_value), (0, package_rank[involved_id], row_position), projection_parent, projection_value))
+          candidates.done[initial_candidates] = True
+        for index in groups[involved_id].candidates:
+          if not candidates.done[index]:
+            remaining.append((-float(candidates.value[index]), (1, index), int(candidates.parent[index]), candidates.value[index]))
+            candidates.done[index] = True
+      remaining.sort(key=lambda candidate: candidate[:2])
+
+      parent_to_values = {}
+      for _, _, remaining_parent, remaining_value in remaining:
+        if remaining_parent not in member_set: # a group cannot be a subpackage of one of its members
+          parent_to_values.setdefault(remaining_parent, []).append(remaining_value)
+      for involved_id in sorted(involved, key=lambda involved_id: groups[involved_id].members):
+        for index in groups[involved_id].backups:
+          if candidates.parent[index] not in member_set:
+            parent_to_values.setdefault(int(candidates.parent[index]), []).append(candidates.value[index])
+
+      for group_parent, group_values in parent_to_values.items():
+        average_value = np.average(group_values)
+        index = candidates.append(group_id, group_parent, average_value)
+        group.candidates.append(index)
+        if candidates.value[index] >= projection_threshold:
+          heapq.heappush(added_queue, (-float(candidates.value[index]), index))
+
+      for member in members:
+        group_of_package[member] = group_id
+      break
+
+  return groups, group_order, assignment_order
+
+"""
+Recommend a package hierarchy from the projections of the packages onto each other
+
+The packages are interned to integer ids, the hierarchy is discovered on the ids (see `discover_hierarchy_ids`) and only
+the result is mapped back to paths.
+
+:param pairwise_projections: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`,
+                             of which the projections between packages below the threshold may be left out
+:param packages: the paths to the packages that have an embedding
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding (i.e. whether `pairwise_projections` contains projections onto `root_path`)
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param projection_values: an optional dictionary to which the projection value with which each group in the hierarchy was assigned to its parent is added
+:param get_package_projections: a function that returns all projections of a package as `calculate_package_projections` does,
+                                needed if projections were left out of `pairwise_projections` (see `calculate_pairwise_projections`)
+:returns: dictionary `is_contained_in` where `is_contained_in[(pkg1, ...)] == pkg2` means that the group `(pkg1, ...)` is a subpackage of `pkg2`
+          (or of nothing if `pkg2` is None)
+"""
+def discover_hierarchy(pairwise_projections, packages, root_path, has_root_embedding, projection_threshold, projection_values=None, get_package_projections=None):
+  paths, child_ids, parent_ids, values = intern_projections(pairwise_projections, packages, root_path, has_root_embedding)
+  ids = {path: i for i, path in enumerate(paths)}
+  root_id = ids[root_path] if has_root_embedding else None
+
+  get_projections = None
+  if get_package_projections is not None:
+    def get_projections(package_id):
+      package_projections = get_package_projections(paths[package_id])
+      return [ids[parent] for parent in package_projections], list(package_projections.values())
+
+  groups, group_order, assignment_order = discover_hierarchy_ids(child_ids, parent_ids, values, [ids[package] for package in packages], root_id, projection_threshold, get_projections)
+  return get_is_contained_in(groups, group_order, assignment_order, paths, projection_values)
+
+"""
+Map the groups discovered by `discover_hierarchy_ids` back to paths
+
+:param groups: the groups as returned by `discover_hierarchy_ids`
+:param group_order: the order of the groups as returned by `discover_hierarchy_ids`
+:param assignment_order: the order of the assignments as returned by `discover_hierarchy_ids`
+:param paths: the path of each package id
+:param projection_values: an optional dictionary to which the projection value with which each group in the hierarchy was assigned to its parent is added
+:returns: dictionary `is_contained_in` as described in `discover_hierarchy`
+"""
+def get_is_contained_in(groups, group_order, assignment_order, paths, projection_values=None):
+  is_contained_in = {}
+  for group_id in group_order:
+    group = groups[group_id]
+    if group.alive:
+      is_contained_in[tuple(paths[member] for member in group.members)] = paths[group.parent] if group.parent != -1 else None
+  if projection_values is not None:
+    for group_id in assignment_order:
+      group = groups[group_id]
+      if group.alive:
+        projection_values[tuple(paths[member] for member in group.members)] = group.value
+  return is_contained_in
+
+"""
+Recommend a package hierarchy as the maximum spanning arborescence of the projections between the packages
+
+The packages are the vertices of a directed graph, with an edge from each package onto which another one projects at or
+above the threshold to that other package, weighted by the projection value. The optimal parent assignment is found with
+the Chu-Liu/Edmonds algorithm (see `find_maximum_branching`), where leaving a package without parent counts as a projection
+at the threshold. The cycles that the algorithm contracts take the place of the loops of `discover_hierarchy`: their
+packages form a group, which is assigned to the parent of the edge that enters the cycle, with the value of that edge.
+
+:param pairwise_projections: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`,
+                             of which the projections between packages below the threshold may be left out
+:param packages: the paths to the packages that have an embedding
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding (i.e. whether `pairwise_projections` contains projections onto `root_path`)
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param projection_values: an optional dictionary to which the projection value with which each group in the hierarchy was assigned to its parent is added
+:returns: dictionary `is_contained_in` as described in `discover_hierarchy`
+"""
+def discover_hierarchy_arborescence(pairwise_projections, packages, root_path, has_root_embedding, projection_threshold, projection_values=None):
+  paths, child_ids, parent_ids, values = intern_projections(pairwise_projections, packages, root_path, has_root_embedding)
+  above_threshold = values >= projection_threshold
+  child_ids, parent_ids, values = child_ids[above_threshold], parent_ids[above_threshold], values[above_threshold]
+  _, components, component_edges = find_maximum_branching(len(paths), parent_ids, child_ids, values, projection_threshold)
+
+  ids = {path: i for i, path in enumerate(paths)}
+  group_order = [ids[package] for package in packages] + ([ids[root_path]] if has_root_embedding else [])
+  groups = [DiscoveryGroup((i,)) for i in range(len(paths))]
+  members_of_component = {}
+  for package_id, component in enumerate(components):
+    members_of_component.setdefault(component, []).append(package_id)
+
+  assignment_order = []
+  for component, members in sorted(members_of_component.items(), key=lambda item: item[1]):
+    if len(members) > 1:
+      group_id = len(groups)
+      groups.append(DiscoveryGroup(tuple(members)))
+      group_order.append(group_id)
+      for member in members:
+        groups[member].alive = False
+      print_debug("Contracted a loop into a group", tuple(paths[member] for member in members))
+    else:
+      group_id = members[0]
+    edge = component_edges[component]
+    if edge != -1:
+      groups[group_id].parent = int(parent_ids[edge])
+      groups[group_id].value = values[edge]
+      assignment_order.append(group_id)
+  return get_is_contained_in(groups, group_order, assignment_order, paths, projection_values)
+
+# Stands for the group that is organized by `organize_recursively` in place of the root package (no package has an empty path)
+GROUP_ROOT = ""
+
+"""
+Recommend a hierarchy for a subset of the packages, using the projections that were calculated between all of them
+
+:param members: the paths to the packages to organize, in the order in which they were given to `discover_hierarchy`
+:param projections_by_package: dictionary of package path to a dictionary of the paths of the packages it is projected onto
+                               to the projection value, as kept in `pairwise_projections`
+:param root_projections: dictionary of member path to its projection onto the package the members are organized under
+                         (None to not consider it as a parent)
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param get_package_projections: a function that returns all projections of a package, as `calculate_package_projections` does
+:param discovery_engine: "greedy" or "arborescence" (see DISCOVERY_ENGINE)
+:returns: a tuple `(is_contained_in, projection_values)` as described in `discover_hierarchy`, where GROUP_ROOT stands for
+          the package the members are organized under
+"""
+def discover_member_hierarchy(members, projections_by_package, root_projections, projection_threshold, get_package_projections, discovery_engine):
+  member_set = set(members)
+  member_projections = {}
+  for member in members:
+    if root_projections is not None:
+      member_projections[((member,), GROUP_ROOT)] = root_projections[member]
+    for parent, projection_value in projections_by_package.get(member, {}).items():
+      if parent in member_set:
+        member_projections[((member,), parent)] = projection_value
+
+  def get_member_projections(member):
+    package_projections = {GROUP_ROOT: root_projections[member]} if root_projections is not None else {}
+    package_projections.update((parent, projection_value) for parent, projection_value in get_package_projections(member).items() if parent in member_set)
+    return package_projections
+
+  projection_values = {}
+  if discovery_engine == "arborescence":
+    is_contained_in = discover_hierarchy_arborescence(member_projections, members, GROUP_ROOT, root_projections is not None, projection_threshold, projection_values)
+  else:
+    is_contained_in = discover_hierarchy(member_projections, members, GROUP_ROOT, root_projections is not None, projection_threshold, projection_values, get_member_projections)
+  return is_contained_in, projection_values
+
+"""
+Organize the children of every package and the members of every group of a recommended hierarchy among themselves
+
+The hierarchy is visited from the top down. The children of a package (or of the root package) are all subpackages of it
+already, so only their projections onto each other are considered: a child that reaches the threshold on another child
+becomes a subpackage of that child, and children that form a loop become a group. The members of a group are organized
+with the embedding of the group (the mean of the classes of all its members) in place of the root package, so the members
+that are closest to the group as a whole stay at its top and the others become subpackages of them. Every package and
+group is visited once, after all packages that will be moved into it have been, so it ends when the hierarchy is visited.
+
+The projections between the packages are taken from `pairwise_projections` (and `get_package_projections` for the ones
+below the threshold), and the embedding of a group is derived from the running sums of its members, so nothing is read or
+embedded again.
+
+:param is_contained_in: the hierarchy as returned by `discover_hierarchy`
+:param projection_values: the projection values as collected by `discover_hierarchy`
+:param pairwise_projections: the projections from which the hierarchy was discovered
+:param package_accumulators: dictionary of package path to the EmbeddingAccumulator of its classes
+:param packages: the paths to the packages that have an embedding, in the order in which they were given to `discover_hierarchy`
+:param root_path: the path to the root package
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param get_package_projections: a function that returns all projections of a package, as `calculate_package_projections` does
+:param discovery_engine: "greedy" or "arborescence" (see DISCOVERY_ENGINE)
+:returns: a tuple `(is_contained_in, projection_values)` of the deeper hierarchy, in the same form as the given ones
+"""
+def organize_recursively(is_contained_in, projection_values, pairwise_projections, package_accumulators, packages, root_path, projection_threshold, get_package_projections, discovery_engine="greedy"):
+  package_order = {package: i for i, package in enumerate(packages)}
+  projections_by_package = {}
+  for (child,), parent in pairwise_projections:
+    projections_by_package.setdefault(child, {})[parent] = pairwise_projections[((child,), parent)]
+
+  # The hierarchy as a tree whose nodes are package paths and (for groups) tuples ("•", number); root_path is the root
+  children = {root_path: []}
+  parent_nodes = {}
+  parent_paths = {} # the parent of each node as it appears in `is_contained_in` (a path or None)
+  node_values = {}
+  group_members = {}
+
+  def add_node(node, parent_node, parent_path, projection_value):
+    if node in parent_nodes:
+      children[parent_nodes[node]].remove(node)
+    children.setdefault(parent_node, []).append(node)
+    children.setdefault(node, [])
+    parent_nodes[node] = parent_node
+    parent_paths[node] = parent_path
+    node_values.pop(node, None)
+    if projection_value is not None:
+      node_values[node] = projection_value
+
+  def add_group(members, parent_node, parent_path, projection_value):
+    group = ("•", len(group_members))
+    group_members[group] = members
+    add_node(group, parent_node, parent_path, projection_value)
+    for member in members:
+      add_node(member, group, None, None)
+
+  for group, parent in is_contained_in.items():
+    if group == (root_path,):
+      continue
+    parent_node = root_path if parent is None else parent
+    children.setdefault(parent_node, [])
+    if len(group) > 1:
+      add_group(group, parent_node, parent, projection_values.get(group))
+    else:
+      add_node(group[0], parent_node, parent, projection_values.get(group))
+
+  queue = [root_path]
+  position = 0
+  while position < len(queue):
+    node = queue[position]
+    position += 1
+    members = sorted((child for child in children[node] if not isinstance(child, tuple)), key=package_order.get)
+    if len(members) > 1:
+      if isinstance(node, tuple):
+        group_accumulator = EmbeddingAccumulator()
+        for member in group_members[node]:
+          group_accumulator.merge(package_accumulators[member])
+        group_embedding = group_accumulator.mean()
+        root_projections = {member: calculate_projection_length(package_accumulators[member].mean(), group_embedding) for member in members}
       else:
-        # if the child already has a parent, save this item for later in case the child is part of a loop hierarchy
-        backup_projections[projection_child].append((projection, value))
+        root_projections = None
+      member_is_contained_in, member_projection_values = discover_member_hierarchy(members, projections_by_package, root_projections, projection_threshold, get_package_projections, discovery_engine)
+
+      for group, parent in member_is_contained_in.items():
+        if parent is None or parent == GROUP_ROOT:
+          # A group can only be nested in a package, because the hierarchy refers to the parent of a group by its path
+          if len(group) > 1 and not isinstance(node, tuple):
+            print_debug("Grouped the children of", node, "into", group)
+            add_group(group, node, node, member_projection_values.get(group))
+        elif len(group) > 1:
+          print_debug("Grouped the members of", node, "into", group, "under", parent)
+          add_group(group, parent, parent, member_projection_values.get(group))
+        else:
+          add_node(group[0], parent, parent, member_projection_values.get(group))
+    queue.extend(children[node])
+
+  # Write the tree back in the form of `is_contained_in`, parents before their children
+  deeper_is_contained_in = {}
+  deeper_projection_values = {}
+  if (root_path,) in is_contained_in:
+    deeper_is_contained_in[(root_path,)] = is_contained_in[(root_path,)]
+  for node in queue:
+    if node == root_path:
+      continue
+    if isinstance(node, tuple):
+      group = tuple(sorted(child for child in children[node] if not isinstance(child, tuple)))
+    elif isinstance(parent_nodes[node], tuple):
+      continue # a package at the top of a group is part of the key of the group
+    else:
+      group = (node,)
+    deeper_is_contained_in[group] = parent_paths[node]
+    if node in node_values:
+      deeper_projection_values[group] = node_values[node]
+  return deeper_is_contained_in, deeper_projection_values
 
 ####################################
 # Display result in tree structure #
 ####################################
 def add_package_to_tree(child, parent, package_to_node_map):
+  from anytree import Node
   if child not in package_to_node_map:
     package_to_node_map[child] = Node(child, parent=parent)
   else:
     package_to_node_map[child].parent = parent
 
-# Construct the tree
-root = Node(path)
-package_to_node_map = {}
-package_to_node_map[None] = root
-package_to_node_map[path] = root
-for children, parent in is_contained_in.items():
-  if parent not in package_to_node_map:
-    package_to_node_map[parent] = Node(parent)
-  if len(children) > 1: # subpackage containing multiple packages
-    subpackage = Node("•", parent=package_to_node_map[parent])
-    for child in children:
-      add_package_to_tree(child, subpackage, package_to_node_map)
-  else: # singular package
-    if children[0] != path: # the root package is not contained in anything (None). Since None maps to the root package, we have to make sure that the root package is not added as a child node of itself.
-      add_package_to_tree(children[0], package_to_node_map[parent], package_to_node_map)
-
-# Mark lax subpackages
-if root_package_embedding is not None:
-  for subpackage_node in root.children:
-    projection_length = np.mean([pairwise_projections[((subpackage_child_node.name,), path)] for subpackage_child_node in subpackage_node.children]) if subpackage_node.name == "•" else pairwise_projections[((subpackage_node.name,), path)]
-    if projection_length < projection_threshold:
-      subpackage_node.name += " (lax, projection value = " + str(projection_length) + ")" 
-
-# Print result
-print("Recommended package structure of \"" + os.path.basename(path) + "\" with threshold = " + str(projection_threshold) + ":")
-for pre, fill, node in RenderTree(root):
-  print("%s%s" % (pre, os.path.basename(node.name)))
\ No newline at end of file
+"""
+Build the recommended package hierarchy as a tree, marking subpackages of the root package whose projection value is below the threshold as lax
+
+:param is_contained_in: the hierarchy as returned by `discover_hierarchy`
+:param pairwise_projections: the projections as returned by `calculate_pairwise_projections`
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:returns: the root node of the tree
+"""
+def build_tree(is_contained_in, pairwise_projections, root_path, has_root_embedding, projection_threshold):
+  from anytree import Node # imported on first use, because the tree is only built for the "tree" output format
+  # Construct the tree
+  root = Node(root_path)
+  package_to_node_map = {}
+  package_to_node_map[None] = root
+  package_to_node_map[root_path] = root
+  for children, parent in is_contained_in.items():
+    if parent not in package_to_node_map:
+      package_to_node_map[parent] = Node(parent)
+    if len(children) > 1: # subpackage containing multiple packages
+      subpackage = Node("•", parent=package_to_node_map[parent])
+      for child in children:
+        add_package_to_tree(child, subpackage, package_to_node_map)
+    else: # singular package
+      if children[0] != root_path: # the root package is not contained in anything (None). Since None maps to the root package, we have to make sure that the root package is not added as a child node of itself.
+        add_package_to_tree(children[0], package_to_node_map[parent], package_to_node_map)
+
+  # Mark lax subpackages
+  if has_root_embedding:
+    for subpackage_node in root.children:
+      projection_length = np.mean([pairwise_projections[((subpackage_child_node.name,), root_path)] for subpackage_child_node in subpackage_node.children]) if subpackage_node.name == "•" else pairwise_projections[((subpackage_node.name,), root_path)]
+      if projection_length < projection_threshold:
+        subpackage_node.name += " (lax, projection value = " + str(projection_length) + ")" 
+
+  return root
+
+##################################
+# Recommend and output hierarchy #
+##################################
+"""
+Discover the recommended hierarchy of the packages with the configured discovery engine (and recursively if configured)
+
+:param pairwise_projections: the projections as returned by `calculate_pairwise_projections`
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+:param package_accumulators: dictionary of package path to the EmbeddingAccumulator of its classes
+:param root_path: the path to the root package
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:returns: a tuple `(is_contained_in, projection_values)` as filled in by `discover_hierarchy`
+"""
+def recommend_hierarchy(pairwise_projections, package_embeddings, root_package_embedding, package_accumulators, root_path, projection_threshold):
+  # The projections below the threshold are recalculated for the packages that end up in a loop
+  get_package_projections = lambda package: calculate_package_projections(package, package_embeddings, root_package_embedding, root_path)
+  projection_values = {}
+  if DISCOVERY_ENGINE == "arborescence":
+    is_contained_in = discover_hierarchy_arborescence(pairwise_projections, list(package_embeddings), root_path, root_package_embedding is not None, projection_threshold, projection_values)
+  else:
+    is_contained_in = discover_hierarchy(pairwise_projections, list(package_embeddings), root_path, root_package_embedding is not None, projection_threshold, projection_values, get_package_projections)
+  if ORGANIZE_RECURSIVELY:
+    is_contained_in, projection_values = organize_recursively(is_contained_in, projection_values, pairwise_projections, package_accumulators, list(package_embeddings), root_path, projection_threshold, get_package_projections, DISCOVERY_ENGINE)
+  return is_contained_in, projection_values
+
+"""
+Write the recommended hierarchy in the configured output format (raises ValueError if OUTPUT_FORMAT is not supported)
+
+:param is_contained_in: the hierarchy as returned by `recommend_hierarchy`
+:param projection_values: the projection values as returned by `recommend_hierarchy`
+:param pairwise_projections: the projections as returned by `calculate_pairwise_projections`
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param output_file: the file to write to
+"""
+def write_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, has_root_embedding, projection_threshold, output_file):
+  if OUTPUT_FORMAT not in OUTPUT_FORMATS:
+    raise ValueError("Unknown output format " + repr(OUTPUT_FORMAT) + " (expected one of " + ", ".join(OUTPUT_FORMATS) + ")")
+  if OUTPUT_FORMAT == "tree":
+    from anytree import RenderTree
+    root = build_tree(is_contained_in, pairwise_projections, root_path, has_root_embedding, projection_threshold)
+
+    # Print result
+    print("Recommended package structure of \"" + os.path.basename(root_path) + "\" with threshold = " + str(projection_threshold) + ":", file=output_file)
+    for pre, fill, node in RenderTree(root):
+      print("%s%s" % (pre, os.path.basename(node.name)), file=output_file)
+  else:
+    nodes = get_hierarchy_nodes(is_contained_in, projection_values, pairwise_projections, root_path, has_root_embedding, projection_threshold)
+    if OUTPUT_FORMAT == "json":
+      write_hierarchy_json(nodes, output_file, root_path, projection_threshold)
+    elif OUTPUT_FORMAT == "adjacency":
+      write_hierarchy_adjacency(nodes, output_file)
+
+"""
+Write the recommended hierarchy to OUTPUT_PATH, or print it
+
+:param is_contained_in: the hierarchy as returned by `recommend_hierarchy`
+:param projection_values: the projection values as returned by `recommend_hierarchy`
+:param pairwise_projections: the projections as returned by `calculate_pairwise_projections`
+:param root_path: the path to the root package
+:param has_root_embedding: whether the root package has an embedding
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+"""
+def output_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, has_root_embedding, projection_threshold):
+  if OUTPUT_PATH is not None:
+    with open(OUTPUT_PATH, "w") as output_file:
+      write_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, has_root_embedding, projection_threshold, output_file)
+  else:
+    write_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, has_root_embedding, projection_threshold, sys.stdout)
+    sys.stdout.flush()
+
+"""
+Recommend the hierarchy of a project, then keep recommending it again whenever its source tree changes until interrupted
+
+:param root_path: the path to the root package (on the file system)
+:param projection_threshold: the projection value at which a package should be considered a subpackage
+:param model: the fasttext model to use for retrieving word embeddings
+"""
+def watch_project(root_path, projection_threshold, model):
+  identifier_cache = IdentifierCache(IDENTIFIER_CACHE_PATH) if IDENTIFIER_CACHE_PATH is not None else None
+  parse_report = ParseReport()
+  try:
+    with EmbeddingPipeline(identifier_cache=identifier_cache, parse_report=parse_report) if PIPELINED else contextlib.nullcontext() as pipeline:
+      watcher = ProjectWatcher(root_path, model, pipeline, identifier_cache, parse_report)
+      # The packages that changed since the recommendation was last output
+      changed_packages = set()
+      while True:
+        start = time.perf_counter()
+        try:
+          changed_packages |= watcher.update()
+          if len(changed_packages) > 0:
+            pairwise_projections = watcher.get_pairwise_projections(projection_threshold)
+            is_contained_in, projection_values = recommend_hierarchy(pairwise_projections, watcher.package_embeddings, watcher.root_package_embedding, watcher.package_accumulators, root_path, projection_threshold)
+            output_recommendation(is_contained_in, projection_values, pairwise_projections, root_path, watcher.root_package_embedding is not None, projection_threshold)
+            print("Updated %d package(s) in %.3f seconds, watching for changes (Ctrl+C to stop)" % (len(changed_packages), time.perf_counter() - start), flush=True)
+            changed_packages = set()
+        except Exception as error:
+          # An error (e.g. the root package being replaced, or a class that cannot be embedded) fails the poll rather than
+          # watch mode: the next poll tries again
+          print("Update failed:", type(error).__name__ + ": " + str(error) + ", watching for changes (Ctrl+C to stop)", flush=True)
+        time.sleep(WATCH_INTERVAL)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if identifier_cache is not None:
+      identifier_cache.close()
+    parse_report.print_summary()
+    if PARSE_REPORT_PATH is not None:
+      parse_report.write(PARSE_REPORT_PATH)
+
+if __name__ == "__main__":
+  # Prompt user to enter path without final slash (or the path to a jar or zip source archive)
+  path = get_source_root(input("Enter the path to the Java package that needs to be organized: "))
+  projection_threshold = float(input("Enter projection threshold at which a package should be considered a subpackage: "))
+
+  packages = sorted(list_directory(path)[0])
+
+  # Word embeddings: the prepared vocabulary vectors of the project if there are any (see vocabularyvectors.py), otherwise FastText
+  model = load_model(VOCABULARY_VECTORS_PATH)
+
+  if WATCH:
+    watch_project(path, projection_threshold, model)
+    sys.exit(0)
+  
+  # For each package (and the root package), derive its embedding from the classes it contains
+  package_paths = [path + "/" + package for package in packages]
+  identifier_cache = IdentifierCache(IDENTIFIER_CACHE_PATH) if IDENTIFIER_CACHE_PATH is not None else None
+  parse_report = ParseReport()
+  embedding_cache = PackageEmbeddingCache(EMBEDDING_CACHE_PATH, get_model_id(model)) if EMBEDDING_CACHE_PATH is not None else None
+  if PIPELINED:
+    with EmbeddingPipeline(identifier_cache=identifier_cache, parse_report=parse_report) as pipeline:
+      package_accumulators = get_package_embedding_accumulators(package_paths + [path], model, pipeline, embedding_cache=embedding_cache)
+  else:
+    package_accumulators = get_package_embedding_accumulators(package_paths + [path], model, identifier_cache=identifier_cache, parse_report=parse_report, embedding_cache=embedding_cache)
+  if identifier_cache is not None:
+    identifier_cache.close()
+  if embedding_cache is not None:
+    embedding_cache.close()
+  parse_report.print_summary()
+  if PARSE_REPORT_PATH is not None:
+    parse_report.write(PARSE_REPORT_PATH)
+
+  package_embeddings = {}
+  for package_path in package_paths:
+    package_embedding = package_accumulators[package_path].mean()
+    if package_embedding is not None:
+      package_embeddings[package_path] = package_embedding
+
+  # Find embedding for root package
+  root_package_embedding = package_accumulators[path].mean()
+
+  pairwise_projections = calculate_configured_pairwise_projections(package_embeddings, root_package_embedding, path, projection_threshold)
+  is_contained_in, projection_values = recommend_hierarchy(pairwise_projections, package_embeddings, root_package_embedding, package_accumulators, path, projection_threshold)
+  output_recommendation(is_contained_in, projection_values, pairwise_projections, path, root_package_embedding is not None, projection_threshold)
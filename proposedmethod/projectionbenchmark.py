@@ -0,0 +1,124 @@
+import sys
+import time
+import numpy as np
+import packageorganizer
+from common import calculate_projection_length
+from packageorganizer import calculate_configured_pairwise_projections, calculate_package_projections, intern_projections
+
+"""
+Benchmark of the ways the package organizer calculates the pairwise projections, checking that they give the same values
+
+The projections are calculated from random embeddings (no source files or word embeddings are involved) one package at a
+time, with several numbers of worker processes (PROJECTION_WORKERS) and in tiles within a memory budget
+(PROJECTION_MEMORY_BUDGET). All of them have to be bit-identical to each other, to `calculate_package_projections` (with
+which the organizer recalculates projections during discovery) and to `calculate_projection_length` (with which the
+analyzer and the watch mode calculate them). They also have to give the same arrays to discovery (`intern_projections`),
+which takes the ones calculated in tiles without going through their pairs.
+
+Run with `py projectionbenchmark.py` (add `--quick` to only check the smallest size).
+"""
+
+ROOT = "ROOT"
+
+PROJECTION_THRESHOLD = 0.6
+
+DIMENSION = 300
+
+SIZES = [100, 500, 2000]
+
+QUICK_SIZES = [100]
+
+# The configurations to compare, as `(name, PROJECTION_WORKERS, PROJECTION_MEMORY_BUDGET)`
+CONFIGURATIONS = [
+  ("1 worker", 1, None),
+  ("2 workers", 2, None),
+  ("4 workers", 4, None),
+  ("out of core", 1, 64 * 1024),
+]
+
+"""
+Generate package embeddings that project onto each other above the projection threshold now and then
+
+:param n: the number of packages
+:param rng: the numpy random generator
+:returns: a tuple `(package_embeddings, root_package_embedding)` of single-precision embeddings like the ones of word vectors
+"""
+def get_package_embeddings(n, rng):
+  topics = rng.standard_normal((max(1, n // 10), DIMENSION))
+  embeddings = topics[rng.integers(0, len(topics), n)] + 0.8 * rng.standard_normal((n, DIMENSION))
+  embeddings /= np.linalg.norm(embeddings, axis=1)[:, None]
+  package_embeddings = {"p" + str(i).zfill(5): embeddings[i].astype(np.float32) for i in range(n)}
+  return package_embeddings, np.mean(embeddings, axis=0).astype(np.float32)
+
+"""
+Calculate the projections that the organizer keeps with a configuration
+
+:param package_embeddings: dictionary of package path to the embedding of the package
+:param root_package_embedding: the embedding of the root package
+:param workers: the value of PROJECTION_WORKERS
+:param memory_budget: the value of PROJECTION_MEMORY_BUDGET
+:returns: a tuple `(pairwise_projections, runtime)`
+"""
+def run_configuration(package_embeddings, root_package_embedding, workers, memory_budget):
+  configuration = packageorganizer.PROJECTION_WORKERS, packageorganizer.PROJECTION_MEMORY_BUDGET
+  packageorganizer.PROJECTION_WORKERS, packageorganizer.PROJECTION_MEMORY_BUDGET = workers, memory_budget
+  try:
+    start = time.perf_counter()
+    pairwise_projections = calculate_configured_pairwise_projections(package_embeddings, root_package_embedding, ROOT, PROJECTION_THRESHOLD)
+    return pairwise_projections, time.perf_counter() - start
+  finally:
+    packageorganizer.PROJECTION_WORKERS, packageorganizer.PROJECTION_MEMORY_BUDGET = configuration
+
+"""
+Convert projections into a form in which equal values compare equal bit by bit
+
+:param pairwise_projections: dictionary of group-package pairs to projection values
+:returns: a list of `(pair, bytes of the value)` tuples in the order of the projections
+"""
+def get_bits(pairwise_projections):
+  return [(pair, np.asarray(value).tobytes()) for pair, value in pairwise_projections.items()]
+
+"""
+Get the arrays that discovery is given for projections
+
+:param pairwise_projections: dictionary of group-package pairs to projection values
+:param packages: the paths to the packages
+:returns: the bytes of the id and value arrays
+"""
+def get_discovery_bits(pairwise_projections, packages):
+  return [np.asarray(array).tobytes() for array in intern_projections(pairwise_projections, packages, ROOT, True)[1:]]
+
+if __name__ == "__main__":
+  sizes = QUICK_SIZES if "--quick" in sys.argv else SIZES
+  failures = []
+
+  print("  packages    kept  " + "  ".join("%12s" % name for name, _, _ in CONFIGURATIONS) + "  (seconds)")
+  for n in sizes:
+    package_embeddings, root_package_embedding = get_package_embeddings(n, np.random.default_rng(n))
+    results = [(name,) + run_configuration(package_embeddings, root_package_embedding, workers, memory_budget) for name, workers, memory_budget in CONFIGURATIONS]
+    reference_name, reference_projections, _ = results[0]
+    print("  %8d  %6d  " % (n, len(reference_projections)) + "  ".join("%12.3f" % runtime for _, _, runtime in results))
+
+    for name, pairwise_projections, _ in results[1:]:
+      if get_bits(pairwise_projections) != get_bits(reference_projections):
+        failures.append(str(n) + " packages: the projections with " + name + " differ from the ones with " + reference_name)
+      if get_discovery_bits(pairwise_projections, list(package_embeddings)) != get_discovery_bits(reference_projections, list(package_embeddings)):
+        failures.append(str(n) + " packages: discovery is given different projections with " + name + " than with " + reference_name)
+
+    # The projections recalculated during discovery, and the ones of the analyzer, for a sample of the packages
+    for package in list(package_embeddings)[::max(1, n // 20)]:
+      package_projections = calculate_package_projections(package, package_embeddings, root_package_embedding, ROOT)
+      kept_projections = {((package,), that_package): value for that_package, value in package_projections.items() if that_package == ROOT or value >= PROJECTION_THRESHOLD}
+      if get_bits(kept_projections) != get_bits({pair: value for pair, value in reference_projections.items() if pair[0] == (package,)}):
+        failures.append(str(n) + " packages: the recalculated projections of " + package + " differ from the ones with " + reference_name)
+      for that_package in list(package_projections)[::max(1, n // 10)]:
+        that_package_embedding = root_package_embedding if that_package == ROOT else package_embeddings[that_package]
+        if np.asarray(calculate_projection_length(package_embeddings[package], that_package_embedding)).tobytes() != np.asarray(package_projections[that_package]).tobytes():
+          failures.append(str(n) + " packages: the projection of " + package + " onto " + that_package + " differs when calculated on its own")
+
+  print("---")
+  if len(failures) > 0:
+    for failure in failures:
+      print("FAILED:", failure)
+    sys.exit(1)
+  print("All checks passed")
@@ -0,0 +1,257 @@
+import os
+import tempfile
+import numpy as np
+from common import calculate_norms, calculate_projection_lengths
+
+# Directory in which shared arrays are stored: a RAM-backed file system if there is one, so that the arrays live in shared memory
+SHARED_MEMORY_DIRECTORY = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+"""
+Create an array in a memory-mapped file that other processes can open without copying it
+
+:param directory: the directory in which to create the file
+:param name: the name of the file
+:param shape: the shape of the array
+:param dtype: the data type of the array
+:returns: a tuple `(spec, array)` where spec can be passed to another process to open the array with `open_shared_array`
+"""
+def create_shared_array(directory, name, shape, dtype):
+  spec = (os.path.join(directory, name), tuple(shape), np.dtype(dtype).str)
+  return spec, np.lib.format.open_memmap(spec[0], mode="w+", dtype=spec[2], shape=spec[1])
+
+"""
+Open an array that was created with `create_shared_array`
+
+:param spec: the spec returned by `create_shared_array`
+:param mode: "r" to open the array read-only, "r+" to be able to write to it
+:returns: the array, backed by the shared file
+"""
+def open_shared_array(spec, mode="r"):
+  return np.load(spec[0], mmap_mode=mode)
+
+"""
+Calculate the projections of a block of rows of the embedding matrix onto all embeddings, writing them into the shared output matrix
+
+This runs in a worker process; all arrays are opened from the shared files, so nothing is copied between processes.
+
+:param embeddings_spec: spec of the n×d matrix of package embeddings
+:param norms_spec: spec of the vector of the norms of the package embeddings
+:param output_spec: spec of the n×n output matrix
+:param row_start: the first row of the block
+:param row_end: the row after the last row of the block
+"""
+def project_block(embeddings_spec, norms_spec, output_spec, row_start, row_end):
+  embeddings = open_shared_array(embeddings_spec)
+  norms = open_shared_array(norms_spec)
+  output = open_shared_array(output_spec, "r+")
+  output[row_start:row_end] = calculate_projection_lengths(embeddings[row_start:row_end], embeddings, norms, output.dtype)
+  output.flush()
+
+"""
+Calculate the projection of every embedding onto every other embedding using multiple processes
+
+The stacked embeddings and their norms are published once in shared memory. Each worker computes a block of rows of the
+projection matrix from them and writes it directly into a shared output matrix.
+
+The result does not depend on the number of workers: every value is calculated by `common.calculate_projection_lengths`,
+which gives exactly the value `calculate_projection_length` gives for the same two embeddings, however the rows are split
+into blocks. With a single worker, the blocks are calculated in this process.
+
+:param embeddings: a list of n embeddings of equal length
+:param workers: the number of worker processes (defaults to the number of CPUs)
+:param rows_per_block: the number of rows of the projection matrix a worker computes at a time
+:param directory: the directory in which the shared arrays are created (defaults to SHARED_MEMORY_DIRECTORY)
+:returns: an n×n matrix where the value at [i, j] is the length of the projection of embedding i onto embedding j
+"""
+def calculate_projection_matrix(embeddings, workers=None, rows_per_block=256, directory=None):
+  n = len(embeddings)
+  dimension = len(embeddings[0]) if n > 0 else 0
+  dtype = np.result_type(*embeddings) if n > 0 else np.float32
+  with tempfile.TemporaryDirectory(dir=directory or SHARED_MEMORY_DIRECTORY) as shared_directory:
+    embeddings_spec, shared_embeddings = create_shared_array(shared_directory, "embeddings.npy", (n, dimension), np.float64)
+    for i in range(n):
+      shared_embeddings[i] = embeddings[i]
+    norms_spec, shared_norms = create_shared_array(shared_directory, "norms.npy", (n,), np.float64)
+    shared_norms[:] = calculate_norms(shared_embeddings)
+    output_spec, output = create_shared_array(shared_directory, "projections.npy", (n, n), dtype)
+    shared_embeddings.flush()
+    shared_norms.flush()
+
+    blocks = [(row_start, min(row_start + rows_per_block, n)) for row_start in range(0, n, rows_per_block)]
+    if workers == 1:
+      for row_start, row_end in blocks:
+        project_block(embeddings_spec, norms_spec, output_spec, row_start, row_end)
+    else:
+      from concurrent.futures import ProcessPoolExecutor # imported on first use, because it pulls in multiprocessing
+      with ProcessPoolExecutor(max_workers=workers) as pool:
+        for block in [pool.submit(project_block, embeddings_spec, norms_spec, output_spec, row_start, row_end) for row_start, row_end in blocks]:
+          block.result()
+
+    return np.array(open_shared_array(output_spec))
+
+"""
+Projection values of which only a subset is kept, stored row by row in compressed sparse row format
+
+Example:
+  indptr = [0, 2, 3], indices = [1, 2, 0], values = [0.8, 0.7, 0.9]
+
+  Row 0 keeps the projections onto embedding 1 (0.8) and embedding 2 (0.7), and row 1 keeps the projection onto embedding 0 (0.9)
+"""
+class SparseProjections:
+  def __init__(self, indptr, indices, values):
+    self.indptr = indptr
+    self.indices = indices
+    self.values = values
+
+  def __len__(self):
+    return len(self.values)
+
+  """
+  Get the kept projections of a single embedding onto the others
+
+  :param i: the index of the projected embedding
+  :returns: a tuple `(indices, values)` of the embeddings it is projected onto (in ascending order) and the projection values
+  """
+  def row(self, i):
+    return self.indices[self.indptr[i]:self.indptr[i + 1]], self.values[self.indptr[i]:self.indptr[i + 1]]
+
+"""
+Collect an array piece by piece, either in memory or in an anonymous temporary file that is memory-mapped once the array is complete
+
+:param dtype: the data type of the array
+:param directory: the directory in which the temporary file is created (None to collect the pieces in memory)
+"""
+class ArrayCollector:
+  def __init__(self, dtype, directory=None):
+    self.dtype = np.dtype(dtype)
+    self.pieces = []
+    self.file = tempfile.TemporaryFile(dir=directory) if directory is not None else None
+    self.count = 0
+
+  """
+  Add a piece to the end of the array
+
+  :param piece: a one-dimensional array
+  """
+  def append(self, piece):
+    piece = np.ascontiguousarray(piece, dtype=self.dtype)
+    if self.file is not None:
+      self.file.write(piece.tobytes())
+    else:
+      self.pieces.append(piece)
+    self.count += len(piece)
+
+  """
+  :returns: the complete array (backed by the temporary file, which is removed once the array is no longer used)
+  """
+  def finish(self):
+    if self.file is None:
+      return np.concatenate(self.pieces) if len(self.pieces) > 0 else np.zeros(0, dtype=self.dtype)
+    self.file.flush()
+    array = np.memmap(self.file, dtype=self.dtype, mode="r", shape=(self.count,)) if self.count > 0 else np.zeros(0, dtype=self.dtype)
+    # The memory map stays valid after the file is closed
+    self.file.close()
+    return array
+
+"""
+Determine how many rows and columns a tile of the projection matrix may have to stay within a memory budget
+
+Half of the budget is for the tile: the projection values themselves and roughly two temporary arrays of the same size,
+of which some are in double precision. The other half is for the projections of a row of tiles that are kept, which are
+ordered before they are stored; in the worst case all of them are kept, so it limits the number of rows of a tile.
+
+:param memory_budget: the maximum number of bytes a tile and the kept projections of a row of tiles may use
+:param n: the number of embeddings
+:param itemsize: the number of bytes of a single projection value
+:param kept_size: the number of bytes needed for a kept projection while a row of tiles is ordered
+:returns: a tuple `(rows, columns)` of the number of rows and columns of a tile
+"""
+def get_tile_size(memory_budget, n, itemsize, kept_size):
+  rows = max(1, min(n, int((memory_budget / 2 / (3 * itemsize)) ** 0.5), int(memory_budget / 2 / (max(1, n) * kept_size))))
+  columns = max(1, min(n, int(memory_budget / 2 / (3 * itemsize * rows))))
+  return rows, columns
+
+"""
+Calculate the projection of every embedding onto every other embedding tile by tile, keeping only the largest values
+
+The n×n projection matrix is never held in memory: it is computed in tiles that fit in `memory_budget` (see
+`get_tile_size`), and of each tile only the projections that reach `projection_threshold` and/or belong to the `top_k`
+largest of their row are kept. The projection of an embedding onto itself is never kept. The embeddings are never copied
+as a whole: of a list, only the embeddings of the current tile are stacked, and of a memory-mapped array (see
+`create_shared_array`), only the rows of the current tile are read into memory. Unless `top_k` is set, the number of kept
+projections can grow with n², so with a `directory` they are stored in temporary files there and memory-mapped rather
+than kept in memory.
+
+:param embeddings: an n×d matrix (or a list of n embeddings of equal length)
+:param projection_threshold: the projection value a projection needs to reach to be kept (None to not filter by value)
+:param top_k: the number of projections that are kept per row at most (None to not limit the number)
+:param memory_budget: the maximum number of bytes used by a tile, its temporary arrays and the kept projections of a row of
+                      tiles before they are stored (the embeddings are not counted)
+:param directory: the directory in which the kept projections are stored (None to keep them in memory)
+:returns: a SparseProjections with the kept projections
+"""
+def calculate_sparse_projections(embeddings, projection_threshold=None, top_k=None, memory_budget=256 * 1024 * 1024, directory=None):
+  n = len(embeddings)
+  dtype = embeddings.dtype if isinstance(embeddings, np.ndarray) else (np.result_type(*embeddings) if n > 0 else np.float32)
+  # A kept projection needs its row, column and value, and the same again once they are ordered
+  kept_size = 2 * (2 * np.dtype(np.int64).itemsize + np.dtype(dtype).itemsize)
+  row_tile_size, column_tile_size = get_tile_size(memory_budget, n, np.dtype(np.float64).itemsize, kept_size)
+  get_rows = lambda start, end: np.asarray(embeddings[start:end], dtype=dtype)
+
+  norms = np.empty(n)
+  for start in range(0, n, column_tile_size):
+    norms[start:start + column_tile_size] = calculate_norms(get_rows(start, start + column_tile_size))
+
+  row_counts = np.zeros(n, dtype=np.int64)
+  kept_indices = ArrayCollector(np.int64, directory)
+  kept_values = ArrayCollector(dtype, directory)
+  for row_start in range(0, n, row_tile_size):
+    row_end = min(row_start + row_tile_size, n)
+    rows = get_rows(row_start, row_end)
+    if top_k is not None:
+      best_values = np.full((row_end - row_start, top_k), -np.inf, dtype=dtype)
+      best_indices = np.full((row_end - row_start, top_k), -1, dtype=np.int64)
+    tile_rows = []
+    tile_columns = []
+    tile_values = []
+
+    for column_start in range(0, n, column_tile_size):
+      column_end = min(column_start + column_tile_size, n)
+      tile = calculate_projection_lengths(rows, get_rows(column_start, column_end), norms[column_start:column_end], dtype)
+
+      # Never keep the projection of an embedding onto itself
+      diagonal = np.arange(max(row_start, column_start), min(row_end, column_end))
+      tile[diagonal - row_start, diagonal - column_start] = -np.inf
+
+      if top_k is not None:
+        candidate_values = np.concatenate([best_values, tile], axis=1)
+        candidate_indices = np.concatenate([best_indices, np.broadcast_to(np.arange(column_start, column_end), tile.shape)], axis=1)
+        best = np.argpartition(-candidate_values, min(top_k, candidate_values.shape[1]) - 1, axis=1)[:, :top_k]
+        best_values = np.take_along_axis(candidate_values, best, axis=1)
+        best_indices = np.take_along_axis(candidate_indices, best, axis=1)
+      else:
+        tile_row_indices, tile_column_indices = np.nonzero(tile >= projection_threshold) if projection_threshold is not None else np.nonzero(tile > -np.inf)
+        tile_rows.append(tile_row_indices + row_start)
+        tile_columns.append(tile_column_indices + column_start)
+        tile_values.append(tile[tile_row_indices, tile_column_indices])
+
+    if top_k is not None:
+      keep = (best_indices >= 0) & (best_values > -np.inf)
+      if projection_threshold is not None:
+        keep &= best_values >= projection_threshold
+      tile_row_indices, tile_column_indices = np.nonzero(keep)
+      tile_rows.append(tile_row_indices + row_start)
+      tile_columns.append(best_indices[tile_row_indices, tile_column_indices])
+      tile_values.append(best_values[tile_row_indices, tile_column_indices])
+
+    # Order the kept projections of this row tile by row and then by column
+    tile_rows = np.concatenate(tile_rows)
+    tile_columns = np.concatenate(tile_columns)
+    tile_values = np.concatenate(tile_values)
+    order = np.lexsort((tile_columns, tile_rows))
+    row_counts[row_start:row_end] = np.bincount(tile_rows - row_start, minlength=row_end - row_start)
+    kept_indices.append(tile_columns[order])
+    kept_values.append(tile_values[order])
+
+  indptr = np.concatenate([[0], np.cumsum(row_counts)])
+  return SparseProjections(indptr, kept_indices.finish(), kept_values.finish())
@@ -0,0 +1,192 @@
+import math
+import numpy as np
+
+"""
+Mergeable sketch of a distribution from which quantiles can be estimated with a bounded relative error
+
+Values are counted in logarithmically sized buckets (as in DDSketch), so that every estimated quantile is within
+`relative_accuracy` of the true value. Negative values and zeros are counted separately. Two sketches with the same
+relative accuracy can be merged by adding up their bucket counts.
+
+:param relative_accuracy: the maximum relative error of an estimated quantile
+"""
+class QuantileSketch:
+  def __init__(self, relative_accuracy=0.01):
+    self.relative_accuracy = relative_accuracy
+    self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    self.log_gamma = math.log(self.gamma)
+    self.positive_buckets = {}
+    self.negative_buckets = {}
+    self.zero_count = 0
+    self.count = 0
+
+  def add(self, value):
+    if value > 0:
+      bucket = math.ceil(math.log(value) / self.log_gamma)
+      self.positive_buckets[bucket] = self.positive_buckets.get(bucket, 0) + 1
+    elif value < 0:
+      bucket = math.ceil(math.log(-value) / self.log_gamma)
+      self.negative_buckets[bucket] = self.negative_buckets.get(bucket, 0) + 1
+    else:
+      self.zero_count += 1
+    self.count += 1
+
+  def merge(self, other):
+    if other.relative_accuracy != self.relative_accuracy:
+      raise ValueError("Only sketches with the same relative accuracy can be merged")
+    for bucket, count in other.positive_buckets.items():
+      self.positive_buckets[bucket] = self.positive_buckets.get(bucket, 0) + count
+    for bucket, count in other.negative_buckets.items():
+      self.negative_buckets[bucket] = self.negative_buckets.get(bucket, 0) + count
+    self.zero_count += other.zero_count
+    self.count += other.count
+    return self
+
+  """
+  Estimate a quantile
+
+  :param q: the quantile to estimate, between 0 and 1
+  :returns: the estimated value or None if no values were added
+  """
+  def quantile(self, q):
+    if self.count == 0:
+      return None
+    rank = q * (self.count - 1)
+    seen = 0
+    # From the most negative value to the most positive value
+    for bucket in sorted(self.negative_buckets, reverse=True):
+      seen += self.negative_buckets[bucket]
+      if seen > rank:
+        return -self.get_bucket_value(bucket)
+    seen += self.zero_count
+    if seen > rank:
+      return 0.0
+    for bucket in sorted(self.positive_buckets):
+      seen += self.positive_buckets[bucket]
+      if seen > rank:
+        return self.get_bucket_value(bucket)
+    return self.get_bucket_value(max(self.positive_buckets))
+
+  """
+  :param bucket: the index of a bucket
+  :returns: the value representing all values in the bucket, which is within the relative accuracy of each of them
+  """
+  def get_bucket_value(self, bucket):
+    return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+"""
+Statistics of a stream of projection values that are updated as the values are produced
+
+Keeps the count, minimum, maximum, running mean and variance (Welford), a quantile sketch and a histogram with fixed-width
+bins, none of which grow with the number of values. Collectors of parallel subtrees can be merged. Optionally the exact values
+are kept as well, in which case mean, standard deviation and quantiles are calculated exactly from them. NaN and infinite
+values (e.g. projections onto an embedding whose norm is zero) are not part of any of the statistics: they are only counted
+in `non_finite_count`.
+
+Values are added with `append`, so a collector can be passed wherever a list of projections is expected.
+
+Example:
+  statistics = ProjectionStatistics()
+  for value in [0.2, 0.4, 0.9]:
+    statistics.append(value)
+  statistics.mean()
+  Output:
+    0.5
+
+:param keep_values: whether to also keep every value
+:param relative_accuracy: the maximum relative error of quantiles estimated without the exact values
+:param histogram_bin_width: the width of the bins of the histogram
+"""
+class ProjectionStatistics:
+  def __init__(self, keep_values=False, relative_accuracy=0.01, histogram_bin_width=0.05):
+    self.count = 0
+    self.non_finite_count = 0
+    self.minimum = None
+    self.maximum = None
+    self.running_mean = 0.0
+    self.sum_of_squared_deviations = 0.0
+    self.sketch = QuantileSketch(relative_accuracy)
+    self.histogram_bin_width = histogram_bin_width
+    self.histogram = {}
+    self.values = [] if keep_values else None
+
+  """
+  Add a projection value
+
+  :param value: the projection value
+  """
+  def append(self, value):
+    if not math.isfinite(value):
+      self.non_finite_count += 1
+      return
+    if self.values is not None:
+      self.values.append(value)
+    self.count += 1
+    self.minimum = value if self.minimum is None else min(self.minimum, value)
+    self.maximum = value if self.maximum is None else max(self.maximum, value)
+    value = float(value)
+    delta = value - self.running_mean
+    self.running_mean += delta / self.count
+    self.sum_of_squared_deviations += delta * (value - self.running_mean)
+    self.sketch.add(value)
+    histogram_bin = math.floor(value / self.histogram_bin_width)
+    self.histogram[histogram_bin] = self.histogram.get(histogram_bin, 0) + 1
+
+  """
+  Merge the statistics of another collector into this one
+
+  Both collectors need the same relative accuracy and histogram bin width. Exact values are only kept if both kept them.
+
+  :param other: the collector to merge into this one
+  :returns: this collector
+  """
+  def merge(self, other):
+    if other.histogram_bin_width != self.histogram_bin_width:
+      raise ValueError("Only statistics with the same histogram bin width can be merged")
+    self.non_finite_count += other.non_finite_count
+    if other.count == 0:
+      return self
+    count = self.count + other.count
+    delta = other.running_mean - self.running_mean
+    self.running_mean += delta * other.count / count
+    self.sum_of_squared_deviations += other.sum_of_squared_deviations + delta * delta * self.count * other.count / count
+    self.count = count
+    self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+    self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+    self.sketch.merge(other.sketch)
+    for histogram_bin, bin_count in other.histogram.items():
+      self.histogram[histogram_bin] = self.histogram.get(histogram_bin, 0) + bin_count
+    self.values = self.values + other.values if self.values is not None and other.values is not None else None
+    return self
+
+  def __len__(self):
+    return self.count
+
+  def mean(self):
+    return np.mean(self.values) if self.values is not None else self.running_mean
+
+  """
+  :returns: the (population) standard deviation
+  """
+  def std(self):
+    return np.std(self.values) if self.values is not None else math.sqrt(self.sum_of_squared_deviations / self.count)
+
+  """
+  :param q: the quantile, between 0 and 1
+  :returns: the quantile, estimated with the quantile sketch (within the observed minimum and maximum) unless the exact values are kept
+  """
+  def quantile(self, q):
+    if self.values is not None:
+      return np.quantile(self.values, q)
+    if self.count == 0:
+      return None
+    return min(max(self.sketch.quantile(q), float(self.minimum)), float(self.maximum))
+
+  def median(self):
+    return np.median(self.values) if self.values is not None else self.quantile(0.5)
+
+  """
+  :returns: a list of `(lower_bound, upper_bound, count)` tuples of the non-empty histogram bins in ascending order
+  """
+  def get_histogram(self):
+    return [(histogram_bin * self.histogram_bin_width, (histogram_bin + 1) * self.histogram_bin_width, self.histogram[histogram_bin]) for histogram_bin in sorted(self.histogram)]
@@ -0,0 +1,172 @@
+from common import EmbeddingAccumulator, get_class_paths, get_class_embedding, calculate_projection_length, calculate_projection_lengths
+from sourceprovider import list_directory, get_source_status
+
+# Number of seconds between two polls of the source tree in watch mode
+WATCH_INTERVAL = 0.5
+
+"""
+Live state of a project that is organized repeatedly while its source tree changes
+
+The source tree is polled: every poll lists the packages and their classes and takes the size and modification time of
+every class (see `get_source_status`), which is cheap compared to reading, parsing and embedding them. Only the classes
+whose status changed are embedded again, only the running sums of the packages that contain them are added up again
+(from the class embeddings kept in memory, in the same order as a full run, so the package embeddings are identical), and
+only the projections from and onto those packages are recalculated. The projections that the organizer needs are then
+assembled from the projections kept in memory, exactly as `calculate_pairwise_projections` returns them.
+
+Example:
+  watcher = ProjectWatcher(root_path, model)
+  while True:
+    if watcher.update():
+      pairwise_projections = watcher.get_pairwise_projections(projection_threshold)
+      ...
+    time.sleep(WATCH_INTERVAL)
+
+:param root_path: the path to the root package (on the file system)
+:param model: the fasttext model to use for retrieving word embeddings
+:param pipeline: an optional EmbeddingPipeline through which changed classes are read, parsed and embedded
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored (the pipeline uses its own)
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded (the pipeline uses its own)
+"""
+class ProjectWatcher:
+  def __init__(self, root_path, model, pipeline=None, identifier_cache=None, parse_report=None):
+    self.root_path = root_path
+    self.model = model
+    self.pipeline = pipeline
+    self.identifier_cache = identifier_cache
+    self.parse_report = parse_report
+    # Package path to a dictionary of class path to the status of the class when it was last embedded
+    self.snapshot = {}
+    # Class path to the embedding of the class
+    self.class_embeddings = {}
+    # Package path to the EmbeddingAccumulator of its classes (the root package included), in the order of a full run
+    self.package_accumulators = {}
+    # Package path (with embedding) to the embedding of the package, and the embedding of the root package
+    self.package_embeddings = {}
+    self.root_package_embedding = None
+    # Package path to a dictionary of package path to the projection of the first package onto the second
+    self.projections = {}
+
+  """
+  List the packages of the project and the status of their classes
+
+  Files and directories that disappear while they are listed are left out; they are picked up by the next poll.
+
+  :returns: dictionary of package path to a dictionary of class path to the status of the class, with the packages in
+            the order of a full run (in alphabetical order, followed by the root package)
+  """
+  def take_snapshot(self):
+    snapshot = {}
+    for package_path in [self.root_path + "/" + package for package in sorted(list_directory(self.root_path)[0])] + [self.root_path]:
+      try:
+        class_paths = get_class_paths(package_path)
+      except (OSError, StopIteration):
+        continue
+      snapshot[package_path] = {}
+      for class_path in class_paths:
+        try:
+          snapshot[package_path][class_path] = get_source_status(class_path)
+        except OSError:
+          pass
+    return snapshot
+
+  """
+  Poll the source tree and bring the embeddings and projections up to date with it
+
+  :returns: the paths of the packages that changed (added, removed or with added, removed or changed classes) since the last update
+  """
+  def update(self):
+    snapshot = self.take_snapshot()
+    changed_packages = {package_path for package_path in self.snapshot.keys() | snapshot.keys() if self.snapshot.get(package_path) != snapshot.get(package_path)}
+    if len(changed_packages) == 0:
+      return changed_packages
+
+    previous_classes = {class_path: status for classes in self.snapshot.values() for class_path, status in classes.items()}
+    classes = {class_path: status for classes in snapshot.values() for class_path, status in classes.items()}
+    for class_path in previous_classes.keys() - classes.keys():
+      self.class_embeddings.pop(class_path, None)
+    changed_classes = [class_path for class_path, status in classes.items() if previous_classes.get(class_path) != status]
+    try:
+      for class_path, class_embedding in self.embed_classes(changed_classes):
+        self.class_embeddings[class_path] = class_embedding
+    except OSError:
+      # A class was removed or renamed while it was being read: keep the last snapshot, so the next poll tries again
+      return set()
+
+    # Add up the class embeddings of the changed packages again, in the order of the classes
+    package_accumulators = {}
+    for package_path, classes in snapshot.items():
+      if package_path in changed_packages:
+        package_accumulators[package_path] = EmbeddingAccumulator()
+        for class_path in classes:
+          package_accumulators[package_path].add(self.class_embeddings[class_path])
+      else:
+        package_accumulators[package_path] = self.package_accumulators[package_path]
+    self.package_accumulators = package_accumulators
+
+    package_embeddings = {}
+    for package_path, class_accumulator in package_accumulators.items():
+      package_embedding = class_accumulator.mean()
+      if package_path != self.root_path and package_embedding is not None:
+        package_embeddings[package_path] = package_embedding
+    self.update_projections(package_embeddings, package_accumulators[self.root_path].mean(), changed_packages)
+    # Only taken over once everything is up to date, so that the next poll updates the same packages again if anything failed
+    self.snapshot = snapshot
+    return changed_packages
+
+  """
+  Embed classes, through the pipeline if there is one
+
+  :param class_paths: the paths to the classes
+  :returns: an iterable of `(class_path, class_embedding)` tuples
+  """
+  def embed_classes(self, class_paths):
+    if self.pipeline is not None:
+      return self.pipeline.get_class_embeddings(class_paths, self.model)
+    return [(class_path, get_class_embedding(class_path, self.model, self.identifier_cache, self.parse_report)) for class_path in class_paths]
+
+  """
+  Recalculate the projections from and onto changed packages
+
+  :param package_embeddings: dictionary of package path to the embedding of the package (for the packages with an embedding)
+  :param root_package_embedding: the embedding of the root package or None if the root package has no embedding
+  :param changed_packages: the paths of the packages that changed
+  """
+  def update_projections(self, package_embeddings, root_package_embedding, changed_packages):
+    root_changed = self.root_path in changed_packages
+    self.projections = {package_path: package_projections for package_path, package_projections in self.projections.items() if package_path in package_embeddings}
+    for this_package, this_package_embedding in package_embeddings.items():
+      package_projections = self.projections.setdefault(this_package, {})
+      if this_package in changed_packages:
+        package_projections.clear()
+      for that_package in package_projections.keys() - package_embeddings.keys() - {self.root_path}:
+        del package_projections[that_package]
+      if this_package in changed_packages or root_changed:
+        package_projections.pop(self.root_path, None)
+        if root_package_embedding is not None:
+          package_projections[self.root_path] = calculate_projection_length(this_package_embedding, root_package_embedding)
+      that_packages = [that_package for that_package in package_embeddings if that_package != this_package and (this_package in changed_packages or that_package in changed_packages)]
+      if len(that_packages) > 0:
+        projection_values = calculate_projection_lengths([this_package_embedding], [package_embeddings[that_package] for that_package in that_packages])[0]
+        package_projections.update(zip(that_packages, projection_values))
+    self.package_embeddings = package_embeddings
+    self.root_package_embedding = root_package_embedding
+
+  """
+  Assemble the projections between the packages, as `calculate_pairwise_projections` calculates them for the current source tree
+
+  :param projection_threshold: the projection value a projection between packages needs to reach to be kept (None to keep all of them)
+  :returns: dictionary of group-package pairs `((pkg1,), pkg2)` to the length of the projection of `pkg1` onto `pkg2`
+  """
+  def get_pairwise_projections(self, projection_threshold=None):
+    that_packages = ([self.root_path] if self.root_package_embedding is not None else []) + list(self.package_embeddings)
+    pairwise_projections = {}
+    for this_package in self.package_embeddings:
+      this_package_as_tuple = (this_package,)
+      package_projections = self.projections[this_package]
+      for that_package in that_packages:
+        if that_package != this_package:
+          projection_value = package_projections[that_package]
+          if projection_threshold is None or that_package == self.root_path or projection_value >= projection_threshold:
+            pairwise_projections[(this_package_as_tuple, that_package)] = projection_value
+    return pairwise_projections
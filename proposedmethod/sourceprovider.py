@@ -0,0 +1,435 @@
+import os
+import atexit
+import threading
+
+# Separates the path to an archive (or git revision) from the path of an entry inside it, as in jar URLs (e.g. lib-sources.jar!/com/example/Order.java)
+ARCHIVE_SEPARATOR = "!"
+
+# Extensions of the files that are read as source archives
+ARCHIVE_EXTENSIONS = (".jar", ".zip")
+
+# Separates the path to a git repository from a revision in it (e.g. project@v2.1!/src/main/java)
+REVISION_SEPARATOR = "@"
+
+"""
+Index the entries of a source container (an archive or a git revision) by directory
+
+:param entries: an iterable of `(entry_path, is_directory, info)` tuples, where entry_path is the path of the entry in the
+                container (with "/" as separator) and info is what is remembered about a file
+:returns: dictionary of the path of each directory ("" for the root) to a tuple `(subdirectories, files)` of the set of
+          the names of its subdirectories and a dictionary of the names of its files to their info
+"""
+def index_entries(entries):
+  directories = {"": (set(), {})}
+  for entry_path, is_directory, info in entries:
+    parts = entry_path.strip("/").split("/")
+    directory = ""
+    for part in parts[:-1]:
+      directories[directory][0].add(part)
+      directory = directory + "/" + part if directory != "" else part
+      directories.setdefault(directory, (set(), {}))
+    if is_directory:
+      directories[directory][0].add(parts[-1])
+      directories.setdefault(directory + "/" + parts[-1] if directory != "" else parts[-1], (set(), {}))
+    else:
+      directories[directory][1][parts[-1]] = info
+  return directories
+
+"""
+Decode a source file exactly like `open` reads it (in the default encoding and with universal newlines)
+
+:param binary_file: the source file opened in binary mode
+:returns: the contents of the file
+"""
+def decode_source(binary_file):
+  import io
+  with io.TextIOWrapper(binary_file) as source_file:
+    return source_file.read()
+
+"""
+The entries of a zip or jar archive, indexed by directory
+
+Paths inside an archive consist of the path to the archive, ARCHIVE_SEPARATOR and the path of the entry in the archive,
+e.g. `lib-sources.jar!/com/example` is the package com.example in lib-sources.jar and `lib-sources.jar!` is the root of
+the archive. Such paths can be used wherever a path to a package or class is expected (see `list_directory`,
+`read_source` and `get_source_status`), so classes are streamed from the archive without extracting anything to disk.
+
+The central directory of the archive is read once. Entries are read through handles of the archive that are taken from a
+pool for the duration of a read, so any number of threads can read from the same or from different archives at the same
+time, and the archive is open at most as many times as it was read from at the same time. `close` closes the handles.
+
+:param archive_path: the path to the archive
+"""
+class SourceArchive:
+  def __init__(self, archive_path):
+    import zipfile # imported on first use, because most runs read from the file system
+    self.archive_path = archive_path
+    self.free_handles = []
+    self.lock = threading.Lock()
+    with zipfile.ZipFile(archive_path) as archive:
+      self.directories = index_entries((info.filename, info.is_dir(), info) for info in archive.infolist())
+
+  """
+  Read an entry through a handle from the pool, opening a new handle if all are in use
+
+  :param entry: the path of the entry in the archive
+  :param read: a function that reads the contents from the opened entry
+  :returns: what `read` returns
+  """
+  def read_entry(self, entry, read):
+    import zipfile
+    with self.lock:
+      handle = self.free_handles.pop() if len(self.free_handles) > 0 else None
+    if handle is None:
+      handle = zipfile.ZipFile(self.archive_path)
+    try:
+      return read(handle.open(self.get_info(entry)))
+    finally:
+      with self.lock:
+        self.free_handles.append(handle)
+
+  """
+  Close the handles of the archive (reading from it afterwards opens new ones)
+  """
+  def close(self):
+    with self.lock:
+      for handle in self.free_handles:
+        handle.close()
+      self.free_handles = []
+
+  """
+  :param directory: the path of a directory in the archive ("" for the root)
+  :returns: a tuple `(subdirectories, files)` of the names of its subdirectories and files, in alphabetical order
+  """
+  def list_directory(self, directory):
+    subdirectories, files = self.directories.get(directory, (set(), {}))
+    return sorted(subdirectories), sorted(files)
+
+  def get_info(self, entry):
+    directory, _, name = entry.rpartition("/")
+    return self.directories[directory][1][name]
+
+  """
+  :param entry: the path of the entry in the archive
+  :returns: the contents of the entry
+  """
+  def read_text(self, entry):
+    return self.read_entry(entry, decode_source)
+
+  """
+  :param entry: the path of the entry in the archive
+  :returns: the contents of the entry as bytes
+  """
+  def read_bytes(self, entry):
+    def read(entry_file):
+      with entry_file:
+        return entry_file.read()
+    return self.read_entry(entry, read)
+
+  """
+  :param entry: the path of the entry in the archive
+  :returns: a tuple `(key, size, version)` as returned by `get_source_status`, where version is the CRC-32 of the entry
+  """
+  def get_status(self, entry):
+    info = self.get_info(entry)
+    return os.path.abspath(self.archive_path) + ARCHIVE_SEPARATOR + "/" + entry, info.file_size, info.CRC
+
+"""
+A git repository whose objects are read through a single long-lived `git cat-file --batch` process
+
+The process is started on first use and shared by all revisions of the repository and all threads, which take turns
+sending it the ids of the blobs to read.
+
+:param repository_path: the path to the working tree or the bare repository
+"""
+class GitRepository:
+  def __init__(self, repository_path):
+    self.repository_path = repository_path
+    self.process = None
+    self.lock = threading.Lock()
+
+  """
+  Run a git command in the repository
+
+  :param arguments: the arguments to git
+  :returns: the output of the command (as bytes)
+  """
+  def run(self, *arguments):
+    import subprocess # imported on first use, like zipfile
+    return subprocess.run(["git", "-C", self.repository_path] + list(arguments), capture_output=True, check=True).stdout
+
+  """
+  List the files of a revision
+
+  :param revision: a commit id, branch, tag or any other revision that git understands
+  :returns: a tuple `(commit_id, files)` where files is a list of `(path, blob_id, size)` of the files in the revision
+  """
+  def list_files(self, revision):
+    commit_id = self.run("rev-parse", "--verify", "--end-of-options", revision + "^{commit}").decode("ascii").strip()
+    files = []
+    # With -z, every line is "<mode> <type> <object id> <size>\t<path>\0" and paths are not quoted
+    for line in self.run("ls-tree", "-r", "-l", "-z", "--full-tree", commit_id).split(b"\0"):
+      if line == b"":
+        continue
+      header, _, path = line.partition(b"\t")
+      _, object_type, blob_id, size = header.split()
+      # Submodules are commits of other repositories, which are not in this object database
+      if object_type == b"blob":
+        files.append((os.fsdecode(path), blob_id.decode("ascii"), int(size)))
+    return commit_id, files
+
+  """
+  Read a blob from the object database
+
+  :param blob_id: the object id of the blob
+  :returns: the contents of the blob (as bytes)
+  """
+  def read_blob(self, blob_id):
+    with self.lock:
+      if self.process is None:
+        import subprocess
+        self.process = subprocess.Popen(["git", "-C", self.repository_path, "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+      self.process.stdin.write(blob_id.encode("ascii") + b"\n")
+      self.process.stdin.flush()
+      # The answer is "<object id> <type> <size>\n", the contents and "\n" (or "<object id> missing\n")
+      header = self.process.stdout.readline().split()
+      if len(header) != 3 or header[1] != b"blob":
+        raise FileNotFoundError("No blob " + blob_id + " in the git repository " + self.repository_path)
+      contents = self.process.stdout.read(int(header[2]))
+      self.process.stdout.read(1)
+      return contents
+
+  def close(self):
+    with self.lock:
+      if self.process is not None:
+        self.process.stdin.close()
+        self.process.wait()
+        self.process = None
+
+"""
+The files of a git revision, indexed by directory
+
+Paths inside a revision consist of the path to the repository, REVISION_SEPARATOR, the revision, ARCHIVE_SEPARATOR and
+the path of the file in the revision, e.g. `project@v2.1!/src/main/java` is the directory src/main/java of the tag v2.1
+of the repository in the directory project. Like paths inside archives, they can be used wherever a path to a package or
+class is expected, so historical revisions are analyzed straight from the object database without checking them out.
+
+The tree of the revision is listed once; file contents are read from the GitRepository. Since a blob id identifies the
+contents of a file (see `get_blob_id`), the identifiers of a file are remembered by its blob id during a run (see
+`common.BlobIdentifiers`) and the embedding cache remembers the content hash of a file by it, so a file that is the same
+in several revisions is only parsed and hashed once.
+
+:param repository: the GitRepository
+:param revision: a commit id, branch, tag or any other revision that git understands
+"""
+class GitRevision:
+  def __init__(self, repository, revision):
+    self.repository = repository
+    self.commit_id, files = repository.list_files(revision)
+    self.directories = index_entries((path, False, (blob_id, size)) for path, blob_id, size in files)
+
+  """
+  :param directory: the path of a directory in the revision ("" for the root)
+  :returns: a tuple `(subdirectories, files)` of the names of its subdirectories and files, in alphabetical order
+  """
+  def list_directory(self, directory):
+    subdirectories, files = self.directories.get(directory, (set(), {}))
+    return sorted(subdirectories), sorted(files)
+
+  def get_info(self, entry):
+    directory, _, name = entry.rpartition("/")
+    return self.directories[directory][1][name]
+
+  """
+  :param entry: the path of the file in the revision
+  :returns: the contents of the file
+  """
+  def read_text(self, entry):
+    import io
+    return decode_source(io.BytesIO(self.read_bytes(entry)))
+
+  """
+  :param entry: the path of the file in the revision
+  :returns: the contents of the file as bytes
+  """
+  def read_bytes(self, entry):
+    return self.repository.read_blob(self.get_info(entry)[0])
+
+  """
+  :param entry: the path of the file in the revision
+  :returns: a tuple `(key, size, version)` as returned by `get_source_status`, where the key is the blob id of the file
+  """
+  def get_status(self, entry):
+    blob_id, size = self.get_info(entry)
+    return "git:" + blob_id, size, 0
+
+# The archives, git repositories and git revisions that were opened, by path (and revision)
+archives = {}
+repositories = {}
+revisions = {}
+containers_lock = threading.Lock()
+
+"""
+Get the archive at a path, reading its index on first use
+
+:param archive_path: the path to the archive
+:returns: the SourceArchive
+"""
+def get_archive(archive_path):
+  with containers_lock:
+    if archive_path not in archives:
+      archives[archive_path] = SourceArchive(archive_path)
+    return archives[archive_path]
+
+"""
+Get a revision of a git repository, listing its files on first use
+
+:param repository_path: the path to the repository
+:param revision: a commit id, branch, tag or any other revision that git understands
+:returns: the GitRevision
+"""
+def get_revision(repository_path, revision):
+  with containers_lock:
+    if (repository_path, revision) not in revisions:
+      if repository_path not in repositories:
+        repositories[repository_path] = GitRepository(repository_path)
+      revisions[(repository_path, revision)] = GitRevision(repositories[repository_path], revision)
+    return revisions[(repository_path, revision)]
+
+"""
+Close the handles of all archives and stop the `git cat-file` processes of all git repositories that were read, for
+instance when a long run is done with a project (they are opened again when they are read from again)
+"""
+def close_sources():
+  with containers_lock:
+    for archive in archives.values():
+      archive.close()
+    for repository in repositories.values():
+      repository.close()
+    archives.clear()
+    revisions.clear()
+    repositories.clear()
+
+atexit.register(close_sources)
+
+"""
+:param path: a path on the file system
+:returns: whether the path is a git working tree or a bare git repository
+"""
+def is_git_repository(path):
+  return os.path.exists(os.path.join(path, ".git")) or (os.path.isfile(os.path.join(path, "HEAD")) and os.path.isdir(os.path.join(path, "objects")))
+
+"""
+Split a path into the archive or git revision it is in and the path inside it
+
+:param path: a path on the file system, in an archive or in a git revision
+:returns: a tuple `(container, entry)` of the SourceArchive or GitRevision and the path inside it, or `(None, path)` for a
+          path on the file system
+"""
+def split_source_path(path):
+  container_path, separator, entry = path.partition(ARCHIVE_SEPARATOR)
+  if separator == "":
+    return None, path
+  if container_path.endswith(ARCHIVE_EXTENSIONS):
+    return get_archive(container_path), entry.strip("/")
+  # A path on the file system can contain REVISION_SEPARATOR and ARCHIVE_SEPARATOR as well
+  repository_path, separator, revision = container_path.rpartition(REVISION_SEPARATOR)
+  if separator != "" and revision != "" and ((repository_path, revision) in revisions or (not os.path.exists(path) and is_git_repository(repository_path))):
+    return get_revision(repository_path, revision), entry.strip("/")
+  return None, path
+
+"""
+Turn the path to a project given by the user into the path of its root package
+
+:param path: the path to a directory, to a source archive or to a git repository followed by REVISION_SEPARATOR and a revision
+:returns: the path itself for a directory, or the path to the root of the archive or revision
+"""
+def get_source_root(path):
+  if path.endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path):
+    return path + ARCHIVE_SEPARATOR
+  repository_path, separator, revision = path.rpartition(REVISION_SEPARATOR)
+  if separator != "" and revision != "" and ARCHIVE_SEPARATOR not in path and not os.path.exists(path) and is_git_repository(repository_path):
+    return path + ARCHIVE_SEPARATOR
+  return path
+
+"""
+List the contents of a directory
+
+:param path: the path to the directory (on the file system, in an archive or in a git revision)
+:returns: a tuple `(subdirectories, files)` of the names of its subdirectories and files
+"""
+def list_directory(path):
+  container, entry = split_source_path(path)
+  if container is not None:
+    return container.list_directory(entry)
+  _, subdirectories, files = next(os.walk(path))
+  return subdirectories, files
+
+"""
+Walk a directory tree top-down, like `os.walk`
+
+:param path: the path to the root of the tree (on the file system, in an archive or in a git revision)
+:returns: a generator of `(directory_path, subdirectories, files)` tuples
+"""
+def walk(path):
+  container, _ = split_source_path(path)
+  if container is None:
+    yield from os.walk(path)
+    return
+  pending = [path]
+  while len(pending) > 0:
+    directory_path = pending.pop()
+    subdirectories, files = list_directory(directory_path)
+    yield directory_path, subdirectories, files
+    pending.extend(directory_path + "/" + subdirectory for subdirectory in reversed(subdirectories))
+
+"""
+Read a source file
+
+:param path: the path to the file (on the file system, in an archive or in a git revision)
+:returns: the contents of the file
+"""
+def read_source(path):
+  container, entry = split_source_path(path)
+  if container is not None:
+    return container.read_text(entry)
+  with open(path) as source_file:
+    return source_file.read()
+
+"""
+Read a binary file, such as a compiled .class file
+
+:param path: the path to the file (on the file system, in an archive or in a git revision)
+:returns: the contents of the file as bytes
+"""
+def read_binary(path):
+  container, entry = split_source_path(path)
+  if container is not None:
+    return container.read_bytes(entry)
+  with open(path, "rb") as binary_file:
+    return binary_file.read()
+
+"""
+Determine the blob id of a file in a git revision, which identifies the contents of the file without reading it
+
+:param path: the path to the file (on the file system, in an archive or in a git revision)
+:returns: the blob id, or None for a file that is not in a git revision
+"""
+def get_blob_id(path):
+  container, entry = split_source_path(path)
+  return container.get_info(entry)[0] if isinstance(container, GitRevision) else None
+
+"""
+Determine what identifies the current contents of a source file without reading it
+
+:param path: the path to the file (on the file system, in an archive or in a git revision)
+:returns: a tuple `(key, size, version)` where key is the absolute path of the file (or "git:" and the blob id of a file in
+          a git revision) and version is the modification time of a file, the CRC-32 of an archive entry or 0 for a blob,
+          whose id already identifies its contents
+"""
+def get_source_status(path):
+  container, entry = split_source_path(path)
+  if container is not None:
+    return container.get_status(entry)
+  status = os.stat(path)
+  return os.path.abspath(path), status.st_size, status.st_mtime_ns
@@ -0,0 +1,203 @@
+"""
+A node of a leftist heap of edges, ordered by key and then by edge index
+
+The keys of all nodes in the subtree of a node are to be increased by `delta`, which is pushed down to the children
+when the node is accessed, so that the keys of an entire heap can be shifted in O(1).
+"""
+class HeapNode:
+  __slots__ = ("key", "edge", "delta", "left", "right", "rank")
+
+  def __init__(self, key, edge):
+    self.key = key
+    self.edge = edge
+    self.delta = 0.0
+    self.left = None
+    self.right = None
+    self.rank = 1
+
+  """
+  Apply the pending shift of the keys to this node and pass it on to its children
+  """
+  def push_down(self):
+    if self.delta != 0.0:
+      self.key += self.delta
+      if self.left is not None:
+        self.left.delta += self.delta
+      if self.right is not None:
+        self.right.delta += self.delta
+      self.delta = 0.0
+
+"""
+Merge two leftist heaps
+
+The right spine of a leftist heap has O(log n) nodes, so merging takes O(log n) time and recursion depth.
+
+:param a: the root of the first heap (or None if it is empty)
+:param b: the root of the second heap (or None if it is empty)
+:returns: the root of the merged heap
+"""
+def merge_heaps(a, b):
+  if a is None:
+    return b
+  if b is None:
+    return a
+  a.push_down()
+  b.push_down()
+  if (b.key, b.edge) < (a.key, a.edge):
+    a, b = b, a
+  a.right = merge_heaps(a.right, b)
+  if a.left is None or a.left.rank < a.right.rank:
+    a.left, a.right = a.right, a.left
+  a.rank = (a.right.rank if a.right is not None else 0) + 1
+  return a
+
+"""
+Union-find without path compression, whose joins can be undone in reverse order
+"""
+class RollbackUnionFind:
+  def __init__(self, n):
+    # The parent of each element, or minus the size of its set if it is the representative of the set
+    self.parent = [-1] * n
+    self.history = []
+
+  def find(self, x):
+    while self.parent[x] >= 0:
+      x = self.parent[x]
+    return x
+
+  """
+  :returns: a point in time to which `rollback` can return
+  """
+  def time(self):
+    return len(self.history)
+
+  """
+  Undo all joins since a point in time
+
+  :param time: the point in time as returned by `time`
+  """
+  def rollback(self, time):
+    while len(self.history) > time:
+      x, parent = self.history.pop()
+      self.parent[x] = parent
+
+  """
+  Join the sets of two elements
+
+  :returns: whether the elements were in different sets
+  """
+  def join(self, a, b):
+    a = self.find(a)
+    b = self.find(b)
+    if a == b:
+      return False
+    if self.parent[a] > self.parent[b]:
+      a, b = b, a
+    self.history.append((a, self.parent[a]))
+    self.history.append((b, self.parent[b]))
+    self.parent[a] += self.parent[b]
+    self.parent[b] = a
+    return True
+
+"""
+Find a maximum weight branching of a directed graph with the Chu-Liu/Edmonds algorithm in O(E log V)
+
+A branching assigns every vertex at most one incoming edge without forming a cycle. A vertex without an incoming edge
+counts `root_weight` towards the total weight, as if it had an edge from a virtual root, so an edge is only worth taking
+if it weighs more than that (ties are decided in favor of the edge, and otherwise of the edge with the lower index).
+
+Every vertex first takes its heaviest incoming edge. Where these edges form a cycle, the cycle is contracted into a single
+vertex, and the weights of the edges into it are reduced by the weight of the cycle edge they would replace. The incoming
+edges of a vertex are kept in a leftist heap whose weights can be shifted at once, so contracting a cycle only merges the
+heaps of its vertices. In the end, the contracted cycles are expanded again: each cycle keeps all of its edges except the
+one into the vertex that the edge into the cycle enters.
+
+Example:
+  find_maximum_branching(3, [0, 1, 2], [1, 2, 1], [0.9, 0.8, 0.7], 0.5)
+
+  Vertices 1 and 2 choose each other (0.8 and 0.7) and are contracted; the edge from 0 into the cycle (0.9, replacing 0.7)
+  is worth more than no edge (0.5, also replacing 0.7), so the branching is 0 → 1 → 2
+
+:param number_of_vertices: the number of vertices
+:param sources: the source vertex of each edge
+:param targets: the target vertex of each edge
+:param weights: the weight of each edge
+:param root_weight: the weight of leaving a vertex without incoming edge
+:returns: a tuple `(incoming_edges, components, component_edges)` where incoming_edges[v] is the index of the edge into v
+          in the maximum branching (-1 if none), components[v] is the representative of the set of vertices that v was
+          contracted into (v itself if it was never part of a cycle) and component_edges[c] is the index of the edge that
+          enters the contracted set of representative c (-1 if none)
+"""
+def find_maximum_branching(number_of_vertices, sources, targets, weights, root_weight):
+  sources = [int(source) for source in sources]
+  targets = [int(target) for target in targets]
+  number_of_edges = len(sources)
+  # The virtual root is vertex n; its edge into vertex v has index number_of_edges + v. Weights are negated to find a minimum.
+  virtual_root = number_of_vertices
+  heaps = [None] * (number_of_vertices + 1)
+  for edge in range(number_of_edges):
+    heaps[targets[edge]] = merge_heaps(heaps[targets[edge]], HeapNode(-float(weights[edge]), edge))
+  for vertex in range(number_of_vertices):
+    heaps[vertex] = merge_heaps(heaps[vertex], HeapNode(-float(root_weight), number_of_edges + vertex))
+
+  def get_source(edge):
+    return sources[edge] if edge < number_of_edges else virtual_root
+
+  def get_target(edge):
+    return targets[edge] if edge < number_of_edges else edge - number_of_edges
+
+  union_find = RollbackUnionFind(number_of_vertices + 1)
+  seen = [-1] * (number_of_vertices + 1)
+  seen[virtual_root] = virtual_root
+  incoming = [-1] * (number_of_vertices + 1)
+  # The contracted cycles, most recent first, as (representative, time of contraction, edges of the cycle)
+  cycles = []
+  for start in range(number_of_vertices):
+    vertex = start
+    path = []
+    chosen = []
+    # Follow the heaviest incoming edges until a vertex of an earlier path (or the virtual root) is reached
+    while seen[vertex] < 0:
+      top = heaps[vertex]
+      top.push_down()
+      # The other incoming edges now weigh what they would add to the branching if they replaced this one
+      top.delta -= top.key
+      top.push_down()
+      chosen.append(top.edge)
+      path.append(vertex)
+      seen[vertex] = start
+      heaps[vertex] = merge_heaps(top.left, top.right)
+      vertex = union_find.find(get_source(top.edge))
+      if seen[vertex] == start:
+        # The path closed a cycle: contract it into a single vertex whose incoming edges are those of its vertices
+        cycle_heap = None
+        end = len(chosen)
+        time = union_find.time()
+        while True:
+          member = path.pop()
+          cycle_heap = merge_heaps(cycle_heap, heaps[member])
+          if not union_find.join(vertex, member):
+            break
+        cycle_edges = chosen[len(path):end]
+        del chosen[len(path):]
+        vertex = union_find.find(vertex)
+        heaps[vertex] = cycle_heap
+        seen[vertex] = -1
+        cycles.insert(0, (vertex, time, cycle_edges))
+    for edge in chosen:
+      incoming[union_find.find(get_target(edge))] = edge
+
+  components = [union_find.find(vertex) for vertex in range(number_of_vertices)]
+  component_edges = {component: incoming[component] for component in set(components)}
+
+  # Expand the cycles: the edge into a cycle replaces the cycle edge into the vertex it enters
+  for vertex, time, cycle_edges in cycles:
+    union_find.rollback(time)
+    entering_edge = incoming[vertex]
+    for edge in cycle_edges:
+      incoming[union_find.find(get_target(edge))] = edge
+    incoming[union_find.find(get_target(entering_edge))] = entering_edge
+
+  incoming_edges = [edge if edge < number_of_edges else -1 for edge in incoming[:number_of_vertices]]
+  component_edges = {component: edge if edge < number_of_edges else -1 for component, edge in component_edges.items()}
+  return incoming_edges, components, component_edges
@@ -0,0 +1,308 @@
+import re
+import signal
+import threading
+from enum import Enum
+from contextlib import contextmanager
+
+# Maximum number of seconds javalang may spend parsing a single file before the fallback extractor is used instead
+PARSE_TIME_BUDGET = 10
+
+# Files with more characters than this are not parsed by javalang at all, but handed to the fallback extractor directly
+MAX_SOURCE_SIZE = 1000000
+
+class ParseFailure(Enum):
+  SYNTAX_ERROR = 0
+  TIMEOUT = 1
+  TOO_LARGE = 2
+  INVALID_CLASS_FILE = 3
+
+"""
+A file that could not be parsed by javalang
+
+:param failure: why javalang did not produce identifiers for the file
+:param detail: a description of the error
+:param fallback_succeeded: whether the fallback extractor produced the identifiers instead
+"""
+class ParseProblem:
+  def __init__(self, failure, detail, fallback_succeeded):
+    self.failure = failure
+    self.detail = detail
+    self.fallback_succeeded = fallback_succeeded
+
+"""
+Record of all files that could not be parsed during a run
+
+Instead of aborting the run, files that javalang fails on are recorded here so they can be reviewed afterwards. Each file
+is recorded once, even if it is parsed multiple times during the run.
+"""
+class ParseReport:
+  def __init__(self):
+    self.problems = {}
+
+  """
+  Record that a file could not be parsed
+
+  :param class_path: the file path to the class
+  :param problem: the ParseProblem that occurred, or None if the file was parsed without problems
+  """
+  def record(self, class_path, problem):
+    if problem is not None:
+      self.problems[class_path] = problem
+
+  """
+  Print a summary of the problems, and each problem individually if `verbose` is set
+
+  :param verbose: whether to print every problem instead of only the counts
+  """
+  def print_summary(self, verbose=False):
+    if len(self.problems) == 0:
+      return
+    print("Files that could not be parsed:", len(self.problems))
+    for failure in ParseFailure:
+      print("  " + failure.name.lower() + ":", len([problem for problem in self.problems.values() if problem.failure == failure]))
+    print("  of which the fallback extractor failed too:", len([problem for problem in self.problems.values() if not problem.fallback_succeeded]))
+    if verbose:
+      for class_path, problem in self.problems.items():
+        print("  " + class_path + " (" + problem.failure.name.lower() + "): " + problem.detail)
+
+  """
+  Write all problems to a tab-separated file
+
+  :param report_path: the path of the file to write
+  """
+  def write(self, report_path):
+    with open(report_path, "w") as report_file:
+      for class_path, problem in self.problems.items():
+        report_file.write("\t".join([class_path, problem.failure.name.lower(), "fallback" if problem.fallback_succeeded else "skipped", problem.detail.replace("\t", " ").replace("\n", " ")]) + "\n")
+
+class ParseTimeout(Exception):
+  pass
+
+"""
+Raise ParseTimeout in the current thread if the body takes longer than the given number of seconds
+
+The budget can only be enforced in the main thread of a process (e.g. the main program or a worker of a process pool),
+because it relies on SIGALRM. In other threads the body runs without a time limit.
+
+:param seconds: the time budget
+"""
+@contextmanager
+def time_budget(seconds):
+  if seconds is None or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+    yield
+    return
+
+  def on_timeout(signum, frame):
+    raise ParseTimeout("parsing took longer than " + str(seconds) + " seconds")
+
+  previous_handler = signal.signal(signal.SIGALRM, on_timeout)
+  signal.setitimer(signal.ITIMER_REAL, seconds)
+  try:
+    yield
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, previous_handler)
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<skip>\s+|//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<literal>""".*?(?:"""|\Z)|"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?|\.?\d[\w.]*)
+  | (?P<identifier>[^\W\d]\w*)
+  | (?P<separator>.)
+''', re.DOTALL | re.VERBOSE)
+
+TYPE_KEYWORDS = {"class", "interface", "enum", "record"}
+
+MODIFIERS = {"public", "protected", "private", "static", "abstract", "final", "native", "synchronized", "transient", "volatile", "strictfp", "default", "sealed", "non"}
+
+OPENING = {"(": ")", "{": "}", "[": "]"}
+
+"""
+Split source code into identifier and separator tokens, dropping whitespace, comments and literals
+
+This never fails, also not on syntax that javalang does not support (e.g. records, sealed classes, text blocks).
+
+:param src_text: the source code
+:returns: a list of tokens
+"""
+def tokenize(src_text):
+  tokens = []
+  for match in TOKEN_PATTERN.finditer(src_text):
+    kind = match.lastgroup
+    if kind == "identifier" or kind == "separator":
+      tokens.append(match.group())
+    elif kind == "literal":
+      tokens.append("0")
+  return tokens
+
+"""
+Find the index just past the bracket that closes the bracket at `start`
+
+:param tokens: the tokens
+:param start: the index of an opening bracket
+:returns: the index of the token after the matching closing bracket (or the number of tokens if it is not closed)
+"""
+def skip_brackets(tokens, start):
+  stack = []
+  i = start
+  while i < len(tokens):
+    token = tokens[i]
+    if token in OPENING:
+      stack.append(OPENING[token])
+    elif len(stack) > 0 and token == stack[-1]:
+      stack.pop()
+      if len(stack) == 0:
+        return i + 1
+    i += 1
+  return i
+
+"""
+Find the index just past an annotation (e.g. `@Override` or `@SuppressWarnings("unchecked")`)
+
+:param tokens: the tokens
+:param start: the index of the `@`
+:returns: the index of the token after the annotation
+"""
+def skip_annotation(tokens, start):
+  i = start + 2
+  while i + 1 < len(tokens) and tokens[i] == "." and is_identifier(tokens[i + 1]):
+    i += 2
+  if i < len(tokens) and tokens[i] == "(":
+    i = skip_brackets(tokens, i)
+  return i
+
+"""
+Find the raw field and method identifiers of the first type declared in source code without building a syntax tree
+
+Mirrors what `get_class_identifiers_from_source` collects: the names of the fields and methods (but not constructors) that
+are declared directly in the body of the first top-level type (none for an enum).
+
+:param src_text: the source code of the class
+:returns: a tuple `(field_identifiers, method_identifiers)` of lists of identifiers as they appear in the source (e.g. fieldIdentifier)
+"""
+def extract_raw_identifiers(src_text):
+  tokens = tokenize(src_text)
+
+  # Find the first top-level type declaration and the start of its body
+  i = 0
+  type_keyword = None
+  while i < len(tokens) and type_keyword is None:
+    if tokens[i] == "@" and i + 1 < len(tokens) and tokens[i + 1] != "interface":
+      i = skip_annotation(tokens, i)
+    elif tokens[i] == "package" or tokens[i] == "import":
+      while i < len(tokens) and tokens[i] != ";":
+        i += 1
+    elif tokens[i] in TYPE_KEYWORDS:
+      type_keyword = tokens[i]
+      i += 1
+    else:
+      i += 1
+  if type_keyword is None or i >= len(tokens):
+    return ([], [])
+  type_name = tokens[i]
+  while i < len(tokens) and tokens[i] != "{":
+    i = skip_brackets(tokens, i) if tokens[i] == "(" else i + 1
+  i += 1
+
+  field_identifiers = []
+  method_identifiers = []
+
+  # javalang does not expose the members of an enum as the body of the type, so neither does the fallback
+  if type_keyword == "enum":
+    return ([], [])
+
+  # Go through the member declarations one at a time
+  statement = []
+  while i < len(tokens) and tokens[i] != "}":
+    token = tokens[i]
+    if token == "@" and i + 1 < len(tokens) and tokens[i + 1] != "interface":
+      i = skip_annotation(tokens, i)
+    elif token == "(":
+      # Method or constructor: the name precedes the parameter list
+      name = statement[-1] if len(statement) > 0 else None
+      preceding = statement[-2] if len(statement) > 1 else None
+      is_constructor = name == type_name and (preceding is None or preceding in MODIFIERS or preceding == ">")
+      if name is not None and not is_constructor and is_identifier(name):
+        method_identifiers.append(name)
+      i = skip_brackets(tokens, i)
+      while i < len(tokens) and tokens[i] != ";" and tokens[i] != "{" and tokens[i] != "}":
+        i += 1
+      if i < len(tokens) and tokens[i] == "{":
+        i = skip_brackets(tokens, i)
+      elif i < len(tokens) and tokens[i] == ";":
+        i += 1
+      statement = []
+    elif token == "{":
+      # Nested type, initializer block or compact constructor
+      i = skip_brackets(tokens, i)
+      statement = []
+    elif token == "=" or token == ";" or token == ",":
+      # Field declaration
+      end = i
+      while end < len(tokens) and tokens[end] != ";" and tokens[end] != "}":
+        end = skip_brackets(tokens, end) if tokens[end] in OPENING else end + 1
+      field_identifiers.extend(get_declarator_names(statement + tokens[i:end]))
+      i = end + 1 if end < len(tokens) and tokens[end] == ";" else end
+      statement = []
+    else:
+      statement.append(token)
+      i += 1
+
+  return (field_identifiers, method_identifiers)
+
+"""
+Find the names declared by the tokens of a field declaration (e.g. `Map<A, B> a = x < y, b[];` declares `a` and `b`)
+
+:param tokens: the tokens of the declaration without the final semicolon
+:returns: a list of the declared names
+"""
+def get_declarator_names(tokens):
+  names = []
+  angle_depth = 0
+  in_initializer = False
+  i = 0
+  while i < len(tokens):
+    token = tokens[i]
+    if token in OPENING:
+      i = skip_brackets(tokens, i)
+      continue
+    if not in_initializer:
+      if token == "<":
+        angle_depth += 1
+      elif token == ">":
+        angle_depth = max(angle_depth - 1, 0)
+      elif angle_depth == 0 and (token == "=" or token == ","):
+        name = get_name_before(tokens, i)
+        if name is not None:
+          names.append(name)
+        in_initializer = token == "="
+    elif token == "," and i + 2 <= len(tokens) and is_identifier(tokens[i + 1]) and (i + 2 == len(tokens) or tokens[i + 2] in ("=", ",", "[")):
+      # Only a comma followed by `name =`, `name,` or `name[` starts a new declarator (other commas are part of the initializer)
+      in_initializer = False
+    i += 1
+  if not in_initializer:
+    name = get_name_before(tokens, len(tokens))
+    if name is not None:
+      names.append(name)
+  return names
+
+"""
+Find the name that ends just before the given index, skipping array dimensions (e.g. the `a` in `int a[] = ...`)
+
+:param tokens: the tokens
+:param end: the index just past the name
+:returns: the name, or None if there is none
+"""
+def get_name_before(tokens, end):
+  i = end - 1
+  while i > 0 and tokens[i] == "]" and tokens[i - 1] == "[":
+    i -= 2
+  return tokens[i] if i >= 0 and is_identifier(tokens[i]) else None
+
+"""
+Check whether a token is an identifier
+
+:param token: the token
+:returns: whether the token is an identifier
+"""
+def is_identifier(token):
+  return token[0].isalpha() or token[0] in "_$"
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import numpy as np
+from common import get_class_identifiers, get_class_name_words, get_identifier_words, is_class_file
+from identifiercache import IdentifierCache
+from tolerantparsing import ParseReport
+from sourceprovider import walk, get_source_root
+
+# Path to the FastText model, relative to this file
+FASTTEXT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "wiki-news-300d-1M-subword.bin")
+# FASTTEXT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "crawl-300d-2M-subword.bin")
+
+# Path to an SQLite database in which the parsed identifiers of classes are shared between runs (None to always parse)
+IDENTIFIER_CACHE_PATH = None
+
+"""
+Load the FastText model
+
+:param model_path: the path to the .bin file of the model
+:returns: the FastText model
+"""
+def load_fasttext_model(model_path=FASTTEXT_MODEL_PATH):
+  import fasttext # imported on first use, because only runs without vocabulary vectors need it
+  return fasttext.load_model(model_path)
+
+"""
+Load the model to use for retrieving word embeddings
+
+:param vocabulary_vectors_path: the path to vocabulary vectors written by `write_vocabulary_vectors` (None to load the FastText model)
+:returns: VocabularyVectors that fall back to the FastText model for unknown words, or the FastText model itself
+"""
+def load_model(vocabulary_vectors_path=None):
+  if vocabulary_vectors_path is not None:
+    return VocabularyVectors(vocabulary_vectors_path, fallback=load_fasttext_model)
+  return load_fasttext_model()
+
+"""
+Determine the id of a model, under which the embeddings it produces are cached
+
+:param model: the FastText model or VocabularyVectors
+:returns: the id of the FastText model file (that the vocabulary vectors were taken from), see `get_model_file_id`
+"""
+def get_model_id(model):
+  return model.model_name if isinstance(model, VocabularyVectors) else get_model_file_id(FASTTEXT_MODEL_PATH)
+
+"""
+Determine the id of a FastText model file without loading the model
+
+Model files can have the same name (e.g. the same model trained on two corpora, in different directories), so the id
+consists of the name of the file and a digest of its contents.
+
+:param model_path: the path to the FastText model
+:returns: the name of the file and the first 16 hexadecimal digits of the SHA-256 digest of its contents
+"""
+def get_model_file_id(model_path):
+  digest = hashlib.sha256()
+  with open(model_path, "rb") as model_file:
+    for block in iter(lambda: model_file.read(1024 * 1024), b""):
+      digest.update(block)
+  return os.path.basename(model_path) + "-" + digest.hexdigest()[:16]
+
+"""
+Find all words whose embeddings are looked up when the classes in a directory tree are embedded
+
+These are the words of the class names and of the field and method identifiers, split and lowercased exactly as
+`get_class_embedding` does.
+
+:param root_path: the path to the directory tree
+:param identifier_cache: an optional IdentifierCache in which parsed identifiers are looked up and stored
+:param parse_report: an optional ParseReport in which files that could not be parsed are recorded
+:returns: a sorted list of the distinct words
+"""
+def get_project_vocabulary(root_path, identifier_cache=None, parse_report=None):
+  vocabulary = set()
+  for directory_path, _, files in walk(root_path):
+    for file in files:
+      if is_class_file(file):
+        class_path = directory_path + "/" + file
+        field_identifiers, method_identifiers = get_class_identifiers(class_path, identifier_cache, parse_report)
+        vocabulary.update(get_class_name_words(class_path))
+        vocabulary.update(get_identifier_words(field_identifiers, method_identifiers))
+  return sorted(vocabulary)
+
+"""
+Write the embeddings of a vocabulary to a sidecar file that can be loaded as VocabularyVectors
+
+:param vocabulary: the words to write the embeddings of
+:param model: the FastText model to take the embeddings from
+:param vectors_path: the path to write to (a NumPy .npz archive)
+:param model_name: the id of the model the embeddings are taken from (see `get_model_file_id`), under which the embeddings
+                   of runs with the vocabulary vectors are cached
+"""
+def write_vocabulary_vectors(vocabulary, model, vectors_path, model_name=""):
+  vectors = np.array([model.get_word_vector(word) for word in vocabulary], dtype=np.float32).reshape(len(vocabulary), -1)
+  with open(vectors_path, "wb") as vectors_file:
+    np.savez(vectors_file, words=np.array(vocabulary, dtype=str), vectors=vectors, model=np.array(model_name))
+
+"""
+Word embeddings of a project's vocabulary, usable in place of the FastText model
+
+The sidecar file only holds the embeddings of the words that occur in the project, so it loads in a fraction of the time
+it takes to load the FastText model. Words that are not in the file (e.g. because classes were added after it was
+written) are looked up in the model returned by `fallback`, which is only loaded when the first such word is encountered.
+
+Example:
+  model = VocabularyVectors("project.vectors.npz")
+  model.get_word_vector("order")
+
+:param vectors_path: the path to a file written by `write_vocabulary_vectors`
+:param fallback: a function returning the model to look up words that are not in the file (None to raise a KeyError instead)
+"""
+class VocabularyVectors:
+  def __init__(self, vectors_path, fallback=None):
+    with np.load(vectors_path) as vectors_file:
+      self.vectors = vectors_file["vectors"]
+      self.model_name = str(vectors_file["model"])
+      self.word_indices = {word: i for i, word in enumerate(vectors_file["words"].tolist())}
+    self.fallback = fallback
+    self.fallback_model = None
+
+  def __len__(self):
+    return len(self.word_indices)
+
+  def get_word_vector(self, word):
+    index = self.word_indices.get(word)
+    if index is not None:
+      return self.vectors[index]
+    if self.fallback is None:
+      raise KeyError("'" + word + "' is not in the vocabulary vectors, prepare them again with vocabularyvectors.py")
+    if self.fallback_model is None:
+      self.fallback_model = self.fallback()
+    return self.fallback_model.get_word_vector(word)
+
+if __name__ == "__main__":
+  # Prompt user to enter path without final slash (or the path to a jar or zip source archive)
+  path = get_source_root(input("Enter the path to the Java project of which the vocabulary vectors need to be prepared: "))
+  vectors_path = input("Enter the path to write the vocabulary vectors to (e.g. project.vectors.npz): ")
+
+  identifier_cache = IdentifierCache(IDENTIFIER_CACHE_PATH) if IDENTIFIER_CACHE_PATH is not None else None
+  parse_report = ParseReport()
+  vocabulary = get_project_vocabulary(path, identifier_cache, parse_report)
+  if identifier_cache is not None:
+    identifier_cache.close()
+  parse_report.print_summary()
+
+  write_vocabulary_vectors(vocabulary, load_fasttext_model(), vectors_path, get_model_file_id(FASTTEXT_MODEL_PATH))
+  print("Number of words:     ", len(vocabulary))
+  print("Size on disk (bytes):", os.path.getsize(vectors_path))
@@ -0,0 +1,187 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Number of seconds after which a claimed job whose lease was not renewed is given to another worker (whose node is assumed to be gone)
+JOB_LEASE = 5 * 60
+
+# Number of times per JOB_LEASE that a worker renews the lease of the job it runs, so that a few missed renewals (e.g. while
+# the database is locked) do not let the lease expire
+HEARTBEATS_PER_LEASE = 5
+
+"""
+Queue of jobs shared by a coordinator and workers on any number of nodes
+
+The queue is an SQLite database. Unlike the caches, it does not use WAL mode, because WAL needs shared memory and therefore
+only works for processes on the same machine; with the rollback journal, the database can be put on storage shared by all
+nodes (that supports file locks, e.g. NFS with locking enabled). Claiming a job takes the write lock of the database, so
+every job is claimed by one worker at a time.
+
+Jobs belong to a task and have a kind and a part number, which together identify them: submitting a job that was submitted
+before has no effect, so a coordinator that is started again finds the jobs it already submitted, including their results.
+A worker publishes the result of a job when it completes it. While it runs a job, it keeps renewing the lease of the job
+(see `heartbeat`); a job whose lease was not renewed for JOB_LEASE seconds is given to another worker. Only the worker
+that holds the lease of a job can complete it or fail it.
+
+Example:
+  with WorkQueue("queue.sqlite") as queue:
+    queue.submit(task, "embed", [{"packages": packages}])
+    job_id, task, kind, payload = queue.claim("node1:1234")
+    with queue.heartbeat(job_id, "node1:1234"):
+      result = run_job(kind, payload)
+    queue.complete(job_id, "node1:1234", result)
+
+:param database_path: the path to the SQLite database file (created if it does not exist)
+:param lease: the number of seconds after which a claimed job whose lease was not renewed can be claimed again
+:param timeout: the number of seconds to wait for another process that is writing to the database
+"""
+class WorkQueue:
+  def __init__(self, database_path, lease=JOB_LEASE, timeout=60):
+    self.database_path = database_path
+    self.lease = lease
+    self.timeout = timeout
+    self.connection = sqlite3.connect(database_path, timeout=timeout, isolation_level=None)
+    self.connection.execute("PRAGMA journal_mode=DELETE")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, task TEXT NOT NULL, kind TEXT NOT NULL, part INTEGER NOT NULL, payload TEXT NOT NULL, state TEXT NOT NULL, worker TEXT, claimed REAL, result BLOB, error TEXT, UNIQUE (task, kind, part))")
+    self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    self.connection.close()
+
+  """
+  Submit the jobs of a task that were not submitted before
+
+  :param task: the id of the task
+  :param kind: the kind of the jobs
+  :param payloads: the payloads of the jobs (JSON-serializable), whose indices are the part numbers of the jobs
+  """
+  def submit(self, task, kind, payloads):
+    with self.transaction():
+      self.connection.executemany("INSERT OR IGNORE INTO jobs (task, kind, part, payload, state) VALUES (?, ?, ?, ?, 'pending')", [(task, kind, part, json.dumps(payload)) for part, payload in enumerate(payloads)])
+
+  """
+  Claim the job that was submitted first among the pending jobs and the jobs whose lease expired
+
+  :param worker: the id of the worker (e.g. host name and process id)
+  :returns: a tuple `(job_id, task, kind, payload)` or None if there is no job to claim
+  """
+  def claim(self, worker):
+    now = time.time()
+    with self.transaction():
+      row = self.connection.execute("SELECT id, task, kind, payload FROM jobs WHERE state = 'pending' OR (state = 'claimed' AND claimed < ?) ORDER BY id LIMIT 1", (now - self.lease,)).fetchone()
+      if row is None:
+        return None
+      self.connection.execute("UPDATE jobs SET state = 'claimed', worker = ?, claimed = ? WHERE id = ?", (worker, now, row[0]))
+    job_id, task, kind, payload = row
+    return job_id, task, kind, json.loads(payload)
+
+  """
+  Renew the lease of a claimed job
+
+  :param job_id: the id of the job as returned by `claim`
+  :param worker: the id of the worker that claimed the job
+  :returns: whether the worker still holds the lease (False if the lease expired and another worker claimed the job)
+  """
+  def renew(self, job_id, worker):
+    with self.transaction():
+      return self.connection.execute("UPDATE jobs SET claimed = ? WHERE id = ? AND state = 'claimed' AND worker = ?", (time.time(), job_id, worker)).rowcount == 1
+
+  """
+  Keep renewing the lease of a claimed job from a background thread (with a connection of its own) while the body runs, so
+  that a job that takes longer than the lease is not given to another worker while this one is still running it
+
+  :param job_id: the id of the job as returned by `claim`
+  :param worker: the id of the worker that claimed the job
+  """
+  @contextmanager
+  def heartbeat(self, job_id, worker):
+    stopped = threading.Event()
+    def renew_until_stopped():
+      with WorkQueue(self.database_path, self.lease, self.timeout) as queue:
+        while not stopped.wait(self.lease / HEARTBEATS_PER_LEASE):
+          try:
+            if not queue.renew(job_id, worker):
+              return
+          except sqlite3.OperationalError:
+            # The database is locked for longer than the timeout: try again with the next heartbeat
+            pass
+    heartbeat_thread = threading.Thread(target=renew_until_stopped, daemon=True)
+    heartbeat_thread.start()
+    try:
+      yield
+    finally:
+      stopped.set()
+      heartbeat_thread.join()
+
+  """
+  Publish the result of a job (unless its lease expired and another worker claimed it)
+
+  :param job_id: the id of the job as returned by `claim`
+  :param worker: the id of the worker that claimed the job
+  :param result: the result of the job as bytes
+  """
+  def complete(self, job_id, worker, result):
+    with self.transaction():
+      self.connection.execute("UPDATE jobs SET state = 'done', result = ? WHERE id = ? AND state = 'claimed' AND worker = ?", (result, job_id, worker))
+
+  """
+  Record that a job failed, so that it is not claimed again until `retry_failed` is called (unless its lease expired and
+  another worker claimed it)
+
+  :param job_id: the id of the job as returned by `claim`
+  :param worker: the id of the worker that claimed the job
+  :param error: a description of the error
+  """
+  def fail(self, job_id, worker, error):
+    with self.transaction():
+      self.connection.execute("UPDATE jobs SET state = 'failed', error = ? WHERE id = ? AND state = 'claimed' AND worker = ?", (error, job_id, worker))
+
+  """
+  Make the failed jobs pending again
+  """
+  def retry_failed(self):
+    with self.transaction():
+      self.connection.execute("UPDATE jobs SET state = 'pending', error = NULL WHERE state = 'failed'")
+
+  """
+  Look up the states of the jobs of a task
+
+  :param task: the id of the task
+  :param kind: the kind of the jobs
+  :returns: a list of `(state, error)` tuples in the order of the part numbers of the jobs (empty if none were submitted),
+            where state is "pending", "claimed", "done" or "failed"
+  """
+  def get_states(self, task, kind):
+    return self.connection.execute("SELECT state, error FROM jobs WHERE task = ? AND kind = ? ORDER BY part", (task, kind)).fetchall()
+
+  """
+  Look up the results of the jobs of a task
+
+  :param task: the id of the task
+  :param kind: the kind of the jobs
+  :returns: a list of the results in the order of the part numbers of the jobs (None for the jobs that were not completed)
+  """
+  def get_results(self, task, kind):
+    return [row[0] for row in self.connection.execute("SELECT result FROM jobs WHERE task = ? AND kind = ? ORDER BY part", (task, kind))]
+
+  """
+  Run the body in a transaction that takes the write lock of the database right away, so that reading and updating a job
+  cannot interleave with another process doing the same
+  """
+  @contextmanager
+  def transaction(self):
+    self.connection.execute("BEGIN IMMEDIATE")
+    try:
+      yield
+    except BaseException:
+      self.connection.execute("ROLLBACK")
+      raise
+    self.connection.execute("COMMIT")